@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Under an ASGI server, chat and retrieval use the async views (see ASYNC_VIEWS)
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
+
+# Pick up queued document ingestion jobs (uploads, retries after a restart)
+from documents.ingestion import wake_workers  # noqa: E402
+
+wake_workers()
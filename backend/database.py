@@ -0,0 +1,95 @@
+# backend/database.py
+import os
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import dj_database_url
+except ImportError:  # only needed with DATABASE_URL
+    dj_database_url = None
+
+# -----------------------
+# DATABASE PROFILES
+# -----------------------
+# DB_PROFILE picks how Django talks to the database:
+#   sqlite          WAL journal: readers don't block the writer and the writer
+#                   doesn't block readers. Writers queue for SQLITE_BUSY_TIMEOUT_MS
+#                   instead of failing with "database is locked", and atomic
+#                   blocks take the write lock up front (core/db/sqlite3).
+#   sqlite-default  Django's stock SQLite settings, for comparison.
+#   postgres        DATABASE_URL, with persistent connections that are
+#                   health-checked before reuse.
+# Without DB_PROFILE, postgres is used when DATABASE_URL is set, sqlite otherwise.
+PROFILES = ("sqlite", "sqlite-default", "postgres")
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+def sqlite_pragmas():
+    return {
+        "journal_mode": "WAL",
+        "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        # NORMAL only syncs at checkpoints in WAL mode; a power cut can lose the last commits, not corrupt
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "mmap_size": _env_int("SQLITE_MMAP_BYTES", 256 * 1024 * 1024),
+        "cache_size": -_env_int("SQLITE_CACHE_KB", 20000),
+        "temp_store": "MEMORY",
+    }
+
+
+def profile_config(profile, sqlite_path, database_url=None):
+    """The DATABASES entry for `profile`."""
+    if profile == "sqlite-default":
+        return {"ENGINE": "django.db.backends.sqlite3", "NAME": sqlite_path}
+
+    if profile == "sqlite":
+        return {
+            "ENGINE": "core.db.sqlite3",
+            "NAME": sqlite_path,
+            "CONN_MAX_AGE": _env_int("DB_CONN_MAX_AGE", 60),
+            "OPTIONS": {
+                "init_command": ";".join(f"PRAGMA {k}={v}" for k, v in sqlite_pragmas().items()),
+                "transaction_mode": os.getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
+            },
+        }
+
+    if profile == "postgres":
+        if not database_url:
+            raise ImproperlyConfigured("DB_PROFILE=postgres needs DATABASE_URL")
+        if dj_database_url is None:
+            raise ImproperlyConfigured("DATABASE_URL needs dj-database-url and psycopg2-binary installed")
+        # Behind PgBouncer in transaction mode the pooler keeps the server connections
+        pgbouncer = os.getenv("DB_POOLER", "").lower() == "pgbouncer"
+        config = dj_database_url.parse(
+            database_url,
+            conn_max_age=_env_int("DB_CONN_MAX_AGE", 0 if pgbouncer else 60),
+            conn_health_checks=True,
+            disable_server_side_cursors=pgbouncer,
+        )
+        config.setdefault("OPTIONS", {}).update({
+            "connect_timeout": _env_int("DB_CONNECT_TIMEOUT", 5),
+            # Notice dead connections (e.g. after a failover) instead of hanging on them
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+            "application_name": os.getenv("DB_APPLICATION_NAME", "qhub"),
+        })
+        return config
+
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE {profile!r}; expected one of {', '.join(PROFILES)}")
+
+
+def database_profile():
+    return os.getenv("DB_PROFILE") or ("postgres" if os.getenv("DATABASE_URL") else "sqlite")
+
+
+def sqlite_path(base_dir):
+    return os.getenv("SQLITE_PATH") or str(Path(base_dir) / "db.sqlite3")
+
+
+def databases(base_dir):
+    return {"default": profile_config(database_profile(), sqlite_path(base_dir), os.getenv("DATABASE_URL"))}
@@ -3,6 +3,8 @@ from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
 
+from . import database
+
 # Load environment variables
 load_dotenv()
 
@@ -83,13 +85,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "backend.wsgi.application"
 
-# Database (SQLite – Render supported)
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
-}
+# Database: DB_PROFILE=sqlite (WAL, the default), sqlite-default or postgres (DATABASE_URL);
+# see backend/database.py
+DB_PROFILE = database.database_profile()
+DATABASES = database.databases(BASE_DIR)
 
 # Custom user model
 AUTH_USER_MODEL = os.getenv("AUTH_USER_MODEL", "users.CustomUser")
@@ -131,7 +130,7 @@ CORS_ALLOW_CREDENTIALS = True
 # DRF + JWT
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "core.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
@@ -157,6 +156,28 @@ SESSION_COOKIE_AGE = 60 * 60 * 24 * 7
 SESSION_SAVE_EVERY_REQUEST = False
 SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
+# Shared cache (sessions, core/lookups.py, documents/retrieval_cache.py), seen by every worker process.
+# CACHE_URL=redis://host:6379/0 uses Redis (needs the redis package); otherwise a file cache
+# in CACHE_DIR, which all workers on one host share. CACHE_BACKEND=locmem is per process.
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if CACHE_URL.startswith(("redis://", "rediss://")) else "file")
+CACHE_DIR = os.getenv("CACHE_DIR", str(BASE_DIR / "cache"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+if CACHE_BACKEND == "redis":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_URL}}
+elif CACHE_BACKEND == "locmem":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                          "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES}}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": CACHE_DIR,
+                          "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES}}}
+CACHES["default"].update({"KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", "qhub"), "TIMEOUT": 300})
+
+# Lookup cache (core/lookups.py): users behind JWTs, chat -> document ids and document rows.
+# Saves and deletes invalidate entries; LOOKUP_CACHE_TTL bounds staleness from bulk .update() calls.
+LOOKUP_CACHE_ENABLED = os.getenv("LOOKUP_CACHE_ENABLED", "True").lower() in ("1", "true", "yes")
+LOOKUP_CACHE_TTL = int(os.getenv("LOOKUP_CACHE_TTL", "300"))
+
 # Email
 EMAIL_BACKEND = os.getenv(
     "DJANGO_EMAIL_BACKEND",
@@ -177,6 +198,10 @@ LOGGING = {
         "handlers": ["console"],
         "level": os.getenv("DJANGO_LOG_LEVEL", "INFO"),
     },
+    "loggers": {
+        # One INFO line per Gemini request from the async client otherwise
+        "httpx": {"level": "WARNING"},
+    },
 }
 
 # Render proxy support
@@ -184,5 +209,128 @@ SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
 # Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Another Gemini-compatible host, e.g. a local fake model server (core/gemini.py)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "")
+# Pooled HTTP client used by the async views
+GEMINI_HTTP_TIMEOUT = float(os.getenv("GEMINI_HTTP_TIMEOUT", "60"))
+GEMINI_HTTP_MAX_CONNECTIONS = int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", "100"))
+
+# LLM gateway (core/llm_gateway.py): deadlines, retries, concurrency cap, circuit breaker
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_EMBED_TIMEOUT_SECONDS = float(os.getenv("LLM_EMBED_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "5"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Serve chat and retrieval from the async views (set by backend/asgi.py under uvicorn)
+ASYNC_VIEWS = os.getenv("DJANGO_ASYNC_VIEWS", "False").lower() in ("1", "true", "yes")
+
+# Background document ingestion (documents/ingestion.py)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_AUTOSTART = os.getenv("INGESTION_AUTOSTART", "True").lower() in ("1", "true", "yes")
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+INGESTION_LEASE_SECONDS = int(os.getenv("INGESTION_LEASE_SECONDS", "600"))
+
+# Per-document extraction budget (documents/extraction.py); 0 = unlimited / all cores
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "20000000")) or None
+EXTRACT_TIMEOUT_SECONDS = int(os.getenv("EXTRACT_TIMEOUT_SECONDS", "900")) or None
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or None
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+# Pages buffered between the extraction and chunking stages (documents/pipeline.py)
+PIPELINE_PAGE_QUEUE_SIZE = int(os.getenv("PIPELINE_PAGE_QUEUE_SIZE", "8"))
+
+# Chunking strategy (documents/chunking.py): fixed | sentence | token
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "fixed")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_MAX_OVERLAP_TOKENS = int(os.getenv("CHUNK_MAX_OVERLAP_TOKENS", "40"))
+
+# Embedding engine (documents/embedding_engine.py); 0 disables a limit
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1500"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "0"))
+
+# Embedding backend for new documents (documents/embedding_backends.py): gemini | onnx-minilm
+# Each collection keeps the backend it was indexed with; re-embed with: python manage.py reembed_documents
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
+# onnx-minilm: model directory (model.onnx + tokenizer.json; default: Chroma's download cache),
+# texts per inference batch, and onnxruntime threads (0 = all cores)
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# Store only the first N dimensions of each embedding, re-normalized (0 = full width).
+# Gemini embeddings are Matryoshka-trained, so prefixes stay meaningful; changing it needs reembed_documents
+EMBEDDING_DIMS = int(os.getenv("EMBEDDING_DIMS", "0"))
+
+# Persistent embedding cache keyed by (chunk hash, model, task_type)
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "True").lower() in ("1", "true", "yes")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+# Vector layout (documents/vector_store.py): per_document | shared | sharded (Chroma)
+# | numpy (memory-mapped matrix per document, brute force; documents/numpy_store.py)
+# Switching layouts: python manage.py migrate_vector_layout --to <layout>
+VECTOR_LAYOUT = os.getenv("VECTOR_LAYOUT", "per_document")
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "16"))
+# numpy layout: store directory, and the chunk count above which a document moves to its own Chroma (HNSW) collection
+VECTOR_NUMPY_DIR = os.getenv("VECTOR_NUMPY_DIR", str(BASE_DIR / "vector_index"))
+VECTOR_NUMPY_MAX_CHUNKS = int(os.getenv("VECTOR_NUMPY_MAX_CHUNKS", "10000"))
+# numpy layout: stored precision (float32 | float16 | int8 with a per-vector scale), and how many
+# candidates per result to re-rank against a kept float32 copy (0 = no copy, no re-ranking).
+# Compare settings on your own documents: python manage.py measure_vector_compression
+VECTOR_NUMPY_DTYPE = os.getenv("VECTOR_NUMPY_DTYPE", "float32")
+VECTOR_NUMPY_RESCORE = int(os.getenv("VECTOR_NUMPY_RESCORE", "0"))
+# Parallel collection lookups when a chat searches several documents
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+
+# Retrieval hot-path cache (documents/retrieval_cache.py): query embeddings and top-k results.
+# Invalidations always go through the default Django cache; RETRIEVAL_CACHE_SHARED stores the entries there too.
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "True").lower() in ("1", "true", "yes")
+RETRIEVAL_CACHE_SHARED = os.getenv("RETRIEVAL_CACHE_SHARED", "False").lower() in ("1", "true", "yes")
+RETRIEVAL_QUERY_CACHE_SIZE = int(os.getenv("RETRIEVAL_QUERY_CACHE_SIZE", "2048"))
+RETRIEVAL_RESULT_CACHE_SIZE = int(os.getenv("RETRIEVAL_RESULT_CACHE_SIZE", "2048"))
+RETRIEVAL_RESULT_CACHE_TTL = int(os.getenv("RETRIEVAL_RESULT_CACHE_TTL", "300"))
+VECTOR_HANDLE_POOL_SIZE = int(os.getenv("VECTOR_HANDLE_POOL_SIZE", "256"))
+
+# Retrieval: vector | hybrid (vector + BM25, reciprocal rank fusion) | lexical (BM25 only, no API calls).
+# hybrid and lexical change rankings (and answers); deployments opt in.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Query embeddings slower than this fall back to BM25 (0 = wait for the LLM gateway deadline)
+RETRIEVAL_EMBED_BUDGET_SECONDS = float(os.getenv("RETRIEVAL_EMBED_BUDGET_SECONDS", "0"))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+# SQLite FTS5 index of chunk text (documents/lexical_index.py), separate from the main database
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "True").lower() in ("1", "true", "yes")
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", str(BASE_DIR / "lexical_index.sqlite3"))
+
+# Prompt context assembly (documents/context.py): retrieved chunks merged into spans and packed into
+# this many estimated tokens; cut-off hits are widened to sentence boundaries up to CONTEXT_NEIGHBOR_CHARS
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_NEIGHBOR_CHARS = int(os.getenv("CONTEXT_NEIGHBOR_CHARS", "300"))
+
+# Extracted text storage (documents/text_store.py): zlib-compressed blocks of this many characters,
+# read back span by span; GET /api/documents/{id}/text/ returns at most DOCUMENT_TEXT_MAX_SPAN_CHARS
+DOCUMENT_TEXT_BLOCK_CHARS = int(os.getenv("DOCUMENT_TEXT_BLOCK_CHARS", str(64 * 1024)))
+DOCUMENT_TEXT_COMPRESSION_LEVEL = int(os.getenv("DOCUMENT_TEXT_COMPRESSION_LEVEL", "6"))
+DOCUMENT_TEXT_MAX_SPAN_CHARS = int(os.getenv("DOCUMENT_TEXT_MAX_SPAN_CHARS", str(64 * 1024)))
+DOCUMENT_TEXT_CACHE_BLOCKS = int(os.getenv("DOCUMENT_TEXT_CACHE_BLOCKS", "64"))
+
+# Semantic answer cache for document chats (chat/answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "20000"))
+ANSWER_CACHE_MAX_AGE_SECONDS = int(os.getenv("ANSWER_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+# Persisted chat history (chat/history.py): estimated tokens of recent turns sent with each prompt;
+# older turns are folded into a rolling summary once they add up to CHAT_SUMMARY_BATCH_TOKENS
+CHAT_HISTORY_ENABLED = os.getenv("CHAT_HISTORY_ENABLED", "True").lower() in ("1", "true", "yes")
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1000"))
+CHAT_SUMMARY_BATCH_TOKENS = int(os.getenv("CHAT_SUMMARY_BATCH_TOKENS", "1000"))
+CHAT_SUMMARY_MAX_WORDS = int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "150"))
+# Messages are bulk-inserted by a background writer every CHAT_HISTORY_FLUSH_SECONDS
+CHAT_HISTORY_FLUSH_SECONDS = float(os.getenv("CHAT_HISTORY_FLUSH_SECONDS", "0.5"))
 
 LOGOUT_REDIRECT_URL = "/"
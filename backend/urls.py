@@ -3,6 +3,7 @@ from django.urls import path, include
 from django.http import JsonResponse
 from rest_framework_simplejwt.views import TokenRefreshView
 from users.custom_token_view import CustomTokenObtainPairView
+from core.views import metrics_view
 
 
 def api_health(request):
@@ -19,6 +20,7 @@ urlpatterns = [
 
     # ================= API HEALTH =================
     path("api/health/", api_health),
+    path("api/metrics/", metrics_view, name="api_metrics"),
 
     # ================= USERS / AUTH =================
     path("api/", include("users.urls")),   # 🔥 THIS ENABLES /api/register/
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Pick up queued document ingestion jobs (uploads, retries after a restart)
+from documents.ingestion import wake_workers  # noqa: E402
+
+wake_workers()
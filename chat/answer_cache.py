@@ -0,0 +1,136 @@
+import hashlib
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import metrics
+from documents.signals import chunks_changed
+from .models import AnswerCacheEntry
+
+# -----------------------
+# SEMANTIC ANSWER CACHE SETTINGS
+# -----------------------
+ENABLED = getattr(settings, "ANSWER_CACHE_ENABLED", True)
+# Cosine similarity a past question needs to reuse its reply
+THRESHOLD = getattr(settings, "ANSWER_CACHE_THRESHOLD", 0.92)
+MAX_ENTRIES = getattr(settings, "ANSWER_CACHE_MAX_ENTRIES", 20000)
+MAX_AGE_SECONDS = getattr(settings, "ANSWER_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600)
+# Most recently used questions compared per document set
+CANDIDATES = 500
+
+
+def _scopes_text(scopes):
+    return "|" + "|".join(sorted(set(scopes))) + "|"
+
+
+def _key(scopes_text):
+    return hashlib.sha256(scopes_text.encode()).hexdigest()
+
+
+def _normalize(vector):
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+# -----------------------
+# LOOKUP / STORE
+# -----------------------
+def lookup(scopes, vector):
+    """
+    Reply to the most similar past question about the same documents, as
+    `(reply, similarity)`, or None below THRESHOLD. Hits record the latency
+    they saved (original generation time minus lookup time).
+    """
+    if not ENABLED or not scopes:
+        return None
+
+    started = time.perf_counter()
+    cutoff = timezone.now() - timedelta(seconds=MAX_AGE_SECONDS)
+    rows = list(
+        AnswerCacheEntry.objects
+        .filter(key=_key(_scopes_text(scopes)), created_at__gte=cutoff)
+        .order_by("-last_used_at")
+        .values_list("pk", "vector", "reply", "generation_ms")[:CANDIDATES]
+    )
+
+    query = _normalize(vector)
+    rows = [r for r in rows if len(r[1]) == query.nbytes]
+    best = None
+    if rows:
+        matrix = np.frombuffer(b"".join(bytes(r[1]) for r in rows), dtype=np.float32).reshape(len(rows), -1)
+        similarities = matrix @ query
+        i = int(np.argmax(similarities))
+        if similarities[i] >= THRESHOLD:
+            best = rows[i], float(similarities[i])
+
+    lookup_ms = (time.perf_counter() - started) * 1000
+    metrics.observe("answer_cache.lookup_ms", round(lookup_ms, 2))
+    if best is None:
+        metrics.incr("answer_cache.misses")
+        return None
+
+    (pk, _, reply, generation_ms), similarity = best
+    AnswerCacheEntry.objects.filter(pk=pk).update(last_used_at=timezone.now(), hit_count=F("hit_count") + 1)
+    metrics.incr("answer_cache.hits")
+    metrics.observe("answer_cache.saved_ms", max(0, round(generation_ms - lookup_ms)))
+    return reply, similarity
+
+
+def store(scopes, question, vector, reply, generation_ms):
+    if not ENABLED or not scopes:
+        return
+    scopes_text = _scopes_text(scopes)
+    AnswerCacheEntry.objects.create(
+        key=_key(scopes_text),
+        scopes=scopes_text,
+        question=question,
+        vector=_normalize(vector).tobytes(),
+        reply=reply,
+        generation_ms=int(generation_ms),
+    )
+    evict()
+
+
+def evict():
+    """Drop entries older than MAX_AGE_SECONDS, then least recently used ones above MAX_ENTRIES."""
+    cutoff = timezone.now() - timedelta(seconds=MAX_AGE_SECONDS)
+    expired, _ = AnswerCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+
+    total = AnswerCacheEntry.objects.count()
+    evicted = 0
+    if total > MAX_ENTRIES:
+        excess = total - MAX_ENTRIES + MAX_ENTRIES // 10
+        stale = list(AnswerCacheEntry.objects.order_by("last_used_at").values_list("pk", flat=True)[:excess])
+        evicted, _ = AnswerCacheEntry.objects.filter(pk__in=stale).delete()
+    if expired or evicted:
+        metrics.incr("answer_cache.evictions", expired + evicted)
+
+
+# -----------------------
+# INVALIDATION
+# -----------------------
+@receiver(chunks_changed)
+def invalidate_collection(sender, collection_name, **kwargs):
+    """A document was (re-)indexed or deleted: its cached answers may be wrong now."""
+    deleted, _ = AnswerCacheEntry.objects.filter(scopes__contains=f"|{collection_name}|").delete()
+    if deleted:
+        metrics.incr("answer_cache.invalidated", deleted)
+
+
+def stats():
+    return {
+        "enabled": ENABLED,
+        "threshold": THRESHOLD,
+        "entries": AnswerCacheEntry.objects.count(),
+        "hits": metrics.get("answer_cache.hits"),
+        "misses": metrics.get("answer_cache.misses"),
+        "hit_rate": metrics.hit_rate("answer_cache"),
+        "saved_ms_p50": metrics.percentile("answer_cache.saved_ms", 50),
+        "saved_ms_p99": metrics.percentile("answer_cache.saved_ms", 99),
+    }
@@ -0,0 +1,238 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from core import llm_gateway, metrics
+from core.pagination import keyset_page
+from documents.chunking import estimate_tokens
+from .models import Chat, Message
+
+# -----------------------
+# CHAT HISTORY SETTINGS
+# -----------------------
+# Turns are saved by a background writer that bulk-inserts whatever arrived in
+# the last FLUSH_SECONDS, so the response never waits on the INSERT. Prompts get
+# the newest turns that fit TOKEN_BUDGET; once the turns that fell out of that
+# window reach SUMMARY_BATCH_TOKENS, the same thread folds them into the chat's
+# rolling summary with one Gemini call. Prompt size stays bounded however long
+# the conversation gets.
+ENABLED = getattr(settings, "CHAT_HISTORY_ENABLED", True)
+TOKEN_BUDGET = getattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 1000)
+SUMMARY_BATCH_TOKENS = getattr(settings, "CHAT_SUMMARY_BATCH_TOKENS", 1000)
+SUMMARY_MAX_WORDS = getattr(settings, "CHAT_SUMMARY_MAX_WORDS", 150)
+SUMMARY_MODEL = getattr(settings, "CHAT_SUMMARY_MODEL", "gemini-2.5-flash-lite")
+FLUSH_SECONDS = getattr(settings, "CHAT_HISTORY_FLUSH_SECONDS", 0.5)
+# Unsummarized messages read per prompt; bounds the query if summarizing keeps failing
+SCAN_LIMIT = 200
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_lock = threading.Lock()
+_pending = []       # unsaved Message objects, oldest first
+_summarize = set()  # chat ids with enough turns outside the window
+_wakeup = threading.Event()
+_writer = []
+
+
+# -----------------------
+# BACKGROUND WRITER
+# -----------------------
+def record(chat_id, question, reply):
+    """Queue one user/assistant turn for the writer and return immediately."""
+    if not ENABLED or chat_id is None:
+        return
+    messages = [
+        Message(chat_id=chat_id, role="user", content=question, tokens=estimate_tokens(question)),
+        Message(chat_id=chat_id, role="assistant", content=reply, tokens=estimate_tokens(reply)),
+    ]
+    with _lock:
+        _pending.extend(messages)
+    _wake()
+
+
+def _wake():
+    with _lock:
+        if not any(t.is_alive() for t in _writer):
+            t = threading.Thread(target=_writer_loop, name="chat-history-writer", daemon=True)
+            t.start()
+            _writer[:] = [t]
+    _wakeup.set()
+
+
+def _writer_loop():
+    while True:
+        _wakeup.wait()
+        # Let more turns arrive so they share one INSERT
+        time.sleep(FLUSH_SECONDS)
+        _wakeup.clear()
+        try:
+            flush()
+            summarize_pending()
+        except Exception as e:
+            print("⚠️ Chat history writer failed:", e)
+        finally:
+            close_old_connections()
+
+
+def flush():
+    """Insert the queued messages in one statement; returns how many were saved."""
+    with _lock:
+        batch, _pending[:] = list(_pending), []
+    if not batch:
+        return 0
+    started = time.perf_counter()
+    try:
+        Message.objects.bulk_create(batch, batch_size=500)
+        saved = len(batch)
+    except Exception as e:
+        # e.g. a chat deleted in the meantime: keep the other chats' messages
+        print("⚠️ Chat history bulk insert failed, saving one by one:", e)
+        saved = 0
+        for message in batch:
+            try:
+                message.save()
+                saved += 1
+            except Exception:
+                metrics.incr("chat_history.dropped")
+    metrics.incr("chat_history.written", saved)
+    metrics.observe("chat_history.batch_size", len(batch))
+    metrics.observe("chat_history.flush_ms", round((time.perf_counter() - started) * 1000, 2))
+    return saved
+
+
+# Don't lose the last turns on a clean shutdown
+atexit.register(flush)
+
+
+# -----------------------
+# PROMPT WINDOW
+# -----------------------
+def _unsummarized(chat_id, summarized_upto):
+    """(id, role, content, tokens) of the messages after the summary, newest first."""
+    return list(
+        Message.objects
+        .filter(chat_id=chat_id, id__gt=summarized_upto)
+        .order_by("-created_at", "-id")
+        .values_list("id", "role", "content", "tokens")[:SCAN_LIMIT]
+    )
+
+
+def _split(rows):
+    """Newest-first rows -> (rows inside TOKEN_BUDGET, older rows), both newest first."""
+    used, kept = 0, 0
+    for row in rows:
+        if used + row[3] > TOKEN_BUDGET:
+            break
+        used += row[3]
+        kept += 1
+    # Don't open the window on a reply whose question didn't fit
+    if kept and rows[kept - 1][1] == "assistant":
+        kept -= 1
+    return rows[:kept], rows[kept:]
+
+
+def load(chat_id):
+    """
+    Prompt history for a chat: `{"chat_id", "summary", "turns", "tokens"}`
+    with the turns oldest first, or None when the chat doesn't exist (or
+    history is off). Turns still waiting for the writer are included.
+    """
+    if not ENABLED:
+        return None
+    chat = Chat.objects.filter(pk=chat_id).values("pk", "summary", "summarized_upto").first()
+    if chat is None:
+        return None
+
+    rows = _unsummarized(chat["pk"], chat["summarized_upto"])
+    with _lock:
+        pending = [(None, m.role, m.content, m.tokens) for m in _pending if m.chat_id == chat["pk"]]
+    window, older = _split(pending[::-1] + rows)
+
+    if sum(row[3] for row in older if row[0] is not None) >= SUMMARY_BATCH_TOKENS:
+        with _lock:
+            _summarize.add(chat["pk"])
+        _wake()
+
+    tokens = sum(row[3] for row in window) + (estimate_tokens(chat["summary"]) if chat["summary"] else 0)
+    metrics.observe("chat_history.prompt_tokens", tokens)
+    return {
+        "chat_id": chat["pk"],
+        "summary": chat["summary"],
+        "turns": [{"role": role, "content": content} for _, role, content, _ in reversed(window)],
+        "tokens": tokens,
+    }
+
+
+def transcript(turns):
+    return "\n".join(f"{t['role'].capitalize()}: {t['content'].strip()}" for t in turns)
+
+
+# -----------------------
+# ROLLING SUMMARY
+# -----------------------
+def summarize_pending():
+    with _lock:
+        chat_ids = list(_summarize)
+        _summarize.clear()
+    for chat_id in chat_ids:
+        try:
+            summarize(chat_id)
+        except Exception as e:
+            metrics.incr("chat_history.summary_errors")
+            print(f"⚠️ Summarizing chat {chat_id} failed:", e)
+
+
+def summarize(chat_id):
+    """Fold the messages older than the prompt window into the chat's summary. True if it changed."""
+    chat = Chat.objects.filter(pk=chat_id).values("summary", "summarized_upto").first()
+    if chat is None:
+        return False
+    _, older = _split(_unsummarized(chat_id, chat["summarized_upto"]))
+    if not older:
+        return False
+    older = older[::-1]
+
+    prompt = f"""
+Update the summary of a conversation between a user and an assistant.
+
+CURRENT SUMMARY:
+{chat["summary"] or "(none)"}
+
+NEW MESSAGES:
+{transcript([{"role": role, "content": content} for _, role, content, _ in older])}
+
+Write the updated summary in at most {SUMMARY_MAX_WORDS} words. Keep names, numbers,
+documents and open questions the user may refer back to. Reply with the summary only.
+"""
+    started = time.perf_counter()
+    summary = llm_gateway.generate(prompt, model=SUMMARY_MODEL).strip()
+    if not summary:
+        return False
+
+    # Another process may have folded the same messages first
+    updated = Chat.objects.filter(pk=chat_id, summarized_upto=chat["summarized_upto"]).update(
+        summary=summary, summarized_upto=older[-1][0]
+    )
+    if updated:
+        metrics.incr("chat_history.summaries")
+        metrics.observe("chat_history.summary_ms", round((time.perf_counter() - started) * 1000))
+        print(f"🧾 Chat {chat_id}: folded {len(older)} messages into the summary")
+    return bool(updated)
+
+
+# -----------------------
+# PAGES
+# -----------------------
+def page(chat_id, before=None, limit=PAGE_SIZE):
+    """
+    Messages older than the `before` cursor (newest page when None), returned
+    oldest first, plus the cursor of the next older page or None. Keyset
+    pagination on the (chat, created_at) index; see core/pagination.py.
+    Raises ValueError for a malformed cursor.
+    """
+    messages = Message.objects.filter(chat_id=chat_id).values("id", "role", "content", "created_at")
+    rows, next_cursor = keyset_page(messages, ("created_at", "id"), before, limit)
+    return rows[::-1], next_cursor
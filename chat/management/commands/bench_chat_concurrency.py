@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.models import Chat
+from core import llm_gateway
+from documents import dedup, ingestion
+from documents.models import DocumentChatMapping
+
+SERVERS = {
+    # Sync gunicorn workers: one chat per worker at a time
+    "wsgi": ["backend.wsgi:application"],
+    # Uvicorn workers under gunicorn: chats wait on Gemini without holding the worker
+    "asgi": ["backend.asgi:application", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+BENCH_TEXT = "\n\n".join(
+    f"Section {i}. The quarterly report for region {i} is due on day {i * 3} "
+    f"and the budget owner for project {i} is team {chr(65 + i)}."
+    for i in range(20)
+)
+
+
+# -----------------------
+# FAKE GEMINI SERVER
+# -----------------------
+def make_fake_gemini(model_latency, embed_latency, dims=64, port=0):
+    """
+    Local stand-in for the Gemini REST API (generateContent, streamGenerateContent,
+    batchEmbedContents) with fixed latencies. Embeddings are hashed bags of words
+    so retrieval still finds matching chunks.
+    """
+
+    def vector(text):
+        v = [0.0] * dims
+        for word in re.findall(r"\w+", text.lower()):
+            v[zlib.crc32(word.encode()) % dims] += 1.0
+        return v
+
+    def texts_of(body):
+        return ["".join(p.get("text", "") for p in r["content"]["parts"]) for r in body.get("requests", [])]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            reply = {"candidates": [{"content": {"role": "model", "parts": [{"text": "Team C owns it."}]},
+                                     "finishReason": "STOP"}]}
+
+            if ":batchEmbedContents" in self.path:
+                time.sleep(embed_latency)
+                self._json({"embeddings": [{"values": vector(t)} for t in texts_of(body)]})
+            elif ":streamGenerateContent" in self.path:
+                # SSE for the async client (alt=sse), a streamed JSON array for google.generativeai
+                sse = "alt=sse" in self.path
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                words = ["Team ", "C ", "owns ", "it."]
+                for i, word in enumerate(words):
+                    time.sleep(model_latency / len(words))
+                    piece = json.dumps({"candidates": [{"content": {"role": "model", "parts": [{"text": word}]}}]})
+                    if sse:
+                        self.wfile.write(f"data: {piece}\r\n\r\n".encode())
+                    else:
+                        self.wfile.write((("[" if i == 0 else ",") + piece).encode())
+                    self.wfile.flush()
+                if not sse:
+                    self.wfile.write(b"]")
+                self.close_connection = True
+            elif ":generateContent" in self.path:
+                time.sleep(model_latency)
+                self._json(reply)
+            else:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+# -----------------------
+# LOAD GENERATOR
+# -----------------------
+async def _run_level(url, chat_id, concurrency, total, offset):
+    import httpx
+
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(offset + i)
+
+    async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def user():
+            nonlocal errors
+            while not queue.empty():
+                n = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    # A different question each time: no cache short-cuts
+                    response = await client.post(url, json={
+                        "message": f"Who owns project {n % 20}? (question {n})", "chat_id": chat_id,
+                    })
+                    ok = response.status_code == 200 and "reply" in response.json()
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return latencies, errors, wall
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the chat endpoint against a local fake Gemini server, under sync "
+        "gunicorn workers (wsgi) and uvicorn workers (asgi), and report throughput, "
+        "latency and concurrent chats per worker at each concurrency level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", action="append", choices=list(SERVERS), help="Default: both")
+        parser.add_argument("--workers", type=int, default=1, help="Web workers per server")
+        parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated client levels")
+        parser.add_argument("--requests", type=int, default=2, help="Requests per client at each level")
+        parser.add_argument("--model-latency", type=float, default=0.5, help="Fake generation latency (s)")
+        parser.add_argument("--embed-latency", type=float, default=0.05, help="Fake query embedding latency (s)")
+        parser.add_argument("--verbose", action="store_true", help="Show the web server's output")
+
+    def handle(self, *args, **opts):
+        try:
+            import httpx  # noqa: F401
+        except ImportError:
+            raise CommandError("httpx is not installed")
+        levels = [int(c) for c in opts["concurrency"].split(",") if c.strip()]
+
+        fake = make_fake_gemini(opts["model_latency"], opts["embed_latency"])
+        fake_url = f"http://127.0.0.1:{fake.server_address[1]}"
+
+        # Index the benchmark document through the fake server too
+        settings.GEMINI_API_BASE = fake_url
+        os.environ["GEMINI_API_KEY"] = "bench-key"
+        llm_gateway.configure("bench-key")
+        user = get_user_model().objects.create(
+            username=f"bench-chat-{os.getpid()}", email=f"bench-chat-{os.getpid()}@example.invalid"
+        )
+        try:
+            doc, content, created = dedup.store_upload(user, ContentFile(BENCH_TEXT.encode()), "bench.txt")
+            chat = Chat.objects.create(user=user, title="bench")
+            DocumentChatMapping.objects.create(chat_id=chat.id, document=doc)
+            if created or ingestion.needs_ingestion(content):
+                ingestion.enqueue_content(content, document=doc)
+            ingestion.run_pending_jobs()
+            if not ingestion.is_indexed(doc):
+                raise CommandError("The benchmark document could not be indexed")
+
+            rows = []
+            for mode in opts["mode"] or list(SERVERS):
+                rows += self._bench_mode(mode, levels, chat.id, fake_url, opts)
+        finally:
+            user.delete()
+            fake.shutdown()
+
+        baseline = opts["model_latency"] + opts["embed_latency"]
+        self.stdout.write(
+            f"\n{opts['workers']} worker(s), fake Gemini: {opts['model_latency'] * 1000:.0f} ms generation "
+            f"+ {opts['embed_latency'] * 1000:.0f} ms query embedding"
+        )
+        self.stdout.write(
+            f"  {'mode':<6}{'clients':>8}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'chats/worker':>14}"
+        )
+        for r in rows:
+            # Little's law: chats in flight = throughput x time one chat needs on its own
+            in_flight = r["rps"] * baseline / opts["workers"]
+            self.stdout.write(
+                f"  {r['mode']:<6}{r['clients']:>8}{r['rps']:>8.1f}{r['p50']:>9.0f}{r['p99']:>9.0f}"
+                f"{r['errors']:>8}{in_flight:>14.1f}"
+            )
+
+    def _bench_mode(self, mode, levels, chat_id, fake_url, opts):
+        port = _free_port()
+        env = dict(
+            os.environ,
+            GEMINI_API_BASE=fake_url,
+            GEMINI_API_KEY="bench-key",
+            DJANGO_ASYNC_VIEWS="True" if mode == "asgi" else "False",
+            INGESTION_AUTOSTART="False",
+            # Every request pays for the query embedding and the generation
+            ANSWER_CACHE_ENABLED="False",
+            RETRIEVAL_CACHE_ENABLED="False",
+        )
+        command = [
+            sys.executable, "-m", "gunicorn", *SERVERS[mode],
+            "--workers", str(opts["workers"]),
+            "--bind", f"127.0.0.1:{port}",
+            "--timeout", "600",
+            "--chdir", str(settings.BASE_DIR),
+        ]
+        output = None if opts["verbose"] else subprocess.DEVNULL
+        server = subprocess.Popen(command, env=env, stdout=output, stderr=output)
+        url = f"http://127.0.0.1:{port}/api/chat/gemini/"
+        rows = []
+        try:
+            self._wait_ready(server, port)
+            # Warm-up: imports, DB connection and Chroma client of every worker
+            asyncio.run(_run_level(url, chat_id, opts["workers"] * 2, opts["workers"] * 4, 10**6))
+            offset = 0
+            for clients in levels:
+                total = clients * opts["requests"]
+                latencies, errors, wall = asyncio.run(_run_level(url, chat_id, clients, total, offset))
+                offset += total
+                rows.append({
+                    "mode": mode,
+                    "clients": clients,
+                    "rps": len(latencies) / wall if wall else 0.0,
+                    "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+                    "p99": _percentile(latencies, 99) * 1000 if latencies else 0.0,
+                    "errors": errors,
+                })
+                self.stdout.write(f"{mode}: {clients} clients, {len(latencies)}/{total} ok in {wall:.1f}s")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        return rows
+
+    def _wait_ready(self, server, port, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("The web server exited during startup (rerun with --verbose)")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("The web server did not start listening")
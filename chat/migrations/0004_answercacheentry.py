@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_chat_message_delete_chatmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=64)),
+                ('scopes', models.TextField()),
+                ('question', models.TextField()),
+                ('vector', models.BinaryField()),
+                ('reply', models.TextField()),
+                ('generation_ms', models.PositiveIntegerField(default=0)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
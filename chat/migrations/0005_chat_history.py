@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_answercacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='summarized_upto',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'created_at'], name='chat_message_chat_created'),
+        ),
+    ]
@@ -7,6 +7,9 @@ class Chat(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chats")
     title = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of the messages up to (and including) id `summarized_upto`; see chat/history.py
+    summary = models.TextField(blank=True)
+    summarized_upto = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return self.title or f"Chat {self.pk}"
@@ -21,8 +24,29 @@ class Message(models.Model):
     role = models.CharField(max_length=16, choices=ROLE_CHOICES)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    # optional: store tokens, metadata
-    # tokens = models.IntegerField(null=True, blank=True)
+    # Estimated tokens of `content`, for the prompt's history budget
+    tokens = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["chat", "created_at"], name="chat_message_chat_created")]
 
     def __str__(self):
         return f"{self.role}: {self.content[:30]}"
+
+
+class AnswerCacheEntry(models.Model):
+    """A generated reply for a question about a set of documents; see chat/answer_cache.py."""
+    # sha256 of `scopes`; lookups only compare questions asked of the same documents
+    key = models.CharField(max_length=64, db_index=True)
+    # "|document_1|document_7|": the documents' vector collections, for invalidation
+    scopes = models.TextField()
+    question = models.TextField()
+    vector = models.BinaryField()  # normalized float32 question embedding
+    reply = models.TextField()
+    generation_ms = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.question[:40]} ({self.hit_count} hits)"
@@ -1,6 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from .views import gemini_chat
+from .views import ChatMessagesView, gemini_chat, gemini_chat_stream, gemini_chat_async, gemini_chat_stream_async
+
+if getattr(settings, "ASYNC_VIEWS", False):
+    gemini_chat, gemini_chat_stream = gemini_chat_async, gemini_chat_stream_async
 
 urlpatterns = [
     path("gemini/", gemini_chat, name="gemini_chat"),
+    path("gemini/stream/", gemini_chat_stream, name="gemini_chat_stream"),
+    path("<int:chat_id>/messages/", ChatMessagesView.as_view(), name="chat_messages"),
 ]
@@ -3,119 +3,592 @@ load_dotenv()
 
 import os
 import json
+import time
 import traceback
-import google.generativeai as genai
 
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import llm_gateway, lookups
+from core.authentication import CachedJWTAuthentication
 
 # 🔽 RAG imports
-from documents.models import DocumentChatMapping
 from documents import embeddings as doc_embeddings
+from documents import context as doc_context
+from documents import ingestion
+from . import answer_cache, history
+from .models import Chat
 
+MODEL_NAME = "gemini-2.5-flash-lite"
+NOT_FOUND_REPLY = "The information is not available in the document."
 
-@csrf_exempt
-def gemini_chat(request):
+
+# -----------------------
+# SHARED TURN PREPARATION
+# -----------------------
+def _parse_request(request):
+    """(user_message, chat_id, None) or (None, None, error JsonResponse)."""
+    data = json.loads(request.body or "{}")
+    user_message = data.get("message", "").strip()
+    chat_id = data.get("chat_id")
+
+    # -------------------- VALIDATION --------------------
+    if not user_message:
+        return None, None, JsonResponse({"error": "Empty message"}, status=400)
+    if not chat_id:
+        return None, None, JsonResponse({"error": "chat_id missing"}, status=400)
+
+    # -------------------- GEMINI CONFIG --------------------
+    # Clients are configured and pooled by core.llm_gateway
+    if not os.getenv("GEMINI_API_KEY"):
+        return None, None, JsonResponse({"error": "Gemini API key missing"}, status=500)
+
+    print("USER MESSAGE:", user_message)
+    print("CHAT ID RECEIVED:", chat_id)
+    return user_message, chat_id, None
+
+
+def _owns_chat(request, chat_id):
     """
-    Endpoint for Gemini AI chat with optional document-based RAG
+    Whether the caller owns the chat (JWT or session). A chat's history is sent
+    with the prompt, and new turns are recorded, only for its owner; anyone
+    else, including a caller with an expired or invalid token, gets the turn
+    without history, as before authentication was checked here.
     """
-    if request.method != "POST":
-        return JsonResponse({"error": "POST request required"}, status=405)
+    try:
+        auth = CachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        # InvalidToken is an AuthenticationFailed too
+        auth = None
+    user = auth[0] if auth else getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return False
+    try:
+        return Chat.objects.filter(pk=chat_id, user=user).exists()
+    except (TypeError, ValueError):
+        return False
+
 
+def _new_turn(user_message):
+    return {
+        "question": user_message,
+        "history": None,
+        "reply": None,
+        "cached": False,
+        "sources": [],
+        "rag_context": "",
+        "indexing_status": [],
+        "answer_scopes": [],
+        "context_stats": None,
+    }
+
+
+def _chat_documents(chat_id):
+    # Mapped ids and document rows come from the shared lookup cache
+    return lookups.chat_documents(chat_id)
+
+
+def _load_history(turn, chat_id):
     try:
-        data = json.loads(request.body or "{}")
-        user_message = data.get("message", "").strip()
-        chat_id = data.get("chat_id")
+        turn["history"] = history.load(chat_id)
+    except Exception as e:
+        print("⚠️ Chat history unavailable:", e)
 
-        # -------------------- VALIDATION --------------------
-        if not user_message:
-            return JsonResponse({"error": "Empty message"}, status=400)
-        if not chat_id:
-            return JsonResponse({"error": "chat_id missing"}, status=400)
 
-        # -------------------- GEMINI CONFIG --------------------
-        gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not gemini_api_key:
-            return JsonResponse({"error": "Gemini API key missing"}, status=500)
+def _has_history(turn):
+    return bool(turn["history"] and (turn["history"]["turns"] or turn["history"]["summary"]))
 
-        genai.configure(api_key=gemini_api_key)
 
-        print("USER MESSAGE:", user_message)
-        print("CHAT ID RECEIVED:", chat_id)
+def _indexing_statuses(documents):
+    return [ingestion.job_status(d) for d in documents if not ingestion.is_indexed(d)]
 
-        # -------------------- RAG / DOCUMENT CONTEXT --------------------
-        rag_context = ""
-        try:
-            mapping = (
-                DocumentChatMapping.objects
-                .filter(chat_id=chat_id)
-                .select_related("document")
-                .first()
-            )
 
-            if mapping and mapping.document:
-                print("📄 USING DOCUMENT ID:", mapping.document.id)
+def _answer_scopes(documents):
+    return list(doc_embeddings.collection_names_for([d.id for d in documents]).values())
+
+
+def _use_results(turn, documents, results):
+    if results:
+        many = len(documents) > 1
+        turn["sources"] = [r for r in results if r.get("text")]
+        # Overlapping / adjacent chunks merged into spans, packed into CONTEXT_TOKEN_BUDGET
+        assembled = doc_context.assemble(turn["sources"])
+        turn["context_stats"] = assembled["stats"]
+        turn["rag_context"] = "\n".join(
+            [
+                f"- [{s['file_name']}] {s['text']}" if many
+                else f"- {s['text']}"
+                for s in assembled["spans"]
+            ]
+        )
+        print("📄 RAG CONTEXT FOUND")
+    else:
+        print("ℹ️ No RAG results found, fallback to normal AI chat")
+
+
+def _prepare_turn(user_message, chat_id, owner):
+    """
+    Retrieval and prompt for one chat turn. The returned dict carries either a
+    ready `reply` (answer cache hit, or a refusal while documents are still
+    indexing) or the `final_prompt` / `system_instruction` to send to Gemini,
+    plus the retrieved `sources`.
+    """
+    turn = _new_turn(user_message)
+    if owner:
+        _load_history(turn, chat_id)
+
+    # -------------------- RAG / DOCUMENT CONTEXT --------------------
+    try:
+        documents = _chat_documents(chat_id)
+
+        if documents:
+            print("📄 USING DOCUMENT IDS:", [d.id for d in documents])
+            turn["indexing_status"] = _indexing_statuses(documents)
+
+            # Same question (semantically) about the same documents answered before.
+            # Not once the chat has history: "and its price?" depends on what came before.
+            if not turn["indexing_status"] and not _has_history(turn):
                 try:
-                    results = doc_embeddings.query_document(
-                        document_id=mapping.document.id,
-                        query=user_message,
-                        top_k=4
+                    turn["answer_scopes"] = _answer_scopes(documents)
+                    # None when the embedding API is slow or down: skip the cache, retrieve lexically
+                    vector = doc_embeddings.try_embed_query(user_message)
+                    cached = answer_cache.lookup(turn["answer_scopes"], vector) if vector is not None else None
+                except Exception as e:
+                    print("⚠️ Answer cache lookup failed:", e)
+                    cached, turn["answer_scopes"] = None, []
+                if cached:
+                    print(f"⚡ ANSWER CACHE HIT (similarity {cached[1]:.3f})")
+                    turn["reply"], turn["cached"] = cached[0], True
+                    return turn
+
+            try:
+                # One ranked search over every document attached to the chat
+                results = doc_embeddings.query_documents(
+                    [d.id for d in documents],
+                    query=user_message,
+                    top_k=4,
+                    # Partial results change as chunks arrive; don't cache them
+                    use_cache=not turn["indexing_status"],
+                )
+                _use_results(turn, documents, results)
+            except Exception as e:
+                print("⚠️ RAG retrieval failed:", e)
+                print("ℹ️ Falling back to normal AI chat")
+
+    except Exception as e:
+        print("⚠️ Document mapping error:", e)
+        turn["rag_context"] = ""
+
+    return _build_prompt(turn, user_message)
+
+
+async def _aprepare_turn(user_message, chat_id, owner):
+    """`_prepare_turn` for the async views: Gemini calls are awaited, ORM work runs in threads."""
+    turn = _new_turn(user_message)
+    if owner:
+        await sync_to_async(_load_history)(turn, chat_id)
+
+    # -------------------- RAG / DOCUMENT CONTEXT --------------------
+    try:
+        documents = await sync_to_async(_chat_documents)(chat_id)
+
+        if documents:
+            print("📄 USING DOCUMENT IDS:", [d.id for d in documents])
+            turn["indexing_status"] = await sync_to_async(_indexing_statuses)(documents)
+
+            if not turn["indexing_status"] and not _has_history(turn):
+                try:
+                    turn["answer_scopes"] = await sync_to_async(_answer_scopes)(documents)
+                    vector = await doc_embeddings.atry_embed_query(user_message)
+                    cached = (
+                        await sync_to_async(answer_cache.lookup)(turn["answer_scopes"], vector)
+                        if vector is not None else None
                     )
-                    if results:
-                        rag_context = "\n".join(
-                            [f"- {r.get('text', '').strip()}" for r in results if r.get("text")]
-                        )
-                        print("📄 RAG CONTEXT FOUND")
-                    else:
-                        print("ℹ️ No RAG results found, fallback to normal AI chat")
                 except Exception as e:
-                    print("⚠️ RAG retrieval failed:", e)
-                    print("ℹ️ Falling back to normal AI chat")
+                    print("⚠️ Answer cache lookup failed:", e)
+                    cached, turn["answer_scopes"] = None, []
+                if cached:
+                    print(f"⚡ ANSWER CACHE HIT (similarity {cached[1]:.3f})")
+                    turn["reply"], turn["cached"] = cached[0], True
+                    return turn
 
-        except Exception as e:
-            print("⚠️ Document mapping error:", e)
-            rag_context = ""
+            try:
+                results = await doc_embeddings.aquery_documents(
+                    [d.id for d in documents],
+                    query=user_message,
+                    top_k=4,
+                    use_cache=not turn["indexing_status"],
+                )
+                # Context assembly reads the stored text
+                await sync_to_async(_use_results)(turn, documents, results)
+            except Exception as e:
+                print("⚠️ RAG retrieval failed:", e)
+                print("ℹ️ Falling back to normal AI chat")
+
+    except Exception as e:
+        print("⚠️ Document mapping error:", e)
+        turn["rag_context"] = ""
+
+    return _build_prompt(turn, user_message)
+
+
+def _history_block(turn):
+    """Summary and recent turns of the chat, within CHAT_HISTORY_TOKEN_BUDGET."""
+    if not _has_history(turn):
+        return ""
+    parts = []
+    if turn["history"]["summary"]:
+        parts.append(f"Summary of earlier messages: {turn['history']['summary']}")
+    if turn["history"]["turns"]:
+        parts.append(history.transcript(turn["history"]["turns"]))
+    return "\n".join(parts)
 
-        # -------------------- PROMPT BUILD --------------------
-        if rag_context:
-            final_prompt = f"""
+
+def _build_prompt(turn, user_message):
+    # Still indexing and nothing searchable yet: refuse instead of answering blind
+    if turn["indexing_status"] and not turn["rag_context"]:
+        if all(s["status"] == "failed" for s in turn["indexing_status"]):
+            turn["reply"] = "The document could not be processed. Please upload it again."
+        else:
+            turn["reply"] = "The document is still being processed. Please try again in a moment."
+        return turn
+
+    # -------------------- PROMPT BUILD --------------------
+    conversation = _history_block(turn)
+    if turn["rag_context"]:
+        conversation_section = f"\nCONVERSATION SO FAR:\n{conversation}\n" if conversation else ""
+        turn["final_prompt"] = f"""
 You are a strict document-based assistant.
 
 DOCUMENT CONTENT:
-{rag_context}
-
+{turn["rag_context"]}
+{conversation_section}
 USER QUESTION:
 {user_message}
 
 RULES:
 - Answer ONLY using the document content above.
+- Use the conversation so far only to understand what the question refers to.
 - Do NOT assume or guess.
 - If the answer is NOT found, reply exactly:
-"The information is not available in the document."
+"{NOT_FOUND_REPLY}"
 """
-            system_instruction = "You are a document-only assistant. Never answer outside the document content."
-        else:
-            final_prompt = user_message
-            system_instruction = "You are a helpful, friendly AI assistant. Answer naturally and clearly."
+        turn["system_instruction"] = "You are a document-only assistant. Never answer outside the document content."
+    elif conversation:
+        turn["final_prompt"] = f"{conversation}\nUser: {user_message}"
+        turn["system_instruction"] = (
+            "You are a helpful, friendly AI assistant. Answer naturally and clearly. "
+            "The messages before the user's last one are the conversation so far."
+        )
+    else:
+        turn["final_prompt"] = user_message
+        turn["system_instruction"] = "You are a helpful, friendly AI assistant. Answer naturally and clearly."
+    return turn
+
+
+def _remember(turn, reply_text):
+    # Queued for chat.history's background writer, never awaited here
+    if turn["history"] is not None:
+        history.record(turn["history"]["chat_id"], turn["question"], reply_text)
+
+
+def _finish_turn(turn, user_message, reply_text, started):
+    """Answer-cache and record the generated reply, and build the response payload."""
+    _remember(turn, reply_text)
+    if turn["answer_scopes"] and turn["rag_context"]:
+        try:
+            vector = doc_embeddings.try_embed_query(user_message)
+            if vector is not None:
+                answer_cache.store(
+                    turn["answer_scopes"],
+                    user_message,
+                    vector,
+                    reply_text,
+                    generation_ms=(time.perf_counter() - started) * 1000,
+                )
+        except Exception as e:
+            print("⚠️ Answer cache store failed:", e)
+
+    payload = {"reply": reply_text, "cached": False}
+    if turn["context_stats"]:
+        payload["context"] = turn["context_stats"]
+    if turn["indexing_status"]:
+        # Answered from the chunks indexed so far
+        payload["partial"] = True
+        payload["indexing"] = turn["indexing_status"]
+    return payload
+
+
+def _early_payload(turn):
+    if turn["cached"]:
+        _remember(turn, turn["reply"])
+        return {"reply": turn["reply"], "cached": True}
+    return {"reply": turn["reply"], "indexing": turn["indexing_status"]}
+
+
+def _source_summary(result):
+    metadata = result.get("metadata") or {}
+    return {
+        "document_id": result.get("document_id"),
+        "file_name": result.get("file_name"),
+        "page": metadata.get("page"),
+        "chunk_index": metadata.get("chunk_index"),
+        "distance": result.get("distance"),
+    }
+
+
+def _unavailable(e):
+    # Gateway refused to call Gemini (circuit open or too many calls in flight)
+    print("⏳ GEMINI UNAVAILABLE:", str(e))
+    return JsonResponse({"error": str(e)}, status=503, headers={"Retry-After": "5"})
+
+
+@csrf_exempt
+def gemini_chat(request):
+    """
+    Endpoint for Gemini AI chat with optional document-based RAG
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required"}, status=405)
+
+    started = time.perf_counter()
+    try:
+        user_message, chat_id, error = _parse_request(request)
+        if error:
+            return error
+        owner = _owns_chat(request, chat_id)
+
+        turn = _prepare_turn(user_message, chat_id, owner)
+        if turn["reply"] is not None:
+            return JsonResponse(_early_payload(turn))
+
+        # -------------------- GEMINI CALL --------------------
+        try:
+            reply_text = llm_gateway.generate(
+                turn["final_prompt"], model=MODEL_NAME, system_instruction=turn["system_instruction"]
+            )
+            reply_text = reply_text.strip() or NOT_FOUND_REPLY
+
+        except llm_gateway.LLMUnavailable as e:
+            return _unavailable(e)
+        except Exception as e:
+            print("❌ GEMINI ERROR:", str(e))
+            traceback.print_exc()
+            # Still failing after the gateway's retries: upstream outage, not our bug
+            http_status = 503 if llm_gateway.is_retryable(e) else 500
+            return JsonResponse({"error": str(e)}, status=http_status)
+
+        print("AI REPLY:", reply_text)
+        return JsonResponse(_finish_turn(turn, user_message, reply_text, started))
+
+    except Exception as e:
+        print("❌ SERVER ERROR:", str(e))
+        traceback.print_exc()
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+# -----------------------
+# STREAMING (SERVER-SENT EVENTS)
+# -----------------------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+@csrf_exempt
+def gemini_chat_stream(request):
+    """
+    Same turn as gemini_chat, streamed as server-sent events:
+
+        sources  retrieved chunks, sent before the model is called
+        token    {"text": ...} for every piece of the reply as Gemini emits it
+        done     the gemini_chat payload (reply, cached, partial, indexing)
+        error    {"error": ...} if generation fails mid-stream ("retry": true
+                 when Gemini is temporarily unavailable)
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required"}, status=405)
+
+    started = time.perf_counter()
+    try:
+        user_message, chat_id, error = _parse_request(request)
+        if error:
+            return error
+        owner = _owns_chat(request, chat_id)
+        turn = _prepare_turn(user_message, chat_id, owner)
+    except Exception as e:
+        print("❌ SERVER ERROR:", str(e))
+        traceback.print_exc()
+        return JsonResponse({"error": str(e)}, status=500)
+
+    def events():
+        yield _sse("sources", [_source_summary(r) for r in turn["sources"]])
+
+        if turn["reply"] is not None:
+            yield _sse("token", {"text": turn["reply"]})
+            yield _sse("done", _early_payload(turn))
+            return
+
+        parts = []
+        try:
+            for text in llm_gateway.stream(
+                turn["final_prompt"], model=MODEL_NAME, system_instruction=turn["system_instruction"]
+            ):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except llm_gateway.LLMUnavailable as e:
+            print("⏳ GEMINI UNAVAILABLE:", str(e))
+            yield _sse("error", {"error": str(e), "retry": True})
+            return
+        except Exception as e:
+            print("❌ GEMINI ERROR:", str(e))
+            traceback.print_exc()
+            yield _sse("error", {"error": str(e)})
+            return
+
+        reply_text = "".join(parts).strip()
+        if not reply_text:
+            reply_text = NOT_FOUND_REPLY
+            yield _sse("token", {"text": reply_text})
+        print("AI REPLY:", reply_text)
+        yield _sse("done", _finish_turn(turn, user_message, reply_text, started))
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx and similar proxies from buffering the whole reply
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# -----------------------
+# ASYNC VIEWS (ASGI / uvicorn)
+# -----------------------
+# Same endpoints without tying up a worker while Gemini answers: the query
+# embedding and generation are awaited through core.llm_gateway.
+# chat/urls.py routes to these when settings.ASYNC_VIEWS is on.
+async def gemini_chat_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required"}, status=405)
+
+    started = time.perf_counter()
+    try:
+        user_message, chat_id, error = _parse_request(request)
+        if error:
+            return error
+        owner = await sync_to_async(_owns_chat)(request, chat_id)
+
+        turn = await _aprepare_turn(user_message, chat_id, owner)
+        if turn["reply"] is not None:
+            return JsonResponse(_early_payload(turn))
 
         # -------------------- GEMINI CALL --------------------
         try:
-            model = genai.GenerativeModel(
-                model_name="gemini-2.5-flash-lite",
-                system_instruction=system_instruction
+            reply_text = await llm_gateway.agenerate(
+                turn["final_prompt"], model=MODEL_NAME, system_instruction=turn["system_instruction"]
             )
-            response = model.generate_content(final_prompt)
-            reply_text = response.text.strip() if response.text else "The information is not available in the document."
+            reply_text = reply_text.strip() or NOT_FOUND_REPLY
 
+        except llm_gateway.LLMUnavailable as e:
+            return _unavailable(e)
         except Exception as e:
             print("❌ GEMINI ERROR:", str(e))
             traceback.print_exc()
-            return JsonResponse({"error": str(e)}, status=500)
+            # Still failing after the gateway's retries: upstream outage, not our bug
+            http_status = 503 if llm_gateway.is_retryable(e) else 500
+            return JsonResponse({"error": str(e)}, status=http_status)
 
         print("AI REPLY:", reply_text)
-        return JsonResponse({"reply": reply_text})
+        return JsonResponse(await sync_to_async(_finish_turn)(turn, user_message, reply_text, started))
 
     except Exception as e:
         print("❌ SERVER ERROR:", str(e))
         traceback.print_exc()
         return JsonResponse({"error": str(e)}, status=500)
+
+
+async def gemini_chat_stream_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required"}, status=405)
+
+    started = time.perf_counter()
+    try:
+        user_message, chat_id, error = _parse_request(request)
+        if error:
+            return error
+        owner = await sync_to_async(_owns_chat)(request, chat_id)
+        turn = await _aprepare_turn(user_message, chat_id, owner)
+    except Exception as e:
+        print("❌ SERVER ERROR:", str(e))
+        traceback.print_exc()
+        return JsonResponse({"error": str(e)}, status=500)
+
+    async def events():
+        yield _sse("sources", [_source_summary(r) for r in turn["sources"]])
+
+        if turn["reply"] is not None:
+            yield _sse("token", {"text": turn["reply"]})
+            yield _sse("done", _early_payload(turn))
+            return
+
+        parts = []
+        try:
+            async for text in llm_gateway.astream(
+                turn["final_prompt"], model=MODEL_NAME, system_instruction=turn["system_instruction"]
+            ):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except llm_gateway.LLMUnavailable as e:
+            print("⏳ GEMINI UNAVAILABLE:", str(e))
+            yield _sse("error", {"error": str(e), "retry": True})
+            return
+        except Exception as e:
+            print("❌ GEMINI ERROR:", str(e))
+            traceback.print_exc()
+            yield _sse("error", {"error": str(e)})
+            return
+
+        reply_text = "".join(parts).strip()
+        if not reply_text:
+            reply_text = NOT_FOUND_REPLY
+            yield _sse("token", {"text": reply_text})
+        print("AI REPLY:", reply_text)
+        yield _sse("done", await sync_to_async(_finish_turn)(turn, user_message, reply_text, started))
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# Django 4.2's csrf_exempt wraps views in a sync function; mark these directly
+gemini_chat_async.csrf_exempt = True
+gemini_chat_stream_async.csrf_exempt = True
+
+
+# -----------------------
+# HISTORY
+# -----------------------
+class ChatMessagesView(APIView):
+    """
+    GET /api/chat/<chat_id>/messages/?limit=50&before=<cursor>
+
+    The chat's messages, newest page first (each page oldest first).
+    `next_cursor` fetches the page before; null on the first message.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, chat_id):
+        if not Chat.objects.filter(pk=chat_id, user=request.user).exists():
+            return Response({"detail": "Chat not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            limit = min(max(int(request.query_params.get("limit", history.PAGE_SIZE)), 1), history.MAX_PAGE_SIZE)
+            messages, next_cursor = history.page(chat_id, request.query_params.get("before"), limit)
+        except ValueError:
+            return Response({"detail": "Invalid limit or cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"messages": messages, "next_cursor": next_cursor})
@@ -0,0 +1,32 @@
+# core/authentication.py
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import lookups
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    simplejwt's JWTAuthentication with the token's user read through the
+    lookup cache (core/lookups.py) instead of one users query per request.
+    Same errors and is_active check; with CHECK_REVOKE_TOKEN (which needs the
+    password hash) it falls back to the database lookup.
+    """
+
+    def get_user(self, validated_token):
+        if getattr(api_settings, "CHECK_REVOKE_TOKEN", False) or api_settings.USER_ID_FIELD != "id":
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = lookups.user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
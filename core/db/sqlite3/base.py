@@ -0,0 +1,34 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Django's SQLite backend plus the two OPTIONS Django only gains in 5.1:
+    `init_command`, ";"-separated statements run on every new connection
+    (the PRAGMAs of backend/database.py), and `transaction_mode`, the BEGIN
+    used by atomic blocks. IMMEDIATE takes the write lock when the block
+    starts, so a writer waits out busy_timeout instead of failing with
+    "database is locked" when its read lock can't be upgraded.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("init_command", None)
+        params.pop("transaction_mode", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.settings_dict["OPTIONS"].get("init_command", "").split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = (self.settings_dict["OPTIONS"].get("transaction_mode") or "").upper()
+        if mode and mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}")
+        self.cursor().execute(f"BEGIN {mode}" if mode else "BEGIN")
@@ -0,0 +1,148 @@
+# core/gemini.py
+import asyncio
+import json
+import os
+import weakref
+
+import google.generativeai as genai
+from django.conf import settings
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+# -----------------------
+# GEMINI ENDPOINT
+# -----------------------
+# Transport only: timeouts, retries, concurrency limits and the circuit
+# breaker live in core/llm_gateway.py, which every caller goes through.
+# GEMINI_API_BASE points both clients at another host (e.g. the fake model
+# server of `manage.py bench_chat_concurrency`); empty means Google's API.
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+API_VERSION = "v1beta"
+
+
+def api_base():
+    return (getattr(settings, "GEMINI_API_BASE", "") or DEFAULT_API_BASE).rstrip("/")
+
+
+def configure(api_key):
+    """Configure google.generativeai (the sync client) for the current endpoint."""
+    base = getattr(settings, "GEMINI_API_BASE", "")
+    if base:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": base})
+    else:
+        genai.configure(api_key=api_key)
+
+
+# -----------------------
+# ASYNC REST CLIENT
+# -----------------------
+# google.generativeai only has working async calls over gRPC, so the async
+# views talk to the same REST API through httpx. One pooled AsyncClient per
+# event loop: connections are bound to the loop that opened them.
+_clients = weakref.WeakKeyDictionary()
+
+
+class GeminiError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+def _client():
+    if httpx is None:
+        raise RuntimeError("httpx is not installed")
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=getattr(settings, "GEMINI_HTTP_TIMEOUT", 60),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, "GEMINI_HTTP_MAX_CONNECTIONS", 100),
+                max_keepalive_connections=getattr(settings, "GEMINI_HTTP_MAX_CONNECTIONS", 100),
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+def _url(model, method):
+    model = model if model.startswith("models/") else f"models/{model}"
+    return f"{api_base()}/{API_VERSION}/{model}:{method}"
+
+
+def _headers():
+    return {"x-goog-api-key": os.getenv("GEMINI_API_KEY") or "", "Content-Type": "application/json"}
+
+
+def _generate_body(prompt, system_instruction):
+    body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+    if system_instruction:
+        body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+    return body
+
+
+def _raise_for_status(response, body=None):
+    if response.status_code >= 400:
+        text = body if body is not None else response.text
+        raise GeminiError(response.status_code, text[:500])
+
+
+def _candidate_text(payload):
+    parts = []
+    for candidate in payload.get("candidates") or []:
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            parts.append(part.get("text") or "")
+        break
+    return "".join(parts)
+
+
+async def generate_content(model, prompt, system_instruction=None, timeout=None):
+    """Text of the first candidate for `prompt`."""
+    response = await _client().post(
+        _url(model, "generateContent"),
+        headers=_headers(),
+        json=_generate_body(prompt, system_instruction),
+        timeout=timeout or httpx.USE_CLIENT_DEFAULT,
+    )
+    _raise_for_status(response)
+    return _candidate_text(response.json())
+
+
+async def stream_generate_content(model, prompt, system_instruction=None, timeout=None):
+    """Async iterator over pieces of reply text as the model emits them."""
+    async with _client().stream(
+        "POST",
+        _url(model, "streamGenerateContent") + "?alt=sse",
+        headers=_headers(),
+        json=_generate_body(prompt, system_instruction),
+        timeout=timeout or httpx.USE_CLIENT_DEFAULT,
+    ) as response:
+        if response.status_code >= 400:
+            _raise_for_status(response, (await response.aread()).decode(errors="replace"))
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            text = _candidate_text(json.loads(line[5:]))
+            if text:
+                yield text
+
+
+async def embed_contents(model, texts, task_type, timeout=None):
+    """One batchEmbedContents round trip; vectors in input order."""
+    model = model if model.startswith("models/") else f"models/{model}"
+    response = await _client().post(
+        _url(model, "batchEmbedContents"),
+        headers=_headers(),
+        json={
+            "requests": [
+                {"model": model, "content": {"parts": [{"text": t}]}, "taskType": task_type.upper()}
+                for t in texts
+            ]
+        },
+        timeout=timeout or httpx.USE_CLIENT_DEFAULT,
+    )
+    _raise_for_status(response)
+    return [e["values"] for e in response.json()["embeddings"]]
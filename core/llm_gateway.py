@@ -0,0 +1,457 @@
+# core/llm_gateway.py
+import asyncio
+import os
+import random
+import threading
+import time
+
+import google.generativeai as genai
+from django.conf import settings
+
+from . import gemini, metrics
+from .lru import LRUCache
+
+# -----------------------
+# LLM GATEWAY
+# -----------------------
+# Every Gemini call in the project (chat, embeddings, core.utils) goes through
+# here. Per call: one pooled client per (model, system instruction), a deadline
+# covering all attempts, jittered exponential retries on transient errors, a
+# per-process cap on calls in flight and a circuit breaker per model that
+# fails fast while Gemini keeps erroring.
+TIMEOUT = getattr(settings, "LLM_TIMEOUT_SECONDS", 60)
+EMBED_TIMEOUT = getattr(settings, "LLM_EMBED_TIMEOUT_SECONDS", 20)
+MAX_RETRIES = getattr(settings, "LLM_MAX_RETRIES", 2)
+RETRY_BASE = getattr(settings, "LLM_RETRY_BASE_SECONDS", 0.5)
+MAX_CONCURRENCY = getattr(settings, "LLM_MAX_CONCURRENCY", 32)
+# How long a call may wait for a free slot before it is rejected
+QUEUE_TIMEOUT = getattr(settings, "LLM_QUEUE_TIMEOUT_SECONDS", 5)
+BREAKER_THRESHOLD = getattr(settings, "LLM_BREAKER_THRESHOLD", 5)
+BREAKER_COOLDOWN = getattr(settings, "LLM_BREAKER_COOLDOWN_SECONDS", 30)
+
+DEFAULT_MODEL = "gemini-2.5-flash-lite"
+DEFAULT_EMBED_MODEL = "models/text-embedding-004"
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+RETRYABLE_NAMES = (
+    "DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "TooManyRequests",
+    "ResourceExhausted", "TimeoutException", "ConnectError", "ReadError", "RemoteProtocolError",
+)
+
+
+class LLMUnavailable(Exception):
+    """Gemini was not called: the circuit is open or every slot stayed busy."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+class OverloadedError(LLMUnavailable):
+    pass
+
+
+# -----------------------
+# ERROR CLASSIFICATION
+# -----------------------
+def _status(exc):
+    code = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(exc) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return _status(exc) in RETRYABLE_STATUS or type(exc).__name__ in RETRYABLE_NAMES
+
+
+def _is_rate_limit(exc) -> bool:
+    return _status(exc) == 429 or type(exc).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+# -----------------------
+# CIRCUIT BREAKER
+# -----------------------
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive server-side failures and rejects calls
+    for `cooldown` seconds. Then one probe call goes through: success closes
+    the circuit, failure opens it again. Rate limits (429) don't count.
+    """
+
+    def __init__(self, name, threshold, cooldown):
+        self.name = name
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half_open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at >= self.cooldown and not self._probing:
+                self._probing = True
+                return
+        metrics.incr("llm.circuit_rejected")
+        raise CircuitOpenError(f"Gemini ({self.name}) is failing; not calling it for now")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    metrics.incr("llm.circuit_opened")
+                    print(f"🔌 Circuit open for {self.name} ({self._failures} failures in a row)")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        """The probe ended without a verdict (e.g. a client error)."""
+        with self._lock:
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(model):
+    with _breakers_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model, BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+        return _breakers[model]
+
+
+# -----------------------
+# CONCURRENCY CAP
+# -----------------------
+class _Slots:
+    """Calls in flight in this process, shared by threads and event loops."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def _try(self):
+        with self._cond:
+            if self.in_use < self.limit:
+                self.in_use += 1
+                return True
+            return False
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_use >= self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_use += 1
+            return True
+
+    async def aacquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self._try():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+
+
+_slots = _Slots(MAX_CONCURRENCY)
+
+
+def _queue_timeout(deadline):
+    return max(0.0, min(QUEUE_TIMEOUT, deadline - time.monotonic()))
+
+
+def _rejected():
+    metrics.incr("llm.overloaded")
+    return OverloadedError(f"More than {_slots.limit} Gemini calls in flight; try again shortly")
+
+
+# -----------------------
+# CLIENT POOL
+# -----------------------
+_configured = {"key": None, "base": None}
+_configure_lock = threading.Lock()
+_models = LRUCache(64)
+
+
+def configure(api_key=None):
+    """
+    (Re)configure google.generativeai; called lazily before every sync call and
+    only does work when the key or GEMINI_API_BASE changed.
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY") or _configured["key"]
+    base = getattr(settings, "GEMINI_API_BASE", "")
+    with _configure_lock:
+        if _configured["key"] == api_key and _configured["base"] == base:
+            return
+        gemini.configure(api_key)
+        _configured.update(key=api_key, base=base)
+        _models.clear()
+
+
+def get_model(model=DEFAULT_MODEL, system_instruction=None):
+    """Pooled `genai.GenerativeModel` for (model, system instruction)."""
+    configure()
+    key = (model, system_instruction)
+    client = _models.get(key)
+    if client is None:
+        client = genai.GenerativeModel(model_name=model, system_instruction=system_instruction)
+        _models.set(key, client)
+    return client
+
+
+# -----------------------
+# RETRY LOOP
+# -----------------------
+def _backoff(attempt):
+    # Full jitter: anywhere up to the exponential step
+    return random.uniform(0, RETRY_BASE * (2 ** attempt))
+
+
+def _should_retry(exc, attempt, deadline, retry_rate_limits):
+    if attempt >= MAX_RETRIES or not is_retryable(exc):
+        return None
+    if _is_rate_limit(exc) and not retry_rate_limits:
+        return None
+    delay = _backoff(attempt)
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def _record(circuit, kind, exc, started):
+    metrics.observe(f"llm.{kind}.latency_ms", round((time.perf_counter() - started) * 1000, 1))
+    if exc is None:
+        metrics.incr(f"llm.{kind}.calls")
+        circuit.record_success()
+        return
+    metrics.incr(f"llm.{kind}.errors")
+    if is_retryable(exc) and not _is_rate_limit(exc):
+        circuit.record_failure()
+    else:
+        circuit.release_probe()
+
+
+def _call(kind, model, timeout, fn, retry_rate_limits=True):
+    """Run `fn(remaining_seconds)` under the gateway's limits and retry policy."""
+    circuit = breaker(model)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        circuit.allow()
+        if not _slots.acquire(_queue_timeout(deadline)):
+            circuit.release_probe()
+            raise _rejected()
+        started = time.perf_counter()
+        try:
+            result = fn(max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            _record(circuit, kind, e, started)
+            delay = _should_retry(e, attempt, deadline, retry_rate_limits)
+            if delay is None:
+                raise
+            metrics.incr("llm.retries")
+            print(f"🔁 Gemini {kind} failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+        else:
+            _record(circuit, kind, None, started)
+            return result
+        finally:
+            _slots.release()
+        time.sleep(delay)
+        attempt += 1
+
+
+async def _acall(kind, model, timeout, afn, retry_rate_limits=True):
+    """`_call` for coroutines: waits and backoff don't block the event loop."""
+    circuit = breaker(model)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        circuit.allow()
+        if not await _slots.aacquire(_queue_timeout(deadline)):
+            circuit.release_probe()
+            raise _rejected()
+        started = time.perf_counter()
+        try:
+            result = await afn(max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            _record(circuit, kind, e, started)
+            delay = _should_retry(e, attempt, deadline, retry_rate_limits)
+            if delay is None:
+                raise
+            metrics.incr("llm.retries")
+            print(f"🔁 Gemini {kind} failed ({e}); retry {attempt + 1} in {delay:.2f}s")
+        else:
+            _record(circuit, kind, None, started)
+            return result
+        finally:
+            _slots.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def _response_text(response):
+    try:
+        return response.text or ""
+    except ValueError:
+        # No text parts (e.g. blocked by safety filters or finish metadata only)
+        return ""
+
+
+# -----------------------
+# PUBLIC API (sync)
+# -----------------------
+def generate(prompt, model=DEFAULT_MODEL, system_instruction=None, timeout=None):
+    """Reply text for `prompt` ("" when Gemini returns no text)."""
+    client = get_model(model, system_instruction)
+
+    def call(remaining):
+        return _response_text(client.generate_content(
+            prompt, request_options={"timeout": remaining, "retry": None}
+        ))
+
+    return _call("generate", model, timeout or TIMEOUT, call)
+
+
+def stream(prompt, model=DEFAULT_MODEL, system_instruction=None, timeout=None):
+    """
+    Iterator over pieces of reply text. A failure is retried only before the
+    first piece was yielded; the slot is held until the stream ends or is closed.
+    """
+    client = get_model(model, system_instruction)
+    circuit = breaker(model)
+    deadline = time.monotonic() + (timeout or TIMEOUT)
+    attempt = 0
+    while True:
+        circuit.allow()
+        if not _slots.acquire(_queue_timeout(deadline)):
+            circuit.release_probe()
+            raise _rejected()
+        started = time.perf_counter()
+        yielded, error = False, None
+        try:
+            response = client.generate_content(
+                prompt, stream=True,
+                request_options={"timeout": max(0.1, deadline - time.monotonic()), "retry": None},
+            )
+            for chunk in response:
+                text = _response_text(chunk)
+                if text:
+                    yielded = True
+                    yield text
+        except Exception as e:
+            error = e
+        finally:
+            _slots.release()
+            _record(circuit, "stream", error, started)
+        if error is None:
+            return
+        delay = None if yielded else _should_retry(error, attempt, deadline, True)
+        if delay is None:
+            raise error
+        metrics.incr("llm.retries")
+        print(f"🔁 Gemini stream failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+        time.sleep(delay)
+        attempt += 1
+
+
+def embed(texts, task_type, model=DEFAULT_EMBED_MODEL, timeout=None, retry_rate_limits=True):
+    """Vectors for `texts` in one batchEmbedContents call."""
+    configure()
+
+    def call(remaining):
+        result = genai.embed_content(
+            model=model, content=texts, task_type=task_type,
+            request_options={"timeout": remaining, "retry": None},
+        )
+        return result["embedding"]
+
+    return _call("embed", model, timeout or EMBED_TIMEOUT, call, retry_rate_limits)
+
+
+# -----------------------
+# PUBLIC API (async)
+# -----------------------
+async def agenerate(prompt, model=DEFAULT_MODEL, system_instruction=None, timeout=None):
+    async def call(remaining):
+        return await gemini.generate_content(model, prompt, system_instruction, timeout=remaining)
+
+    return await _acall("generate", model, timeout or TIMEOUT, call)
+
+
+async def astream(prompt, model=DEFAULT_MODEL, system_instruction=None, timeout=None):
+    """Async iterator over pieces of reply text; see `stream`."""
+    circuit = breaker(model)
+    deadline = time.monotonic() + (timeout or TIMEOUT)
+    attempt = 0
+    while True:
+        circuit.allow()
+        if not await _slots.aacquire(_queue_timeout(deadline)):
+            circuit.release_probe()
+            raise _rejected()
+        started = time.perf_counter()
+        yielded, error = False, None
+        try:
+            async for text in gemini.stream_generate_content(
+                model, prompt, system_instruction, timeout=max(0.1, deadline - time.monotonic())
+            ):
+                yielded = True
+                yield text
+        except Exception as e:
+            error = e
+        finally:
+            _slots.release()
+            _record(circuit, "stream", error, started)
+        if error is None:
+            return
+        delay = None if yielded else _should_retry(error, attempt, deadline, True)
+        if delay is None:
+            raise error
+        metrics.incr("llm.retries")
+        print(f"🔁 Gemini stream failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def aembed(texts, task_type, model=DEFAULT_EMBED_MODEL, timeout=None, retry_rate_limits=True):
+    async def call(remaining):
+        return await gemini.embed_contents(model, texts, task_type, timeout=remaining)
+
+    return await _acall("embed", model, timeout or EMBED_TIMEOUT, call, retry_rate_limits)
+
+
+def stats():
+    return {
+        "in_flight": _slots.in_use,
+        "max_concurrency": _slots.limit,
+        "circuits": {name: b.state for name, b in list(_breakers.items())},
+    }
@@ -0,0 +1,186 @@
+# core/lookups.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import metrics
+
+# -----------------------
+# HOT LOOKUP CACHE
+# -----------------------
+# Rows read on nearly every request, kept in the shared Django cache (CACHES)
+# so every worker process sees the same entries and invalidations:
+#   user:<id>        the user behind a JWT, without the password hash
+#   chat_docs:<id>   ids of the documents mapped to a chat, in mapping order
+#   document:<id>    the document fields the chat path needs
+# Model signals delete the affected keys on every save and delete, and again
+# when the transaction commits; TTL bounds what bulk queryset updates (which
+# send no signals) can leave stale.
+ENABLED = getattr(settings, "LOOKUP_CACHE_ENABLED", True)
+TTL = getattr(settings, "LOOKUP_CACHE_TTL", 300)
+ALIAS = getattr(settings, "LOOKUP_CACHE_ALIAS", "default")
+
+DOCUMENT_FIELDS = ("id", "user_id", "content_id", "title", "file", "uploaded_at", "updated_at")
+
+_MISSING = object()
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def _key(kind, pk):
+    return f"lookup:{kind}:{pk}"
+
+
+def _get(kind, pk, load):
+    """Cached value of `kind` for `pk`, or `load()` on a miss (cached unless None)."""
+    if not ENABLED:
+        return load()
+    key = _key(kind, pk)
+    try:
+        value = _cache().get(key, _MISSING)
+    except Exception as e:
+        # A cache that's down costs a query, not the request
+        metrics.incr("lookup_cache.errors")
+        print("⚠️ Lookup cache unavailable:", e)
+        return load()
+    if value is not _MISSING:
+        metrics.incr(f"lookup_cache.{kind}.hits")
+        return value
+
+    metrics.incr(f"lookup_cache.{kind}.misses")
+    value = load()
+    if value is not None:
+        try:
+            _cache().set(key, value, TTL)
+        except Exception:
+            metrics.incr("lookup_cache.errors")
+    return value
+
+
+def invalidate(kind, *pks):
+    if not ENABLED or not pks:
+        return
+    try:
+        _cache().delete_many([_key(kind, pk) for pk in pks])
+        metrics.incr(f"lookup_cache.{kind}.invalidations", len(pks))
+    except Exception:
+        metrics.incr("lookup_cache.errors")
+
+
+# -----------------------
+# USERS
+# -----------------------
+def user(pk):
+    """The user with primary key `pk`, or None. The password is left deferred (loaded if accessed)."""
+    User = get_user_model()
+    names = [f.attname for f in User._meta.concrete_fields if f.name != "password"]
+
+    def load():
+        row = User.objects.filter(pk=pk).values_list(*names).first()
+        return dict(zip(names, row)) if row else None
+
+    fields = _get("user", pk, load)
+    if fields is None:
+        return None
+    # Only the loaded fields are written back if the instance is ever saved
+    return User.from_db("default", list(fields), list(fields.values()))
+
+
+# -----------------------
+# CHATS / DOCUMENTS
+# -----------------------
+def chat_document_ids(chat_id):
+    from documents.models import DocumentChatMapping
+
+    return _get("chat_docs", chat_id, lambda: list(
+        DocumentChatMapping.objects.filter(chat_id=chat_id).order_by("created_at").values_list("document_id", flat=True)
+    ))
+
+
+def documents(ids):
+    """Document instances (DOCUMENT_FIELDS loaded) for `ids`, in that order; missing ids are skipped."""
+    from documents.models import Document
+
+    ids = list(ids)
+    if not ids:
+        return []
+    found = {}
+    if ENABLED:
+        try:
+            cached = _cache().get_many([_key("document", pk) for pk in ids])
+            found = {pk: cached[_key("document", pk)] for pk in ids if _key("document", pk) in cached}
+        except Exception:
+            metrics.incr("lookup_cache.errors")
+        metrics.incr("lookup_cache.document.hits", len(found))
+        metrics.incr("lookup_cache.document.misses", len(set(ids) - set(found)))
+
+    missing = [pk for pk in dict.fromkeys(ids) if pk not in found]
+    if missing:
+        loaded = {
+            row["id"]: row for row in Document.objects.filter(pk__in=missing).values(*DOCUMENT_FIELDS)
+        }
+        found.update(loaded)
+        if ENABLED and loaded:
+            try:
+                _cache().set_many({_key("document", pk): row for pk, row in loaded.items()}, TTL)
+            except Exception:
+                metrics.incr("lookup_cache.errors")
+
+    # from_db() takes values in the model's field order
+    names = [f.attname for f in Document._meta.concrete_fields if f.attname in DOCUMENT_FIELDS]
+    return [
+        Document.from_db("default", names, [found[pk][name] for name in names])
+        for pk in ids if pk in found
+    ]
+
+
+def chat_documents(chat_id):
+    return documents(chat_document_ids(chat_id))
+
+
+# -----------------------
+# INVALIDATION
+# -----------------------
+def _invalidate_after_write(kind, pk, using):
+    invalidate(kind, pk)
+    if transaction.get_connection(using).in_atomic_block:
+        # A concurrent request may re-cache the old row before this commits
+        transaction.on_commit(lambda: invalidate(kind, pk), using=using)
+
+
+def _user_changed(sender, instance, using, **kwargs):
+    _invalidate_after_write("user", instance.pk, using)
+
+
+def _document_changed(sender, instance, using, **kwargs):
+    _invalidate_after_write("document", instance.pk, using)
+
+
+def _mapping_changed(sender, instance, using, **kwargs):
+    _invalidate_after_write("chat_docs", instance.chat_id, using)
+
+
+def connect_signals():
+    """Called from CoreConfig.ready()."""
+    from documents.models import Document, DocumentChatMapping
+
+    for signal in (post_save, post_delete):
+        signal.connect(_user_changed, sender=settings.AUTH_USER_MODEL, dispatch_uid=f"lookups_user_{signal}")
+        signal.connect(_document_changed, sender=Document, dispatch_uid=f"lookups_document_{signal}")
+        signal.connect(_mapping_changed, sender=DocumentChatMapping, dispatch_uid=f"lookups_mapping_{signal}")
+
+
+def stats():
+    out = {"enabled": ENABLED, "backend": settings.CACHES[ALIAS]["BACKEND"], "errors": metrics.get("lookup_cache.errors")}
+    for kind in ("user", "chat_docs", "document"):
+        out[kind] = {
+            "hits": metrics.get(f"lookup_cache.{kind}.hits"),
+            "misses": metrics.get(f"lookup_cache.{kind}.misses"),
+            "hit_rate": metrics.hit_rate(f"lookup_cache.{kind}"),
+            "invalidations": metrics.get(f"lookup_cache.{kind}.invalidations"),
+        }
+    return out
@@ -0,0 +1,282 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend import database
+from chat.models import Chat, Message
+from documents import text_store
+from documents.models import Document, DocumentChatMapping, DocumentContent, IngestionJob
+from documents.views import ListDocumentsView
+
+OPS = ("upload", "chat", "list")
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+# -----------------------
+# WORKLOAD
+# -----------------------
+class Workload:
+    """
+    The database side of our request mix, run through the ORM as the views do:
+
+    - upload: the upload transaction (duplicate lookup, then content,
+      document, chat mapping and job), then the ingestion worker's claim,
+      progress updates, text store write and completion;
+    - chat: the prompt's reads (chat row, recent messages, text spans) and the
+      two Message rows the history writer inserts;
+    - list: GET /api/documents/ through its view (ETag aggregate + one page).
+
+    Each operation ends like a request does, with close_old_connections(), so
+    CONN_MAX_AGE decides whether the next one reconnects.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.factory = APIRequestFactory()
+        self.list_view = ListDocumentsView.as_view()
+
+    def seed(self, documents, messages):
+        self.user = get_user_model().objects.create(
+            username=f"bench-db-{uuid.uuid4().hex[:8]}", email=f"bench-db-{uuid.uuid4().hex[:8]}@example.invalid"
+        )
+        self.chat = Chat.objects.create(user=self.user, title="bench")
+        self.content_ids = [self.upload(i) for i in range(documents)]
+        Message.objects.bulk_create([
+            Message(chat=self.chat, role="user" if i % 2 == 0 else "assistant", content=f"message {i}", tokens=3)
+            for i in range(messages)
+        ])
+
+    def cleanup(self):
+        Document.objects.filter(user=self.user).delete()
+        DocumentContent.objects.filter(pk__in=self.content_ids).delete()
+        self.user.delete()
+
+    def upload(self, n):
+        digest = uuid.uuid4().hex + uuid.uuid4().hex
+        with transaction.atomic():
+            # Like dedup.store_upload: look for identical content, then write
+            DocumentContent.objects.filter(sha256=digest).first()
+            content = DocumentContent.objects.create(
+                sha256=digest,
+                file=f"documents/bench/{n}.txt",
+                size=len(self.text),
+                original_name=f"bench-{n}.txt",
+                source_document_id=0,
+                ref_count=1,
+            )
+            doc = Document.objects.create(user=self.user, file=content.file.name, title=f"bench-{n}.txt", content=content)
+            content.source_document_id = doc.id
+            content.collection_name = f"document_{doc.id}"
+            content.save(update_fields=["source_document_id", "collection_name"])
+            DocumentChatMapping.objects.create(chat_id=self.chat.id, document=doc)
+            job = IngestionJob.objects.create(content=content, document=doc)
+
+        jobs = IngestionJob.objects.filter(pk=job.pk)
+        jobs.update(status=IngestionJob.STATUS_RUNNING, attempts=F("attempts") + 1,
+                    started_at=timezone.now(), heartbeat_at=timezone.now())
+        for embedded in (10, 20, 30):
+            jobs.update(chunks_embedded=embedded, heartbeat_at=timezone.now())
+        text_store.save(content, self.text, [0])
+        jobs.update(status=IngestionJob.STATUS_DONE, finished_at=timezone.now())
+        return content.pk
+
+    def chat_turn(self, rng):
+        Chat.objects.filter(pk=self.chat.pk).values("pk", "summary", "summarized_upto").first()
+        list(
+            Message.objects.filter(chat_id=self.chat.pk)
+            .order_by("-created_at", "-id")
+            .values_list("id", "role", "content", "tokens")[:200]
+        )
+        start = rng.randrange(max(1, len(self.text) - 4000))
+        text_store.read_spans(rng.choice(self.content_ids), [(start, start + 1500), (start + 2500, start + 4000)])
+        Message.objects.bulk_create([
+            Message(chat_id=self.chat.pk, role="user", content="question", tokens=2),
+            Message(chat_id=self.chat.pk, role="assistant", content="answer", tokens=2),
+        ])
+
+    def list_page(self):
+        request = self.factory.get("/api/documents/?limit=50")
+        force_authenticate(request, user=self.user)
+        response = self.list_view(request)
+        if response.status_code != 200:
+            raise RuntimeError(f"listing returned {response.status_code}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark database profiles (backend/database.py) under a concurrent mix of uploads, "
+        "chat turns and document listings, run by threads with one connection each. Reports "
+        "throughput, p50/p99 per operation, \"database is locked\" errors and connections opened. "
+        "SQLite profiles run on a temporary database; postgres uses DATABASE_URL (already migrated) "
+        "and removes its rows afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profile", action="append", choices=database.PROFILES,
+                            help="Default: sqlite-default and sqlite (and postgres with DATABASE_URL)")
+        parser.add_argument("--uploaders", type=int, default=2)
+        parser.add_argument("--chatters", type=int, default=6)
+        parser.add_argument("--listers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--text-kb", type=int, default=64, help="Extracted text per uploaded document")
+        parser.add_argument("--conn-max-age", type=int, help="Override the profile's CONN_MAX_AGE")
+
+    def handle(self, *args, **opts):
+        profiles = opts["profile"] or ["sqlite-default", "sqlite"] + (["postgres"] if os.getenv("DATABASE_URL") else [])
+        words = "The quarterly budget for the northern region was approved by the board. ".split()
+        rng = random.Random(5)
+        text = " ".join(rng.choice(words) for _ in range(opts["text_kb"] * 1024 // 6))[:opts["text_kb"] * 1024]
+
+        rows = []
+        for profile in profiles:
+            root = tempfile.mkdtemp(prefix="bench_db_")
+            try:
+                config = database.profile_config(profile, os.path.join(root, "bench.sqlite3"), os.getenv("DATABASE_URL"))
+                if opts["conn_max_age"] is not None:
+                    config["CONN_MAX_AGE"] = opts["conn_max_age"]
+                rows.append(self._bench(profile, config, Workload(text), opts))
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+
+        self.stdout.write(
+            f"\n{opts['uploaders']} uploaders, {opts['chatters']} chatters, {opts['listers']} listers, "
+            f"{opts['seconds']:g} s each, {opts['text_kb']} KB per upload"
+        )
+        header = f"  {'profile':<16}{'ops/s':>8}"
+        for op in OPS:
+            header += f"{op + ' p50':>12}{'p99':>8}"
+        self.stdout.write(header + f"{'errors':>8}{'connections':>13}")
+        for r in rows:
+            line = f"  {r['profile']:<16}{r['ops'] / r['wall']:>8.1f}"
+            for op in OPS:
+                line += f"{_percentile(r['latency'][op], 50):>12.1f}{_percentile(r['latency'][op], 99):>8.1f}"
+            self.stdout.write(line + f"{r['errors']:>8}{r['connections']:>13}")
+        self.stdout.write("latencies in ms; errors are failed operations (e.g. \"database is locked\")")
+        for r in rows:
+            if r["error_kinds"]:
+                self.stdout.write(f"  {r['profile']}: " + "; ".join(f"{n}× {e}" for e, n in r["error_kinds"].items()))
+
+    def _in_thread(self, fn):
+        """Run `fn` in a fresh thread (fresh connections) and return its result."""
+        result = {}
+
+        def run():
+            try:
+                result["value"] = fn()
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                connections.close_all()
+
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+    def _bench(self, profile, config, workload, opts):
+        saved = connections.settings["default"]
+        connections.settings["default"] = connections.configure_settings({"default": config})["default"]
+        text_store._blocks.clear()
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == "default":
+                opened.append(1)
+
+        connection_created.connect(count)
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        try:
+            with quiet:
+                if profile != "postgres":
+                    self._in_thread(lambda: call_command("migrate", verbosity=0))
+                self._in_thread(lambda: workload.seed(documents=20, messages=200))
+            opened.clear()
+
+            latency = {op: [] for op in OPS}
+            error_kinds = {}
+            lock = threading.Lock()
+            start = threading.Barrier(opts["uploaders"] + opts["chatters"] + opts["listers"])
+            deadline = []
+
+            def worker(op, seed):
+                rng = random.Random(seed)
+                start.wait()
+                n = 0
+                try:
+                    while time.monotonic() < deadline[0]:
+                        began = time.perf_counter()
+                        try:
+                            if op == "upload":
+                                workload.content_ids.append(workload.upload(f"{seed}-{n}"))
+                            elif op == "chat":
+                                workload.chat_turn(rng)
+                            else:
+                                workload.list_page()
+                            elapsed = (time.perf_counter() - began) * 1000
+                            with lock:
+                                latency[op].append(elapsed)
+                        except (OperationalError, RuntimeError) as e:
+                            with lock:
+                                error_kinds[str(e)] = error_kinds.get(str(e), 0) + 1
+                        finally:
+                            # End of request
+                            close_old_connections()
+                        n += 1
+                finally:
+                    connections.close_all()
+
+            threads = [
+                threading.Thread(target=worker, args=(op, i))
+                for i, op in enumerate(
+                    ["upload"] * opts["uploaders"] + ["chat"] * opts["chatters"] + ["list"] * opts["listers"]
+                )
+            ]
+            deadline.append(time.monotonic() + opts["seconds"] + 0.1)
+            began = time.perf_counter()
+            with quiet:
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            wall = time.perf_counter() - began
+            connections_opened = len(opened)
+
+            if profile == "postgres":
+                self._in_thread(workload.cleanup)
+        except Exception as e:
+            raise CommandError(f"{profile}: {e}")
+        finally:
+            connection_created.disconnect(count)
+            connections.settings["default"] = saved
+            text_store._blocks.clear()
+
+        return {
+            "profile": profile,
+            "ops": sum(len(v) for v in latency.values()),
+            "wall": wall,
+            "latency": latency,
+            "errors": sum(error_kinds.values()),
+            "error_kinds": error_kinds,
+            "connections": connections_opened,
+        }
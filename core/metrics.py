@@ -0,0 +1,59 @@
+# core/metrics.py
+import threading
+from collections import defaultdict, deque
+
+# In-process counters (cache hits/misses, saved latency, ...).
+# Each worker process keeps its own numbers; they reset on restart.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+# Latest samples per series (e.g. latency saved per cache hit) for percentiles
+_samples = defaultdict(lambda: deque(maxlen=1000))
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name, value):
+    with _lock:
+        _samples[name].append(value)
+
+
+def percentile(name, pct):
+    with _lock:
+        values = sorted(_samples.get(name, ()))
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def get(name):
+    return _counters.get(name, 0)
+
+
+def hit_rate(prefix):
+    """`<prefix>.hits / (<prefix>.hits + <prefix>.misses)`, or None before any lookup."""
+    hits = get(f"{prefix}.hits")
+    total = hits + get(f"{prefix}.misses")
+    return round(hits / total, 4) if total else None
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def report():
+    """
+    Counters, a `<prefix>.hit_rate` for every `<prefix>.hits`/`.misses` pair
+    and p50/p99 of every observed series.
+    """
+    counters = snapshot()
+    prefixes = {name.rsplit(".", 1)[0] for name in counters if name.endswith((".hits", ".misses"))}
+    for prefix in sorted(prefixes):
+        counters[f"{prefix}.hit_rate"] = hit_rate(prefix)
+    for name in list(_samples):
+        counters[f"{name}.p50"] = percentile(name, 50)
+        counters[f"{name}.p99"] = percentile(name, 99)
+    return counters
@@ -0,0 +1,69 @@
+# core/pagination.py
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+# -----------------------
+# KEYSET (CURSOR) PAGINATION
+# -----------------------
+# Pages are read newest first by seeking past the last row of the previous
+# page, e.g. WHERE (created_at, id) < (cursor) ORDER BY created_at DESC, id DESC.
+# With an index on those columns every page costs the same, where OFFSET would
+# scan and discard all the rows before it. Cursors are opaque to clients.
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts times to milliseconds, which would skip rows
+        # created in the same millisecond as the page's last one
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=_CursorEncoder).encode()).decode()
+
+
+def decode_cursor(cursor, fields):
+    """Cursor -> values converted by the model `fields`; ValueError if malformed."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if not isinstance(raw, list) or len(raw) != len(fields):
+            raise ValueError("wrong cursor length")
+        return [field.to_python(value) for field, value in zip(fields, raw)]
+    except ValidationError as e:
+        raise ValueError(str(e))
+
+
+def _before(ordering, values):
+    """(f1, f2, ...) < (v1, v2, ...) as a filter."""
+    condition = Q()
+    for i, name in enumerate(ordering):
+        equal = dict(zip(ordering[:i], values[:i]))
+        condition |= Q(**equal, **{f"{name}__lt": values[i]})
+    return condition
+
+
+def _value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def keyset_page(queryset, ordering, cursor=None, limit=50):
+    """
+    Up to `limit` rows of `queryset` in descending `ordering` (field names,
+    the last one unique, e.g. ("created_at", "id")) after `cursor`, and the
+    cursor of the next page or None. Raises ValueError for a malformed cursor.
+    """
+    if cursor:
+        fields = [queryset.model._meta.get_field(name) for name in ordering]
+        queryset = queryset.filter(_before(ordering, decode_cursor(cursor, fields)))
+    rows = list(queryset.order_by(*[f"-{name}" for name in ordering])[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([_value(rows[-1], name) for name in ordering])
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from documents.models import Document, DocumentContent
+from . import lookups
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class LookupInvalidationTests(TestCase):
+    def setUp(self):
+        lookups._cache().clear()
+        self.user = get_user_model().objects.create(username="reader", email="reader@example.invalid")
+        self.old = DocumentContent.objects.create(sha256="a" * 64, file="old.txt", source_document_id=0, ref_count=1)
+        self.new = DocumentContent.objects.create(sha256="b" * 64, file="new.txt", source_document_id=0, ref_count=1)
+        self.document = Document.objects.create(user=self.user, file="old.txt", title="t", content=self.old)
+
+    def test_row_cached_before_commit_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.document.content = self.new
+                self.document.save()
+                # What a concurrent request could cache while the transaction is open
+                lookups._cache().set(lookups._key("document", self.document.pk), {"stale": True})
+        self.assertEqual(lookups.documents([self.document.pk])[0].content_id, self.new.pk)
+
+    def test_user_save_invalidates(self):
+        self.assertTrue(lookups.user(self.user.pk).is_active)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(lookups.user(self.user.pk).is_active)
@@ -1,4 +1,9 @@
 from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from . import llm_gateway, lookups, metrics
 # Import your existing RAG function here
 from .utils import answer_question  # adjust import if needed
 
@@ -19,3 +24,10 @@ def show_result(request):
         })
     else:
         return render(request, 'frontend/ask.html')
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Process-local cache/latency counters (see core/metrics.py), LLM gateway and lookup cache state."""
+    return Response({**metrics.report(), "llm": llm_gateway.stats(), "lookup_cache": lookups.stats()})
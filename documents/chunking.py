@@ -0,0 +1,280 @@
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    start: int   # character offsets of `text` in the document text
+    end: int
+    page: int    # 1-based page the chunk starts on
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for chunking and the embedding TPM budget
+    return max(1, len(text) // 4)
+
+
+# -----------------------
+# BASE CHUNKER
+# -----------------------
+class Chunker:
+    """
+    Splits a stream of text pieces (pages) into `Chunk`s. Subclasses implement
+    `_spans(pieces)` yielding `(start, end, text)`; the base class numbers the
+    chunks and works out which page each one starts on.
+    """
+
+    name = "base"
+
+    def chunk_pages(self, pages: Iterable[str]) -> Iterator[Chunk]:
+        page_offsets = []
+
+        def tracked():
+            offset = 0
+            for page in pages:
+                page_offsets.append(offset)
+                offset += len(page)
+                yield page
+
+        for index, (start, end, text) in enumerate(self._spans(tracked())):
+            yield Chunk(index, text, start, end, bisect_right(page_offsets, start) or 1)
+
+    def chunk_text(self, text: str, page_offsets: Optional[List[int]] = None) -> Iterator[Chunk]:
+        """Chunk an already extracted text; `page_offsets` restores page numbers."""
+        if not text:
+            return iter(())
+        bounds = list(page_offsets or [0]) + [len(text)]
+        pages = (text[a:b] for a, b in zip(bounds, bounds[1:]))
+        return self.chunk_pages(pages)
+
+    def _spans(self, pieces: Iterable[str]):
+        raise NotImplementedError
+
+
+# -----------------------
+# FIXED CHARACTERS
+# -----------------------
+class FixedCharChunker(Chunker):
+    """`chunk_size` characters with `overlap` characters repeated between neighbours."""
+
+    name = "fixed"
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def _spans(self, pieces):
+        size = self.chunk_size
+        step = size - self.overlap if size > self.overlap else size
+        buf = ""
+        buf_start = 0      # offset of buf[0] in the whole text
+        start = 0          # offset of the next chunk
+        emitted_end = 0
+
+        # Only the unfinished tail is buffered: about one page plus one chunk
+        for piece in pieces:
+            if not piece:
+                continue
+            buf = buf[start - buf_start:] + piece
+            buf_start = start
+            pos = 0
+            while len(buf) - pos >= size:
+                yield start, start + size, buf[pos:pos + size]
+                emitted_end = start + size
+                start += step
+                pos += step
+
+        tail = buf[start - buf_start:]
+        if tail and start + len(tail) > emitted_end:
+            yield start, start + len(tail), tail
+
+
+# -----------------------
+# SENTENCE / PARAGRAPH UNITS
+# -----------------------
+_BOUNDARY = re.compile(r"[.!?][\"')\]]*(\s+)|\n[ \t]*\n\s*")
+
+
+@dataclass
+class _Unit:
+    start: int
+    text: str
+    sep: str          # whitespace that followed it in the source
+    paragraph: bool   # `sep` is a paragraph break
+
+
+def _split_long(start, text, sep, paragraph, hard_limit):
+    while len(text) > hard_limit:
+        cut = text.rfind(" ", 0, hard_limit)
+        gap = " "
+        if cut <= 0:
+            cut, gap = hard_limit, ""
+        yield _Unit(start, text[:cut], gap, False)
+        start += cut + len(gap)
+        text = text[cut + len(gap):]
+    if text:
+        yield _Unit(start, text, sep, paragraph)
+
+
+def _iter_units(pieces: Iterable[str], hard_limit: int) -> Iterator[_Unit]:
+    """
+    Sentences (split after . ! ? and at blank lines), never longer than
+    `hard_limit` chars. `text + sep` of consecutive units reproduces the source.
+    """
+    buf = ""
+    buf_start = 0
+
+    for piece in pieces:
+        buf += piece
+        pos = 0
+        for m in _BOUNDARY.finditer(buf):
+            if m.end() == len(buf):
+                # The separator may continue in the next piece
+                break
+            text_end = m.start(1) if m.group(1) is not None else m.start()
+            text, sep = buf[pos:text_end], buf[text_end:m.end()]
+            if text:
+                yield from _split_long(buf_start + pos, text, sep, sep.count("\n") >= 2, hard_limit)
+            pos = m.end()
+        buf = buf[pos:]
+        buf_start += pos
+
+    tail = buf.rstrip()
+    if tail:
+        yield from _split_long(buf_start, tail, "", True, hard_limit)
+
+
+class _SentencePacker(Chunker):
+    """Packs whole sentences into chunks up to a size budget (`_size`)."""
+
+    def __init__(self, max_size: int, overlap_size: int = 0):
+        self.max_size = max_size
+        self.overlap_size = overlap_size
+
+    def _size(self, text: str) -> int:
+        raise NotImplementedError
+
+    def _hard_limit(self) -> int:
+        return self.max_size
+
+    def _overlap(self, units: List[_Unit]) -> List[_Unit]:
+        """Trailing sentences repeated at the start of the next chunk."""
+        return []
+
+    def _spans(self, pieces):
+        current: List[_Unit] = []
+        size = 0
+
+        def emit(units):
+            text = "".join(u.text + u.sep for u in units[:-1]) + units[-1].text
+            return units[0].start, units[0].start + len(text), text
+
+        for unit in _iter_units(pieces, self._hard_limit()):
+            usize = self._size(unit.text)
+            if current and size + usize > self.max_size:
+                yield emit(current)
+                current = [] if current[-1].paragraph else self._overlap(current)
+                size = sum(self._size(u.text) for u in current)
+                if size + usize > self.max_size:
+                    current, size = [], 0
+            current.append(unit)
+            size += usize
+            # Prefer to end chunks on paragraph breaks once they are reasonably full
+            if unit.paragraph and size >= self.max_size // 2:
+                yield emit(current)
+                current, size = [], 0
+
+        if current:
+            yield emit(current)
+
+
+# -----------------------
+# SENTENCE / PARAGRAPH BOUNDARIES
+# -----------------------
+class SentenceChunker(_SentencePacker):
+    """
+    Whole sentences up to `chunk_size` characters, closing early on paragraph
+    breaks; `overlap_sentences` trailing sentences are repeated (default none).
+    """
+
+    name = "sentence"
+
+    def __init__(self, chunk_size: int = 1000, overlap_sentences: int = 0):
+        super().__init__(chunk_size)
+        self.overlap_sentences = overlap_sentences
+
+    def _size(self, text):
+        return len(text) + 1
+
+    def _overlap(self, units):
+        if not self.overlap_sentences:
+            return []
+        return units[-self.overlap_sentences:]
+
+
+# -----------------------
+# TOKEN BUDGET + ADAPTIVE OVERLAP
+# -----------------------
+class TokenChunker(_SentencePacker):
+    """
+    Whole sentences up to `max_tokens` estimated tokens. Overlap is adaptive:
+    no overlap after a paragraph break, otherwise the trailing sentences that
+    fit in `max_overlap_tokens` (so a short closing sentence carries over but a
+    long one is not duplicated).
+    """
+
+    name = "token"
+
+    def __init__(self, max_tokens: int = 256, max_overlap_tokens: int = 40):
+        super().__init__(max_tokens, max_overlap_tokens)
+
+    def _size(self, text):
+        return estimate_tokens(text)
+
+    def _hard_limit(self):
+        return self.max_size * 4
+
+    def _overlap(self, units):
+        carried, size = [], 0
+        for unit in reversed(units):
+            size += self._size(unit.text)
+            if size > self.overlap_size:
+                break
+            carried.insert(0, unit)
+        # Never carry over the whole chunk
+        return carried if len(carried) < len(units) else []
+
+
+STRATEGIES = {
+    FixedCharChunker.name: FixedCharChunker,
+    SentenceChunker.name: SentenceChunker,
+    TokenChunker.name: TokenChunker,
+}
+
+
+def get_chunker(strategy: Optional[str] = None, **options) -> Chunker:
+    """Chunker for `strategy` (default: settings.CHUNK_STRATEGY) with settings-based sizes."""
+    from django.conf import settings
+
+    strategy = strategy or getattr(settings, "CHUNK_STRATEGY", FixedCharChunker.name)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunk strategy {strategy!r}; expected one of {sorted(STRATEGIES)}")
+
+    if not options:
+        if strategy == FixedCharChunker.name:
+            options = {
+                "chunk_size": getattr(settings, "CHUNK_SIZE", 1000),
+                "overlap": getattr(settings, "CHUNK_OVERLAP", 200),
+            }
+        elif strategy == SentenceChunker.name:
+            options = {"chunk_size": getattr(settings, "CHUNK_SIZE", 1000)}
+        else:
+            options = {
+                "max_tokens": getattr(settings, "CHUNK_MAX_TOKENS", 256),
+                "max_overlap_tokens": getattr(settings, "CHUNK_MAX_OVERLAP_TOKENS", 40),
+            }
+    return STRATEGIES[strategy](**options)
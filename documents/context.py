@@ -0,0 +1,221 @@
+from django.conf import settings
+
+from core import metrics
+from . import text_store
+from .chunking import _BOUNDARY, estimate_tokens
+from .models import Document
+
+# -----------------------
+# CONTEXT ASSEMBLY SETTINGS
+# -----------------------
+# Retrieved chunks overlap by CHUNK_OVERLAP characters and are often
+# neighbours, so sending them one by one repeats text. Hits of the same
+# document are widened to whole sentences (reaching at most NEIGHBOR_CHARS into
+# the neighbouring chunks), merged into continuous spans by their character
+# offsets and cut from the stored text (documents/text_store.py); spans are
+# then packed by relevance into TOKEN_BUDGET estimated tokens.
+TOKEN_BUDGET = getattr(settings, "CONTEXT_TOKEN_BUDGET", 1500)
+NEIGHBOR_CHARS = getattr(settings, "CONTEXT_NEIGHBOR_CHARS", 300)
+# Shortest overlap recognised between two chunk texts without offsets
+MIN_TEXT_OVERLAP = 20
+# A span cut to fit the budget must keep at least this many tokens
+MIN_SPAN_TOKENS = 50
+
+
+def _normalized(text):
+    return " ".join(text.split())
+
+
+# -----------------------
+# SPANS FROM OFFSETS
+# -----------------------
+def _windows(document_id, ranges):
+    """
+    Stored text around each (start, end) range of one document, decompressed
+    from the text blocks it overlaps: [(window_start, text)] and the text
+    length, or None while the document has no stored text yet.
+    """
+    row = Document.objects.filter(pk=document_id).values("content_id", "content__text_length").first()
+    if not row or not row["content__text_length"]:
+        return None
+    cuts = [(max(0, start - NEIGHBOR_CHARS), end + NEIGHBOR_CHARS) for start, end in ranges]
+    texts = text_store.read_spans(row["content_id"], cuts)
+    return sorted((left, text) for (left, _), text in zip(cuts, texts)), row["content__text_length"]
+
+
+def _slice(windows, start, end):
+    """Text in [start, end) from overlapping windows sorted by start."""
+    parts, pos = [], start
+    for left, text in windows:
+        if left <= pos < left + len(text):
+            part = text[pos - left:end - left]
+            parts.append(part)
+            pos += len(part)
+            if pos >= end:
+                break
+    return "".join(parts)
+
+
+def _widen(windows, length, start, end):
+    """Move `start` back and `end` forward to sentence boundaries within NEIGHBOR_CHARS."""
+    before = _slice(windows, max(0, start - NEIGHBOR_CHARS), start)
+    boundaries = list(_BOUNDARY.finditer(before))
+    # Not already at a sentence start (or the start of the text)
+    if start > 0 and boundaries and boundaries[-1].end() < len(before):
+        start -= len(before) - boundaries[-1].end()
+
+    last = _slice(windows, max(start, end - 3), end).rstrip()
+    after = _slice(windows, end, min(length, end + NEIGHBOR_CHARS))
+    if end < length and not (last and last[-1] in ".!?\"')]"):
+        boundary = _BOUNDARY.search(after)
+        if boundary:
+            # Keep the punctuation, not the whitespace after it
+            end += boundary.start(1) if boundary.group(1) is not None else boundary.start()
+    return start, end
+
+
+def _offset_spans(document_id, hits):
+    """Merged spans of one document's hits, or None if they can't be cut from the stored text."""
+    ranges = [(h["metadata"]["start"], h["metadata"]["end"]) for h in hits]
+    fetched = _windows(document_id, ranges)
+    if fetched is None:
+        return None
+    windows, length = fetched
+
+    widened = sorted(
+        ((*_widen(windows, length, start, end), hit) for (start, end), hit in zip(ranges, hits)),
+        key=lambda w: w[:2],
+    )
+    spans = []
+    for start, end, hit in widened:
+        # Overlapping, or separated only by whitespace: one continuous span
+        if spans and (start <= spans[-1]["end"] or not _slice(windows, spans[-1]["end"], start).strip()):
+            span = spans[-1]
+            span["end"] = max(span["end"], end)
+            span["hits"].append(hit)
+        else:
+            spans.append({"start": start, "end": end, "hits": [hit]})
+    for span in spans:
+        span["text"] = _slice(windows, span["start"], span["end"]).strip()
+    return spans
+
+
+# -----------------------
+# SPANS FROM TEXT
+# -----------------------
+def _join(a, b):
+    """`a` + `b` without the longest suffix of `a` that starts `b`, or None if they don't overlap."""
+    for k in range(min(len(a), len(b)), MIN_TEXT_OVERLAP - 1, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return None
+
+
+def _text_spans(hits):
+    """Spans of chunks still indexing (no stored text): consecutive chunks joined on their overlap."""
+    spans = []
+    for hit in sorted(hits, key=lambda h: h["metadata"].get("chunk_index", -1)):
+        index = hit["metadata"].get("chunk_index")
+        text = hit["text"].strip()
+        if spans and index is not None and index == spans[-1]["last_index"] + 1:
+            joined = _join(spans[-1]["text"], text)
+            if joined is not None:
+                spans[-1].update(text=joined, last_index=index)
+                spans[-1]["hits"].append(hit)
+                continue
+        spans.append({"text": text, "last_index": index if index is not None else -2, "hits": [hit]})
+    return spans
+
+
+# -----------------------
+# ASSEMBLY
+# -----------------------
+def _pack(spans, budget):
+    """
+    Spans in relevance order that fit `budget`. The first one that doesn't is
+    cut at a word if enough budget is left, otherwise skipped for shorter ones.
+    """
+    packed, used = [], 0
+    for span in spans:
+        tokens = estimate_tokens(span["text"])
+        if used + tokens <= budget:
+            packed.append(span)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= MIN_SPAN_TOKENS:
+            cut = span["text"][:remaining * 4 - 2]
+            cut = cut[:cut.rfind(" ")] if " " in cut else cut
+            packed.append({**span, "text": cut + " …", "truncated": True})
+            used += estimate_tokens(packed[-1]["text"])
+            break
+    return packed, used
+
+
+def assemble(results, token_budget=None):
+    """
+    Prompt context from ranked `query_documents` results. Returns
+    `{"spans", "stats"}`: spans (document_id, file_name, page, chunk_indexes,
+    text) in relevance order, and stats comparing the tokens sent with what
+    the chunks would have cost one by one.
+    """
+    budget = token_budget or TOKEN_BUDGET
+    hits = [dict(r, rank=rank) for rank, r in enumerate(results) if (r.get("text") or "").strip()]
+    naive = sum(estimate_tokens(h["text"].strip()) for h in hits)
+
+    by_document = {}
+    for hit in hits:
+        by_document.setdefault(hit["document_id"], []).append(hit)
+
+    spans = []
+    for document_id, doc_hits in by_document.items():
+        with_offsets = all(
+            isinstance(h["metadata"].get("start"), int) and isinstance(h["metadata"].get("end"), int)
+            for h in doc_hits
+        )
+        doc_spans = _offset_spans(document_id, doc_hits) if with_offsets else None
+        for span in doc_spans if doc_spans is not None else _text_spans(doc_hits):
+            first = min(span["hits"], key=lambda h: h["metadata"].get("chunk_index", 0))
+            spans.append({
+                "document_id": document_id,
+                "file_name": first.get("file_name"),
+                "page": first["metadata"].get("page"),
+                "chunk_indexes": sorted(
+                    h["metadata"]["chunk_index"] for h in span["hits"] if "chunk_index" in h["metadata"]
+                ),
+                "rank": min(h["rank"] for h in span["hits"]),
+                "text": span["text"],
+            })
+
+    # Identical passages in different documents are sent once
+    spans.sort(key=lambda s: (s["rank"], -len(s["text"])))
+    unique, keys = [], []
+    for span in spans:
+        key = _normalized(span["text"])
+        if not key or any(key in kept for kept in keys):
+            continue
+        # A longer passage containing better-ranked ones takes the first one's place
+        contained = [i for i, kept in enumerate(keys) if kept in key]
+        if contained:
+            unique[contained[0]], keys[contained[0]] = {**span, "rank": unique[contained[0]]["rank"]}, key
+            for i in reversed(contained[1:]):
+                del unique[i], keys[i]
+            continue
+        unique.append(span)
+        keys.append(key)
+
+    packed, used = _pack(unique, budget)
+    stats = {
+        "chunks": len(hits),
+        "spans": len(packed),
+        "tokens": used,
+        "tokens_unassembled": naive,
+        "tokens_saved": naive - used,
+        "dropped_spans": len(unique) - len(packed),
+    }
+    metrics.observe("context.tokens", used)
+    metrics.observe("context.tokens_saved", naive - used)
+    metrics.incr("context.tokens_saved_total", max(0, naive - used))
+    print(f"🧩 Context: {stats['chunks']} chunks -> {stats['spans']} spans, "
+          f"{used} tokens ({naive - used:+d} saved)")
+    return {"spans": packed, "stats": stats}
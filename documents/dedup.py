@@ -0,0 +1,200 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Document, DocumentContent, IngestionJob
+
+# Uploads are hashed while they are written here, then moved into place
+UPLOAD_TMP_DIR = "tmp_uploads"
+
+
+# -----------------------
+# HASH WHILE STORING
+# -----------------------
+def _spool_and_hash(file_obj):
+    """Write the upload to a temp file next to MEDIA_ROOT, hashing it in the same pass."""
+    tmp_dir = default_storage.path(UPLOAD_TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for block in file_obj.chunks():
+                h.update(block)
+                out.write(block)
+                size += len(block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, h.hexdigest(), size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _add_reference(content_id):
+    DocumentContent.objects.filter(pk=content_id).update(ref_count=F("ref_count") + 1)
+    return DocumentContent.objects.select_for_update().get(pk=content_id)
+
+
+def _reference_or_store(user, tmp_path, digest, size, filename):
+    """
+    Inside a transaction: add a reference to the content with `digest`, or move
+    the temp file into place as a new content. Returns `(content, created)`;
+    a new content still needs its `source_document_id` and `collection_name`.
+    """
+    content = DocumentContent.objects.select_for_update().filter(sha256=digest).first()
+    if content is not None:
+        _remove(tmp_path)
+        return _add_reference(content.pk), False
+
+    name = default_storage.get_available_name(f"documents/user_{user.id}/{filename}")
+    dest = default_storage.path(name)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(tmp_path, dest)
+    try:
+        with transaction.atomic():
+            content = DocumentContent.objects.create(
+                sha256=digest,
+                file=name,
+                size=size,
+                original_name=filename,
+                source_document_id=0,
+                ref_count=1,
+            )
+    except IntegrityError:
+        # Another request stored the same bytes first
+        _remove(dest)
+        return _add_reference(DocumentContent.objects.get(sha256=digest).pk), False
+    return content, True
+
+
+def store_upload(user, file_obj, filename):
+    """
+    Store an upload as a Document, reusing the stored file, extracted text and
+    vectors of an identical earlier upload (any user) when the sha256 matches.
+    Returns `(document, content, created)`; `created` is False for a duplicate.
+    """
+    tmp_path, digest, size = _spool_and_hash(file_obj)
+
+    try:
+        with transaction.atomic():
+            content, created = _reference_or_store(user, tmp_path, digest, size, filename)
+            doc = Document.objects.create(
+                user=user,
+                file=content.file.name,
+                title=filename,
+                content=content,
+            )
+            if created:
+                content.source_document_id = doc.id
+                content.collection_name = f"document_{doc.id}"
+                content.save(update_fields=["source_document_id", "collection_name"])
+    finally:
+        _remove(tmp_path)
+
+    if not created:
+        print(f"♻️ Upload {filename!r} matches stored content {content.pk} (refs={content.ref_count})")
+    return doc, content, created
+
+
+def has_other_document(user, content, document):
+    """Whether `user` already has a document besides `document` on `content`."""
+    return Document.objects.filter(user=user, content=content).exclude(pk=document.pk).exists()
+
+
+# -----------------------
+# REPLACE (NEW REVISION)
+# -----------------------
+def replace_upload(document, file_obj, filename):
+    """
+    Point an existing Document (same id, same chat mapping) at a new revision
+    of its file. Returns `(content, created)`:
+
+    - same bytes as now: nothing changes, `created` is False;
+    - bytes stored before: the document shares that content, `created` is False;
+    - new bytes: a new content. If the old content was used only by this
+      document and has no job queued or running, it hands over its Chroma
+      collection, so re-indexing only embeds the chunks that changed (see
+      embeddings.index_chunks). A job still writing old-revision chunks would
+      leave them in the handed-over collection, so then the new content gets
+      a fresh one.
+
+    The previous content is released once the transaction commits.
+    """
+    tmp_path, digest, size = _spool_and_hash(file_obj)
+    old_id = document.content_id
+
+    try:
+        with transaction.atomic():
+            old = DocumentContent.objects.select_for_update().get(pk=old_id)
+            if old.sha256 == digest:
+                return old, False
+
+            content, created = _reference_or_store(document.user, tmp_path, digest, size, filename)
+            if created:
+                content.source_document_id = document.id
+                indexing = old.jobs.filter(
+                    status__in=[IngestionJob.STATUS_QUEUED, IngestionJob.STATUS_RUNNING]
+                ).exists()
+                if old.ref_count == 1 and not indexing:
+                    # The vectors go with the collection, and so does their backend
+                    content.collection_name, old.collection_name = old.collection_name, ""
+                    content.embedding_backend, old.embedding_backend = old.embedding_backend, ""
+                    content.embedding_dims, old.embedding_dims = old.embedding_dims, 0
+                    old.save(update_fields=["collection_name", "embedding_backend", "embedding_dims"])
+                else:
+                    content.collection_name = f"document_{document.id}_{digest[:12]}"
+                content.save(update_fields=[
+                    "source_document_id", "collection_name", "embedding_backend", "embedding_dims",
+                ])
+
+            document.content = content
+            document.file = content.file.name
+            document.title = filename
+            document.save(update_fields=["content", "file", "title", "updated_at"])
+            transaction.on_commit(lambda: release_content(old_id))
+    finally:
+        _remove(tmp_path)
+
+    print(f"🔁 Document {document.id} now uses content {content.pk} (new={created})")
+    return content, created
+
+
+# -----------------------
+# RELEASE
+# -----------------------
+def release_content(content_id):
+    """
+    Drop one reference to a DocumentContent. The last reference removes the
+    stored file, its Chroma collection and the row. Returns True if removed.
+    """
+    from .embeddings import delete_collection
+
+    with transaction.atomic():
+        DocumentContent.objects.filter(pk=content_id, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+        content = DocumentContent.objects.select_for_update().filter(pk=content_id).first()
+        if content is None or content.ref_count > 0 or content.documents.exists():
+            return False
+        file_name = content.file.name
+        collection_name, backend, dims = content.collection_name, content.embedding_backend, content.embedding_dims
+        content.delete()
+
+    try:
+        default_storage.delete(file_name)
+    except Exception as e:
+        print("File delete failed:", e)
+    if collection_name:
+        delete_collection(collection_name, backend, dims)
+    print(f"🗑️ Released content {content_id} ({collection_name})")
+    return True
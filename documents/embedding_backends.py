@@ -0,0 +1,209 @@
+import os
+import threading
+from typing import List
+
+import numpy as np
+from django.conf import settings
+
+from core import llm_gateway
+
+# -----------------------
+# EMBEDDING BACKENDS
+# -----------------------
+# A backend turns texts into vectors with one model. EMBEDDING_BACKEND picks
+# the one new documents are indexed with; every DocumentContent records the
+# backend of its vectors (`embedding_backend`) and questions about it are
+# embedded with that same backend, so vectors of different models never meet
+# in one ranking or one Chroma collection (see vector_store spaces).
+#
+# gemini       text-embedding-004 over the network (LLM gateway, RPM/TPM budgets)
+# onnx-minilm  all-MiniLM-L6-v2 on local CPUs through onnxruntime, no API calls
+#
+# EMBEDDING_DIMS stores only the first N dimensions of each vector,
+# re-normalized (text-embedding-004 is trained so that prefixes work as
+# smaller embeddings). It is recorded per collection too (`embedding_dims`)
+# and questions are cut to the same width.
+GEMINI = "gemini"
+ONNX_MINILM = "onnx-minilm"
+# Collections indexed before backends were recorded hold Gemini vectors
+DEFAULT_BACKEND = GEMINI
+
+
+class EmbeddingBackend:
+    """
+    `embed_batch(texts, task_type)` returns one vector per text; `aembed_batch`
+    is its async twin, or None when the work is local and runs in a thread.
+    `batch_size` / `max_workers` size the EmbeddingEngine in front of it and
+    `remote` backends get the RPM/TPM limiter.
+    """
+    name = ""
+    model_name = ""
+    remote = True
+    batch_size = 100
+    max_workers = 4
+    aembed_batch = None
+
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class GeminiBackend(EmbeddingBackend):
+    name = GEMINI
+    model_name = "models/text-embedding-004"
+
+    def __init__(self):
+        self.batch_size = getattr(settings, "EMBED_BATCH_SIZE", 100)
+        self.max_workers = getattr(settings, "EMBED_MAX_CONCURRENCY", 4)
+
+    def embed_batch(self, texts, task_type):
+        """One batchEmbedContents round trip for all `texts`, through core.llm_gateway."""
+        # EmbeddingEngine backs off on 429s itself; the gateway retries the rest
+        return llm_gateway.embed(texts, task_type, model=self.model_name, retry_rate_limits=False)
+
+    async def aembed_batch(self, texts, task_type):
+        """`embed_batch` over the async REST client (core/gemini.py)."""
+        return await llm_gateway.aembed(texts, task_type, model=self.model_name, retry_rate_limits=False)
+
+
+class OnnxMiniLMBackend(EmbeddingBackend):
+    """
+    all-MiniLM-L6-v2 (384 dims, the model behind Chroma's default embedding
+    function) run in-process. One onnxruntime session uses every core
+    (ONNX_THREADS, 0 = all); texts are sorted by length and padded per
+    sub-batch of ONNX_BATCH_SIZE only to the longest text in it, then
+    mean-pooled and L2-normalized. Task types don't apply to this model.
+    """
+    name = ONNX_MINILM
+    model_name = "onnx/all-MiniLM-L6-v2"
+    remote = False
+    max_workers = 1  # the session already spreads one batch over all cores
+    max_tokens = 256
+    model_files = ("model.onnx", "tokenizer.json")
+
+    def __init__(self):
+        self.inference_batch = max(1, getattr(settings, "ONNX_BATCH_SIZE", 32))
+        # The engine hands over several inference batches at a time
+        self.batch_size = self.inference_batch * 8
+        self.threads = getattr(settings, "ONNX_THREADS", 0) or os.cpu_count() or 1
+        self.model_dir = getattr(settings, "ONNX_MODEL_DIR", "") or self._chroma_model_dir()
+        self._lock = threading.Lock()
+        self._session = None
+        self._tokenizer = None
+
+    @staticmethod
+    def _chroma_model_dir():
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        return os.path.join(ONNXMiniLM_L6_V2.DOWNLOAD_PATH, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+
+    def _ensure_model_files(self):
+        if all(os.path.exists(os.path.join(self.model_dir, f)) for f in self.model_files):
+            return
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        if self.model_dir != self._chroma_model_dir():
+            raise RuntimeError(f"ONNX_MODEL_DIR {self.model_dir} has no {' / '.join(self.model_files)}")
+        # One-time download (~80 MB, checksum-verified) into Chroma's model cache
+        print("⬇️ Downloading all-MiniLM-L6-v2 for the ONNX embedding backend")
+        ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            self._ensure_model_files()
+            tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.max_tokens)
+            # Pad to the longest text of each batch, not to max_tokens
+            tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.log_severity_level = 3
+            self._session = onnxruntime.InferenceSession(
+                os.path.join(self.model_dir, "model.onnx"),
+                sess_options=options,
+                providers=["CPUExecutionProvider"],
+            )
+            self._input_names = {i.name for i in self._session.get_inputs()}
+            self._tokenizer = tokenizer
+            print(f"🧠 ONNX embedding model loaded ({self.threads} threads)")
+
+    def _forward(self, texts):
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self._session.run(None, inputs)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def embed_batch(self, texts, task_type):
+        self._load()
+        # Similar lengths in one inference batch means little padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.inference_batch):
+            positions = order[start:start + self.inference_batch]
+            for pos, vec in zip(positions, self._forward([texts[i] for i in positions])):
+                vectors[pos] = vec.tolist()
+        return vectors
+
+
+BACKENDS = {
+    GEMINI: GeminiBackend,
+    ONNX_MINILM: OnnxMiniLMBackend,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def backend_name(name=None) -> str:
+    """`name`, or the deployment's EMBEDDING_BACKEND; '' (never recorded) means DEFAULT_BACKEND."""
+    if name is None:
+        name = getattr(settings, "EMBEDDING_BACKEND", DEFAULT_BACKEND)
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}; expected one of {list(BACKENDS)}")
+    return name
+
+
+def get_backend(name=None) -> EmbeddingBackend:
+    name = backend_name(name)
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
+
+
+def embedding_dims(dims=None) -> int:
+    """`dims`, or the deployment's EMBEDDING_DIMS; 0 = the model's full width."""
+    if dims is None:
+        dims = getattr(settings, "EMBEDDING_DIMS", 0)
+    return max(0, int(dims or 0))
+
+
+def reduce(vectors, dims):
+    """First `dims` dimensions of each vector, L2-normalized again; unchanged for dims=0."""
+    if not dims:
+        return vectors
+    matrix = np.asarray(vectors, dtype=np.float32)[..., :dims]
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return (matrix / np.clip(norms, 1e-12, None)).tolist()
+
+
+def vector_space(name, dims=0) -> str:
+    """vector_store space for a backend and width; the default keeps the original collection names."""
+    name = backend_name(name)
+    if dims:
+        return f"{name}-{dims}"
+    return "" if name == DEFAULT_BACKEND else name
@@ -0,0 +1,107 @@
+import hashlib
+from array import array
+from typing import List, Optional
+
+from django.db.models import F
+from django.utils import timezone
+
+from core import metrics
+from .models import EmbeddingCacheEntry
+
+
+def cache_key(text: str, model_name: str, task_type: str) -> str:
+    h = hashlib.sha256()
+    h.update(model_name.encode())
+    h.update(b"\0")
+    h.update(task_type.encode())
+    h.update(b"\0")
+    h.update(text.encode("utf-8", errors="ignore"))
+    return h.hexdigest()
+
+
+def _pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob) -> List[float]:
+    vec = array("f")
+    vec.frombytes(bytes(blob))
+    return vec.tolist()
+
+
+# -----------------------
+# PERSISTENT EMBEDDING CACHE
+# -----------------------
+class EmbeddingCache:
+    """
+    Content-addressed embedding store in the `EmbeddingCacheEntry` table.
+    Entries survive restarts; once the table grows past `max_entries` the
+    least recently used ones are deleted. Hits and misses are counted under
+    `embedding_cache.*` in core.metrics.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 200000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+
+    def get_many(self, texts: List[str], task_type: str) -> List[Optional[List[float]]]:
+        keys = [cache_key(t, self.model_name, task_type) for t in texts]
+        rows = dict(
+            EmbeddingCacheEntry.objects
+            .filter(key__in=set(keys))
+            .values_list("key", "vector")
+        )
+
+        if rows:
+            EmbeddingCacheEntry.objects.filter(key__in=rows.keys()).update(
+                last_used_at=timezone.now(),
+                hit_count=F("hit_count") + 1,
+            )
+
+        out = [_unpack(rows[k]) if k in rows else None for k in keys]
+        hits = sum(1 for v in out if v is not None)
+        metrics.incr("embedding_cache.hits", hits)
+        metrics.incr("embedding_cache.misses", len(out) - hits)
+        return out
+
+    def set_many(self, texts: List[str], task_type: str, vectors: List[List[float]]):
+        entries = {}
+        for text, vec in zip(texts, vectors):
+            key = cache_key(text, self.model_name, task_type)
+            entries[key] = EmbeddingCacheEntry(
+                key=key,
+                model_name=self.model_name,
+                task_type=task_type,
+                dims=len(vec),
+                vector=_pack(vec),
+            )
+        if not entries:
+            return
+
+        EmbeddingCacheEntry.objects.bulk_create(entries.values(), ignore_conflicts=True)
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries above the cap (plus 10% headroom)."""
+        total = EmbeddingCacheEntry.objects.count()
+        if total <= self.max_entries:
+            return
+
+        excess = total - self.max_entries + self.max_entries // 10
+        stale = list(
+            EmbeddingCacheEntry.objects
+            .order_by("last_used_at")
+            .values_list("pk", flat=True)[:excess]
+        )
+        EmbeddingCacheEntry.objects.filter(pk__in=stale).delete()
+        metrics.incr("embedding_cache.evictions", len(stale))
+
+    def stats(self):
+        return {
+            "entries": EmbeddingCacheEntry.objects.count(),
+            "max_entries": self.max_entries,
+            "hits": metrics.get("embedding_cache.hits"),
+            "misses": metrics.get("embedding_cache.misses"),
+            "hit_rate": metrics.hit_rate("embedding_cache"),
+            "evictions": metrics.get("embedding_cache.evictions"),
+        }
@@ -0,0 +1,244 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+from .chunking import estimate_tokens
+
+
+# -----------------------
+# RATE LIMIT DETECTION
+# -----------------------
+def is_rate_limit_error(exc: Exception) -> bool:
+    """True for HTTP 429 / RESOURCE_EXHAUSTED from Gemini or a compatible endpoint."""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if code == 429:
+        return True
+    name = type(exc).__name__
+    return name in ("ResourceExhausted", "TooManyRequests") or "429" in str(exc)
+
+
+# -----------------------
+# RPM / TPM BUDGET
+# -----------------------
+class RateLimiter:
+    """
+    Token buckets for requests-per-minute and tokens-per-minute, shared by all
+    threads of the process. A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._req_allowance = float(rpm)
+        self._tok_allowance = float(tpm)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        self._last = now
+        if self.rpm:
+            self._req_allowance = min(self.rpm, self._req_allowance + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tok_allowance = min(self.tpm, self._tok_allowance + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens: int = 1):
+        if self.tpm:
+            # A single oversized request must still be able to go through eventually
+            tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait_for = self._paused_until - now
+                if wait_for <= 0:
+                    need_req = 0.0 if not self.rpm else max(0.0, 1 - self._req_allowance) * 60.0 / self.rpm
+                    need_tok = 0.0 if not self.tpm else max(0.0, tokens - self._tok_allowance) * 60.0 / self.tpm
+                    wait_for = max(need_req, need_tok)
+                    if wait_for <= 0:
+                        if self.rpm:
+                            self._req_allowance -= 1
+                        if self.tpm:
+                            self._tok_allowance -= tokens
+                        return
+            time.sleep(wait_for)
+
+    def pause(self, seconds: float):
+        """Hold every caller back after a 429, not just the thread that saw it."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# -----------------------
+# EMBEDDING ENGINE
+# -----------------------
+class EmbeddingEngine:
+    """
+    Sends texts to `embed_fn(texts, task_type) -> vectors` in batches of
+    `batch_size`, with up to `max_workers` requests in flight, inside the
+    limiter's RPM/TPM budget and with exponential backoff on 429s.
+    With a `cache` (see embedding_cache.EmbeddingCache) only the misses of a
+    batch are sent; cache reads and writes stay on the calling thread.
+    `aembed_fn`, the async twin of `embed_fn`, serves `aembed`.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str], str], List[List[float]]],
+        batch_size: int = 100,
+        max_workers: int = 4,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        cache=None,
+        aembed_fn: Optional[Callable[[List[str], str], Awaitable[List[List[float]]]]] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.aembed_fn = aembed_fn
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+
+    def _embed_request(self, texts: List[str], task_type: str) -> List[List[float]]:
+        attempt = 0
+        while True:
+            self.limiter.acquire(sum(estimate_tokens(t) for t in texts))
+            try:
+                vectors = self.embed_fn(texts, task_type)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.5)
+                print(f"⏳ Embedding rate limited, backing off {delay:.1f}s")
+                self.limiter.pause(delay)
+                attempt += 1
+                continue
+
+            if len(vectors) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+            return vectors
+
+    def _batched(self, items: Iterable[Tuple[str, object]]):
+        texts, payloads = [], []
+        for text, payload in items:
+            texts.append(text)
+            payloads.append(payload)
+            if len(texts) >= self.batch_size:
+                yield texts, payloads
+                texts, payloads = [], []
+        if texts:
+            yield texts, payloads
+
+    def embed_batches(
+        self, items: Iterable[Tuple[str, object]], task_type: str = "retrieval_document"
+    ) -> Iterator[Tuple[list, List[List[float]]]]:
+        """
+        Consume `(text, payload)` pairs lazily and yield `(payloads, vectors)`
+        per request as soon as it completes (not necessarily in input order).
+        At most `2 * max_workers` batches are buffered, so a huge input is never
+        materialised up front.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as pool:
+            pending = {}
+            for texts, payloads in self._batched(items):
+                vectors, missing = self._lookup(texts, task_type)
+                if not missing:
+                    yield payloads, vectors
+                    continue
+
+                fut = pool.submit(self._embed_request, [texts[i] for i in missing], task_type)
+                pending[fut] = (texts, payloads, vectors, missing)
+                if len(pending) >= self.max_workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        yield self._complete(pending.pop(fut), fut.result(), task_type)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield self._complete(pending.pop(fut), fut.result(), task_type)
+
+    def _lookup(self, texts: List[str], task_type: str):
+        if not self.cache:
+            return [None] * len(texts), list(range(len(texts)))
+        vectors = self.cache.get_many(texts, task_type)
+        return vectors, [i for i, v in enumerate(vectors) if v is None]
+
+    def _complete(self, entry, fresh: List[List[float]], task_type: str):
+        texts, payloads, vectors, missing = entry
+        for i, vec in zip(missing, fresh):
+            vectors[i] = vec
+        if self.cache:
+            self.cache.set_many([texts[i] for i in missing], task_type, fresh)
+        return payloads, vectors
+
+    def embed(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        """Embed `texts` and return the vectors in input order."""
+        if not texts:
+            return []
+        if len(texts) <= self.batch_size:
+            texts = list(texts)
+            vectors, missing = self._lookup(texts, task_type)
+            if not missing:
+                return vectors
+            fresh = self._embed_request([texts[i] for i in missing], task_type)
+            return self._complete((texts, None, vectors, missing), fresh, task_type)[1]
+
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for positions, vectors in self.embed_batches(((t, i) for i, t in enumerate(texts)), task_type):
+            for pos, vec in zip(positions, vectors):
+                out[pos] = vec
+        return out
+
+    # -----------------------
+    # ASYNC (request path)
+    # -----------------------
+    async def _aembed_request(self, texts: List[str], task_type: str) -> List[List[float]]:
+        attempt = 0
+        while True:
+            await asyncio.to_thread(self.limiter.acquire, sum(estimate_tokens(t) for t in texts))
+            try:
+                vectors = await self.aembed_fn(texts, task_type)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.5)
+                print(f"⏳ Embedding rate limited, backing off {delay:.1f}s")
+                self.limiter.pause(delay)
+                attempt += 1
+                continue
+
+            if len(vectors) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+            return vectors
+
+    async def aembed(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        """
+        `embed` without blocking the event loop. Inputs of up to one batch (a
+        query) go through `aembed_fn`; anything larger, or an engine without
+        one, runs `embed` in a worker thread.
+        """
+        if not texts:
+            return []
+        if self.aembed_fn is None or len(texts) > self.batch_size:
+            return await sync_to_async(self.embed, thread_sensitive=False)(texts, task_type)
+
+        texts = list(texts)
+        vectors, missing = await sync_to_async(self._lookup)(texts, task_type)
+        if not missing:
+            return vectors
+        fresh = await self._aembed_request([texts[i] for i in missing], task_type)
+        return (await sync_to_async(self._complete)((texts, None, vectors, missing), fresh, task_type))[1]
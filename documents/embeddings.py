@@ -1,8 +1,20 @@
+import asyncio
+import hashlib
 import os
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import List
+from asgiref.sync import sync_to_async
 from django.conf import settings
-import google.generativeai as genai
+
+from core import metrics
+
+from .embedding_engine import EmbeddingEngine, RateLimiter
+from .embedding_cache import EmbeddingCache
+from .chunking import FixedCharChunker, get_chunker
+from . import embedding_backends, lexical_index, retrieval_cache, vector_store
+from .signals import chunks_changed
 
 try:
     import chromadb
@@ -10,11 +22,16 @@ except Exception:
     chromadb = None
 
 # -----------------------
-# CONFIGURE GEMINI API KEY
+# RETRIEVAL MODES
 # -----------------------
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
-
-EMBED_MODEL_NAME = "models/text-embedding-004"
+# vector:  Chroma nearest neighbours of the query embedding
+# hybrid:  vector and BM25 (lexical_index) rankings fused with reciprocal rank fusion
+# lexical: BM25 only, no network calls at all
+# Vector and hybrid fall back to lexical when the query embedding fails or
+# takes longer than RETRIEVAL_EMBED_BUDGET_SECONDS (when set).
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+EMBED_BUDGET = getattr(settings, "RETRIEVAL_EMBED_BUDGET_SECONDS", 0)
+RRF_K = getattr(settings, "RETRIEVAL_RRF_K", 60)
 
 # -----------------------
 # CHROMA DB DIRECTORY
@@ -40,107 +57,292 @@ def get_chroma_client():
 
 
 # -----------------------
-# TEXT CHUNKING
+# TEXT CHUNKING (see documents/chunking.py)
 # -----------------------
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    if not text:
-        return []
+    return [c.text for c in FixedCharChunker(chunk_size, overlap).chunk_text(text)]
+
 
-    chunks = []
-    start = 0
-    length = len(text)
+# -----------------------
+# EMBEDDING ENGINES (one per backend, see embedding_backends.py)
+# -----------------------
+_engines = {}
 
-    while start < length:
-        end = min(start + chunk_size, length)
-        chunks.append(text[start:end])
-        start = end - overlap
-        if start < 0:
-            start = end
 
-    return chunks
+def get_embedding_cache(model_name: str):
+    if not getattr(settings, "EMBED_CACHE_ENABLED", True):
+        return None
+    return EmbeddingCache(
+        model_name=model_name,
+        max_entries=getattr(settings, "EMBED_CACHE_MAX_ENTRIES", 200000),
+    )
 
 
-# -----------------------
-# GEMINI EMBEDDINGS
-# -----------------------
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    embeddings = []
-    for i, t in enumerate(texts):
-        print(f"🧠 Embedding chunk {i + 1}/{len(texts)}")
-        result = genai.embed_content(
-            model=EMBED_MODEL_NAME,
-            content=t,
-            task_type="retrieval_document"
+def get_embedding_engine(backend: str = None) -> EmbeddingEngine:
+    """Engine for `backend` (default: the deployment's EMBEDDING_BACKEND)."""
+    backend = embedding_backends.get_backend(backend)
+
+    if backend.name not in _engines:
+        _engines[backend.name] = EmbeddingEngine(
+            embed_fn=backend.embed_batch,
+            batch_size=backend.batch_size,
+            max_workers=backend.max_workers,
+            # Local backends have no quota to stay inside
+            limiter=RateLimiter(
+                rpm=getattr(settings, "EMBED_REQUESTS_PER_MINUTE", 0),
+                tpm=getattr(settings, "EMBED_TOKENS_PER_MINUTE", 0),
+            ) if backend.remote else None,
+            cache=get_embedding_cache(backend.model_name),
+            aembed_fn=backend.aembed_batch,
         )
-        embeddings.append(result["embedding"])
-    return embeddings
+
+    return _engines[backend.name]
+
+
+def embed_texts(texts: List[str], task_type: str = "retrieval_document", backend: str = None) -> List[List[float]]:
+    print(f"🧠 Embedding {len(texts)} chunks")
+    return get_embedding_engine(backend).embed(texts, task_type=task_type)
 
 
 # -----------------------
 # UPSERT DOCUMENT EMBEDDINGS
 # -----------------------
-def upsert_document_embeddings(document, batch_size: int = 50):
-    if not chromadb:
-        print("Chroma not available; skipping embeddings")
-        return
+def get_document_collection(document_id: int):
+    return get_collection(f"document_{document_id}")
 
-    print("🔥 UPSERT FUNCTION CALLED FOR DOC:", document.id)
 
-    text = document.extracted_text or ""
-    if not text.strip():
-        print("⚠️ No text to embed")
-        return
+def get_collection(collection_name: str, backend: str = None, create: bool = True, dims: int = None):
+    """
+    The chunks of a logical collection in the configured VECTOR_LAYOUT, in the
+    vector space of `backend` at `dims` dimensions (default: the deployment's;
+    see vector_store).
+    """
+    client = get_chroma_client()
+    if not client:
+        return None
 
+    space = embedding_backends.vector_space(backend, embedding_backends.embedding_dims(dims))
+    return vector_store.open_scope(client, collection_name, create=create, space=space)
+
+
+def delete_collection(collection_name: str, backend: str = "", dims: int = 0):
+    """`backend` / `dims`: those recorded for the collection ("" / 0 = the defaults)."""
     client = get_chroma_client()
     if not client:
         return
 
-    collection_name = f"document_{document.id}"
+    _chunks_changed(collection_name)
+    try:
+        vector_store.drop_scope(client, collection_name, space=embedding_backends.vector_space(backend, dims))
+    except Exception as e:
+        print("Chroma delete failed:", e)
+    _lexical(lexical_index.drop_scope, collection_name)
+
+
+def _chunks_changed(collection_name: str):
+    retrieval_cache.invalidate(collection_name)
+    chunks_changed.send(sender=None, collection_name=collection_name)
 
+
+def _lexical(write, *args):
+    # The BM25 index is a secondary copy: never fail ingestion because of it
     try:
-        collection = client.get_collection(name=collection_name)
-    except chromadb.errors.NotFoundError:
-        collection = client.get_or_create_collection(name=collection_name)
-        print(f"ℹ️ Created new collection: {collection_name}")
-
-    start = 0
-    length = len(text)
-    chunk_size = 1000
-    overlap = 200
-    chunk_index = 0
-
-    batch_chunks = []
-    batch_ids = []
-    batch_metadatas = []
-
-    while start < length:
-        end = min(start + chunk_size, length)
-        chunk = text[start:end]
-
-        batch_chunks.append(chunk)
-        batch_ids.append(f"{document.id}_{chunk_index}")
-        batch_metadatas.append({
-            "document_id": document.id,
-            "chunk_index": chunk_index,
-            "file_name": document.title
-        })
-
-        chunk_index += 1
-        start = end - overlap
-        if start < 0:
-            start = end
-
-        if len(batch_chunks) >= batch_size or start >= length:
-            embeddings = embed_texts(batch_chunks)
-            collection.upsert(
-                ids=batch_ids,
-                embeddings=embeddings,
-                metadatas=batch_metadatas,
-                documents=batch_chunks
+        write(*args)
+    except Exception as e:
+        print("⚠️ Lexical index write failed:", e)
+
+
+def _content_of(document):
+    """Vectors belong to the shared DocumentContent; accept either model."""
+    return getattr(document, "content", None) or document
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def _stored_chunks(collection, page_size: int = 1000):
+    """id -> (text hash, metadata) for every chunk already in `collection`."""
+    stored = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        for cid, text, meta in zip(ids, page["documents"], page["metadatas"]):
+            stored[cid] = (chunk_hash(text or ""), meta or {})
+        if len(ids) < page_size:
+            return stored
+        offset += page_size
+
+
+def index_chunks(content, chunks, collection=None, batch_size: int = None, on_progress=None) -> int:
+    """
+    Embed and upsert `chunks` (an iterable of chunking.Chunk) for a DocumentContent.
+    Chunks are pulled lazily by the embedding engine and every finished request
+    is upserted immediately; `on_progress(chunks_embedded)` is called after each,
+    so chunks become searchable while the rest are still embedding.
+
+    The collection is diffed by chunk text hash: chunks already stored (a
+    retry, or a new revision that inherited the collection) keep their vector
+    and only get their metadata updated, and once all chunks have been seen
+    the stored chunks that no longer occur are deleted.
+    Returns the number of chunks stored.
+    """
+    backend = embedding_backends.get_backend()
+    dims = embedding_backends.embedding_dims()
+    _switch_backend(content, backend.name, dims)
+    collection = collection or get_collection(content.collection_name, backend.name, dims=dims)
+    if collection is None:
+        return 0
+
+    engine = get_embedding_engine(backend.name)
+    batch_size = batch_size or engine.batch_size
+    if batch_size != engine.batch_size:
+        engine = EmbeddingEngine(
+            embed_fn=engine.embed_fn,
+            batch_size=batch_size,
+            max_workers=engine.max_workers,
+            limiter=engine.limiter,
+            cache=engine.cache,
+        )
+
+    scope = content.collection_name
+    stored = _stored_chunks(collection)
+    in_lexical = lexical_index.chunk_ids(scope) if stored and lexical_index.ENABLED else set()
+    by_hash = defaultdict(list)
+    for cid, (h, _) in stored.items():
+        by_hash[h].append(cid)
+
+    seen = set()
+    metadata_updates = []
+    # Reused chunks missing from the BM25 index (indexed before it existed)
+    lexical_backfill = []
+    counts = {"reused": 0, "embedded": 0}
+
+    def report():
+        if on_progress:
+            on_progress(counts["reused"] + counts["embedded"])
+
+    def flush_updates():
+        if lexical_backfill:
+            _lexical(lexical_index.add, scope, list(lexical_backfill))
+            lexical_backfill.clear()
+        if metadata_updates:
+            collection.update(
+                ids=[u[0] for u in metadata_updates],
+                metadatas=[u[1] for u in metadata_updates],
             )
-            batch_chunks.clear()
-            batch_ids.clear()
-            batch_metadatas.clear()
+            _lexical(lexical_index.update_metadata, scope, list(metadata_updates))
+            metadata_updates.clear()
+            _chunks_changed(content.collection_name)
+
+    def new_id(chunk, h):
+        cid = f"{content.source_document_id}_{chunk.index}"
+        n = 0
+        # Never overwrite a stored chunk: a later chunk may still reuse it
+        while cid in stored or cid in seen:
+            n += 1
+            cid = f"{content.source_document_id}_{chunk.index}_{h[:12]}_{n}"
+        return cid
+
+    def items():
+        for chunk in chunks:
+            metadata = {
+                "document_id": content.source_document_id,
+                "chunk_index": chunk.index,
+                "file_name": content.original_name,
+                "start": chunk.start,
+                "end": chunk.end,
+                "page": chunk.page,
+            }
+            h = chunk_hash(chunk.text)
+            if by_hash.get(h):
+                cid = by_hash[h].pop(0)
+                seen.add(cid)
+                if stored[cid][1] != metadata:
+                    metadata_updates.append((cid, metadata))
+                if lexical_index.ENABLED and cid not in in_lexical:
+                    lexical_backfill.append((cid, chunk.text, metadata))
+                if len(metadata_updates) + len(lexical_backfill) >= batch_size:
+                    flush_updates()
+                counts["reused"] += 1
+                if counts["reused"] % batch_size == 0:
+                    report()
+                continue
+
+            cid = new_id(chunk, h)
+            seen.add(cid)
+            yield chunk.text, (cid, metadata, chunk.text)
+
+    for payloads, embeddings in engine.embed_batches(items(), task_type="retrieval_document"):
+        collection.upsert(
+            ids=[p[0] for p in payloads],
+            embeddings=embedding_backends.reduce(embeddings, dims),
+            metadatas=[p[1] for p in payloads],
+            documents=[p[2] for p in payloads]
+        )
+        _lexical(lexical_index.add, scope, [(p[0], p[2], p[1]) for p in payloads])
+        _chunks_changed(content.collection_name)
+        counts["embedded"] += len(payloads)
+        print(f"🧠 Embedded {counts['embedded']} chunks")
+        report()
+
+    flush_updates()
+    stale = [cid for cid in stored if cid not in seen]
+    for i in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[i:i + batch_size])
+        _lexical(lexical_index.delete, scope, stale[i:i + batch_size])
+    if stale:
+        _chunks_changed(content.collection_name)
+
+    if stored:
+        print(f"♻️ Reused {counts['reused']} chunks, embedded {counts['embedded']}, deleted {len(stale)} stale")
+    report()
+    return counts["reused"] + counts["embedded"]
+
+
+def _switch_backend(content, backend, dims):
+    """
+    Record `backend` and `dims` for the content's collection. Vectors stored
+    by another backend or at another width can't be reused or mixed with the
+    new ones: they are dropped first (the embedding cache still has them at
+    full width, so a width change alone costs no API calls).
+    """
+    if (content.embedding_backend, content.embedding_dims) == (backend, dims):
+        return
+    previous = embedding_backends.backend_name(content.embedding_backend)
+    if (previous, content.embedding_dims) != (backend, dims):
+        stale = get_collection(content.collection_name, previous, create=False, dims=content.embedding_dims)
+        if stale is not None and stale.count():
+            print(f"♻️ {content.collection_name}: re-embedding with {backend}/{dims or 'full'} "
+                  f"(was {previous}/{content.embedding_dims or 'full'})")
+            delete_collection(content.collection_name, previous, content.embedding_dims)
+    content.embedding_backend, content.embedding_dims = backend, dims
+    content.save(update_fields=["embedding_backend", "embedding_dims"])
+
+
+def upsert_document_embeddings(document, batch_size: int = None, on_progress=None):
+    """Chunk, embed and upsert the saved extracted text of a Document or DocumentContent (see index_chunks)."""
+    if not chromadb:
+        print("Chroma not available; skipping embeddings")
+        return
+
+    print("🔥 UPSERT FUNCTION CALLED FOR DOC:", document.id)
+
+    from . import text_store
+
+    content = _content_of(document)
+    if not content.text_length:
+        print("⚠️ No text to embed")
+        return
+
+    # Read back from the text store a page at a time
+    index_chunks(
+        content,
+        get_chunker().chunk_pages(text_store.iter_pages(content)),
+        batch_size=batch_size,
+        on_progress=on_progress,
+    )
 
     print(f"✅ Stored embeddings for document {document.id}")
 
@@ -148,45 +350,300 @@ def upsert_document_embeddings(document, batch_size: int = 50):
 # -----------------------
 # QUERY DOCUMENT (RAG)
 # -----------------------
-def query_document(document_id: int, query: str, top_k: int = 5):
-    client = get_chroma_client()
-    if not client:
-        return []
+def _collections_for(document_ids) -> dict:
+    """document id -> (logical collection, (embedding backend, dims) of its vectors)."""
+    from .models import Document
+
+    rows = {
+        pk: (name, (embedding_backends.backend_name(backend), dims))
+        for pk, name, backend, dims in Document.objects.filter(pk__in=document_ids)
+        .exclude(content__collection_name="")
+        .values_list("pk", "content__collection_name", "content__embedding_backend", "content__embedding_dims")
+    }
+    return {
+        doc_id: rows.get(doc_id) or (f"document_{doc_id}", (embedding_backends.DEFAULT_BACKEND, 0))
+        for doc_id in document_ids
+    }
+
+
+def collection_names_for(document_ids) -> dict:
+    """
+    document id -> logical collection. Duplicate uploads share the collection
+    of their content; ids without a Document fall back to `document_{id}`.
+    """
+    return {doc_id: name for doc_id, (name, _) in _collections_for(document_ids).items()}
+
+
+def embed_query(query: str, backend: str = None) -> List[float]:
+    """Retrieval embedding of a question with `backend`, cached by normalized text."""
+    backend = embedding_backends.get_backend(backend)
+    return retrieval_cache.query_embedding(
+        query,
+        backend.model_name,
+        lambda: get_embedding_engine(backend.name).embed([query], task_type="retrieval_query")[0],
+    )
+
+
+def retrieval_mode(mode=None) -> str:
+    mode = mode or getattr(settings, "RETRIEVAL_MODE", "vector")
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {list(RETRIEVAL_MODES)}")
+    return mode
 
+
+# Query embeddings that outlive their budget finish here and still fill the cache
+_embed_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+
+
+def _embedding_unavailable(reason):
+    metrics.incr("retrieval.lexical_fallbacks")
+    print(f"⚡ Query embedding {reason}; answering from the lexical index")
+    return None
+
+
+def try_embed_query(query: str, mode=None, backend: str = None):
+    """
+    `embed_query`, or None when retrieval is lexical-only, the embedding call
+    fails (quota, open circuit) or it takes longer than EMBED_BUDGET seconds.
+    """
+    if retrieval_mode(mode) == "lexical":
+        return None
     try:
-        collection = client.get_collection(name=f"document_{document_id}")
-    except chromadb.errors.NotFoundError:
-        print("❌ Collection not found")
+        if not EMBED_BUDGET:
+            return embed_query(query, backend)
+        return _embed_pool.submit(embed_query, query, backend).result(timeout=EMBED_BUDGET)
+    except FutureTimeout:
+        return _embedding_unavailable(f"took over {EMBED_BUDGET}s")
+    except Exception as e:
+        return _embedding_unavailable(f"failed ({e})")
+
+
+def query_documents(document_ids, query: str, top_k: int = 5, use_cache: bool = True, mode: str = None):
+    """
+    Retrieve the `top_k` chunks for `query` across several documents.
+
+    In the vector mode: one query embedding per embedding backend involved
+    (each collection is searched with the model that indexed it), one lookup
+    per Chroma collection (filtered for shared layouts, in parallel
+    otherwise), then a global merge by distance. Rankings of different
+    backends, and in the hybrid mode BM25 over the same chunks, are fused with
+    reciprocal rank fusion; the lexical mode, and the other two when a query
+    embedding is unavailable, use BM25 for the collections concerned.
+    Chunks with the same text are returned once. Each match has text,
+    metadata, distance (None for lexical-only matches), file_name and the
+    requested document_id.
+    Query embeddings and ranked hits are cached (see retrieval_cache);
+    `use_cache=False` skips the result cache, e.g. while documents are indexing.
+    """
+    mode = retrieval_mode(mode)
+    client = get_chroma_client()
+    document_ids = list(dict.fromkeys(int(i) for i in document_ids))
+    if not client or not document_ids:
         return []
 
-    q_result = genai.embed_content(
-        model=EMBED_MODEL_NAME,
-        content=query,
-        task_type="retrieval_query"
+    scope_owner, scope_backend = _scope_owners(document_ids)
+    fell_back = []
+
+    def ranked_hits():
+        embeddings = {
+            backend: try_embed_query(query, mode, backend)
+            for backend in dict.fromkeys(backend for backend, _ in scope_backend.values())
+        }
+        return _ranked(client, scope_owner, scope_backend, embeddings, query, top_k, mode, fell_back)
+
+    if use_cache:
+        hits = retrieval_cache.top_k(
+            list(scope_owner), query, top_k, ranked_hits, variant=mode,
+            # A fallback answer must not stand in for the real ranking later
+            keep=lambda hits: bool(hits) and not any(fell_back),
+        )
+    else:
+        hits = ranked_hits()
+
+    return _format_hits(hits, scope_owner, len(document_ids), mode)
+
+
+def query_document(document_id: int, query: str, top_k: int = 5, mode: str = None):
+    return query_documents([document_id], query, top_k=top_k, mode=mode)
+
+
+def _scope_owners(document_ids):
+    """logical collection -> first requested document using it, and -> its (embedding backend, dims)."""
+    scope_owner, scope_backend = {}, {}
+    for doc_id, (name, backend) in _collections_for(document_ids).items():
+        scope_owner.setdefault(name, doc_id)
+        scope_backend[name] = backend
+    return scope_owner, scope_backend
+
+
+def _ranked(client, scope_owner, scope_backend, embeddings, query, top_k, mode, fell_back):
+    """
+    Rank the chunks of every scope: a vector ranking per (backend, dims)
+    whose query embedding (`embeddings`, full width by backend) is available,
+    BM25 for the hybrid mode or for the scopes that have no embedding, fused
+    with RRF when there's more than one ranking.
+    """
+    spaces = list(dict.fromkeys(scope_backend.values()))
+    # Fusion draws from deeper candidate lists than it returns
+    depth = top_k * 2 if mode == "hybrid" or len(spaces) > 1 else top_k
+    rankings, lexical_scopes = [], []
+    for backend, dims in spaces:
+        scopes = [s for s in scope_owner if scope_backend[s] == (backend, dims)]
+        embedding = embeddings[backend]
+        if embedding is None:
+            lexical_scopes += scopes
+            continue
+        space = embedding_backends.vector_space(backend, dims)
+        embedding = embedding_backends.reduce(embedding, dims)
+        rankings.append(_rank_hits(_search(client, scopes, embedding, depth, space), depth))
+
+    if lexical_scopes:
+        fell_back.append(mode != "lexical")
+    if mode == "hybrid" or (mode == "vector" and lexical_scopes):
+        lexical_scopes = list(scope_owner) if mode == "hybrid" else lexical_scopes
+        rankings.append(_lexical_hits(lexical_scopes, query, depth))
+    elif mode == "lexical":
+        rankings.append(_lexical_hits(list(scope_owner), query, top_k))
+
+    if len(rankings) == 1:
+        return rankings[0][:top_k]
+    return _fuse(rankings, top_k)
+
+
+def _search(client, scopes, query_embedding, top_k, space=""):
+    # Over-fetch a little so de-duplication still leaves top_k
+    return vector_store.query_scopes(
+        client,
+        list(scopes),
+        query_embedding,
+        n_results=top_k * 2 if len(scopes) > 1 else top_k,
+        max_workers=getattr(settings, "RETRIEVAL_MAX_WORKERS", 8),
+        space=space,
     )
 
+
+def _rank_hits(hits, top_k):
+    hits.sort(key=lambda h: h["distance"])
+    return _dedupe(hits, top_k)
+
+
+def _dedupe(hits, top_k):
+    ranked = []
+    seen_texts = set()
+    for hit in hits:
+        key = " ".join((hit["text"] or "").split())
+        if key in seen_texts:
+            continue
+        seen_texts.add(key)
+        ranked.append(hit)
+        if len(ranked) >= top_k:
+            break
+    return ranked
+
+
+def _lexical_hits(scopes, query, top_k):
+    # Over-fetch for de-duplication, like _search
+    return _dedupe(lexical_index.search(list(scopes), query, top_k * 2), top_k)
+
+
+def _fuse(rankings, top_k):
+    """
+    Reciprocal rank fusion: each chunk scores sum(1 / (RRF_K + rank)) over the
+    rankings it appears in, so agreement between rankings outranks any one
+    alone and neither distances, BM25 scores nor the distances of different
+    embedding models need to be comparable.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            entry = fused.setdefault((hit["scope"], hit["id"]), {**hit, "rrf": 0.0})
+            entry["rrf"] += 1.0 / (RRF_K + rank)
+            entry.update({k: hit[k] for k in ("distance", "bm25") if k in hit})
+    return _dedupe(sorted(fused.values(), key=lambda h: -h["rrf"]), top_k)
+
+
+def _format_hits(hits, scope_owner, document_count, mode="vector"):
+    output = []
+    for hit in hits:
+        match = {
+            "text": hit["text"],
+            "metadata": dict(hit["metadata"]),  # cached hits are shared
+            "distance": hit.get("distance"),
+            "file_name": hit["metadata"].get("file_name"),
+            "document_id": scope_owner[hit["scope"]],
+        }
+        for score in ("bm25", "rrf"):
+            if score in hit:
+                match[score] = round(hit[score], 6)
+        output.append(match)
+
+    print(f"🔎 Queried {len(scope_owner)} collection(s) for {document_count} document(s) "
+          f"[{mode}]: {len(output)} matches")
+    return output
+
+
+# -----------------------
+# ASYNC QUERY (ASGI views)
+# -----------------------
+async def aembed_query(query: str, backend: str = None) -> List[float]:
+    """`embed_query` without blocking the event loop on Gemini (local backends run in a thread)."""
+    backend = embedding_backends.get_backend(backend)
+
+    async def compute():
+        engine = get_embedding_engine(backend.name)
+        return (await engine.aembed([query], task_type="retrieval_query"))[0]
+
+    return await retrieval_cache.aquery_embedding(query, backend.model_name, compute)
+
+
+async def atry_embed_query(query: str, mode=None, backend: str = None):
+    """Async `try_embed_query`; an embedding over budget keeps running and fills the cache."""
+    if retrieval_mode(mode) == "lexical":
+        return None
     try:
-        results = collection.query(
-            query_embeddings=[q_result["embedding"]],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
+        if not EMBED_BUDGET:
+            return await aembed_query(query, backend)
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.ensure_future(aembed_query(query, backend))), EMBED_BUDGET
         )
+    except asyncio.TimeoutError:
+        return _embedding_unavailable(f"took over {EMBED_BUDGET}s")
     except Exception as e:
-        print("Query error:", e)
+        return _embedding_unavailable(f"failed ({e})")
+
+
+async def aquery_documents(document_ids, query: str, top_k: int = 5, use_cache: bool = True, mode: str = None):
+    """
+    Async `query_documents`. Query embeddings are awaited (concurrently, one
+    per backend); the ORM lookup and the (local) Chroma and BM25 searches run
+    in threads.
+    """
+    mode = retrieval_mode(mode)
+    client = get_chroma_client()
+    document_ids = list(dict.fromkeys(int(i) for i in document_ids))
+    if not client or not document_ids:
         return []
 
-    output = []
-    docs = results.get("documents", [[]])[0]
-    metas = results.get("metadatas", [[]])[0]
-    dists = results.get("distances", [[]])[0]
-
-    for i in range(len(docs)):
-        output.append({
-            "text": docs[i],
-            "metadata": metas[i],
-            "distance": dists[i],
-            "file_name": metas[i].get("file_name")
-        })
-    print("🔎 Querying collection:", f"document_{document_id}")
+    scope_owner, scope_backend = await sync_to_async(_scope_owners)(document_ids)
+    fell_back = []
 
-    return output
+    async def ranked_hits():
+        backends = list(dict.fromkeys(backend for backend, _ in scope_backend.values()))
+        vectors = await asyncio.gather(*(atry_embed_query(query, mode, b) for b in backends))
+        return await sync_to_async(_ranked, thread_sensitive=False)(
+            client, scope_owner, scope_backend, dict(zip(backends, vectors)), query, top_k, mode, fell_back
+        )
+
+    if use_cache:
+        hits = await retrieval_cache.atop_k(
+            list(scope_owner), query, top_k, ranked_hits, variant=mode,
+            keep=lambda hits: bool(hits) and not any(fell_back),
+        )
+    else:
+        hits = await ranked_hits()
+
+    return _format_hits(hits, scope_owner, len(document_ids), mode)
+
+
+async def aquery_document(document_id: int, query: str, top_k: int = 5, mode: str = None):
+    return await aquery_documents([document_id], query, top_k=top_k, mode=mode)
@@ -0,0 +1,213 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# -------------------------
+# TEXT EXTRACTION IMPORTS
+# -------------------------
+try:
+    import pdfplumber
+except Exception:
+    pdfplumber = None
+
+try:
+    import docx
+except Exception:
+    docx = None
+
+
+@dataclass
+class ExtractionResult:
+    text: str = ""
+    # page_offsets[i] is the character offset in `text` where page i + 1 starts
+    page_offsets: List[int] = field(default_factory=list)
+    pages: int = 0
+    total_pages: int = 0
+    truncated: bool = False
+    reason: str = ""
+
+
+# -------------------------
+# PDF PAGE RANGES (runs in worker processes)
+# -------------------------
+def _extract_pdf_range(fpath: str, first: int, last: int) -> List[str]:
+    with pdfplumber.open(fpath, pages=list(range(first + 1, last + 1))) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def _pdf_page_count(fpath: str) -> int:
+    with pdfplumber.open(fpath) as pdf:
+        return len(pdf.pages)
+
+
+# -------------------------
+# PAGE STREAM
+# -------------------------
+class PageStream:
+    """
+    Iterate a file's pages in order, each already newline-terminated.
+    PDFs are split into `pages_per_task` page ranges extracted in a process
+    pool; iteration stops (truncated=True) once `max_chars` characters or
+    `timeout` seconds are used up. `total_pages`, `truncated` and `reason`
+    are filled in while iterating.
+    """
+
+    def __init__(self, fpath, max_chars=None, timeout=None, workers=None, pages_per_task=16):
+        self.fpath = fpath
+        self.max_chars = max_chars
+        self.timeout = timeout
+        self.workers = workers
+        self.pages_per_task = max(1, pages_per_task)
+        self.total_pages = 0
+        self.chars = 0
+        self.truncated = False
+        self.reason = ""
+
+    def _stop(self, reason):
+        self.truncated = True
+        self.reason = reason
+        print(f"⚠️ Extraction of {os.path.basename(self.fpath)} stopped early: {reason}")
+
+    def _budgeted(self, page_text):
+        """Apply the character budget; returns None once it is exhausted."""
+        if page_text:
+            page_text += "\n"
+        if self.max_chars and self.chars + len(page_text) > self.max_chars:
+            page_text = page_text[: self.max_chars - self.chars]
+            self._stop("character budget exceeded")
+        self.chars += len(page_text)
+        return page_text
+
+    def __iter__(self):
+        ext = os.path.splitext(self.fpath)[1].lower()
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+
+        # PDF
+        if ext == ".pdf" and pdfplumber:
+            for raw in self._iter_pdf(deadline):
+                page_text = self._budgeted(raw)
+                yield page_text
+                if self.truncated:
+                    return
+
+        # DOCX (no page information: the whole body counts as one page)
+        elif ext == ".docx" and docx:
+            self.total_pages = 1
+            doc = docx.Document(self.fpath)
+            yield self._budgeted("\n".join(para.text for para in doc.paragraphs))
+
+        # TXT / fallback
+        else:
+            self.total_pages = 1
+            with open(self.fpath, "r", encoding="utf-8", errors="ignore") as fh:
+                text = fh.read(self.max_chars + 1) if self.max_chars else fh.read()
+            if self.max_chars and len(text) > self.max_chars:
+                text = text[: self.max_chars]
+                self._stop("character budget exceeded")
+            self.chars = len(text)
+            yield text
+
+    def _iter_pdf(self, deadline):
+        total = self.total_pages = _pdf_page_count(self.fpath)
+        step = self.pages_per_task
+        ranges = [(i, min(i + step, total)) for i in range(0, total, step)]
+        workers = max(1, min(self.workers or os.cpu_count() or 1, len(ranges)))
+
+        # Small PDFs are not worth a process pool
+        if workers == 1:
+            for first, last in ranges:
+                if deadline and time.monotonic() > deadline:
+                    self._stop("time budget exceeded")
+                    return
+                yield from _extract_pdf_range(self.fpath, first, last)
+            return
+
+        # Spawned (not forked) workers: this runs inside threaded web/worker processes
+        ctx = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        pending = {}
+        done_ranges = {}
+        next_submit = 0
+        next_emit = 0
+
+        try:
+            while next_emit < len(ranges):
+                # Keep at most 2 ranges per worker in flight/buffered to bound memory
+                while next_submit < len(ranges) and next_submit - next_emit < workers * 2:
+                    first, last = ranges[next_submit]
+                    pending[pool.submit(_extract_pdf_range, self.fpath, first, last)] = next_submit
+                    next_submit += 1
+
+                timeout = None
+                if deadline:
+                    timeout = max(0.0, deadline - time.monotonic())
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    self._stop("time budget exceeded")
+                    return
+                for fut in done:
+                    done_ranges[pending.pop(fut)] = fut.result()
+
+                # Emit strictly in page order
+                while next_emit in done_ranges:
+                    yield from done_ranges.pop(next_emit)
+                    next_emit += 1
+
+        finally:
+            # Stopped early: do not wait for ranges that are still being extracted
+            pool.shutdown(wait=not pending, cancel_futures=True)
+
+
+# -------------------------
+# EXTRACTION ENGINE
+# -------------------------
+def extract_document(
+    fpath,
+    on_page=None,
+    max_chars: Optional[int] = None,
+    timeout: Optional[float] = None,
+    workers: Optional[int] = None,
+    pages_per_task: int = 16,
+    raise_errors: bool = False,
+) -> ExtractionResult:
+    """
+    Extract text from PDF, DOCX, or TXT files into one string with per-page
+    offsets (see PageStream for the budget and process-pool behaviour).
+    `on_page(pages_done)` is called as pages are added so callers can report progress.
+    """
+    stream = PageStream(fpath, max_chars, timeout, workers, pages_per_task)
+    parts = []
+    page_offsets = []
+    length = 0
+
+    try:
+        for page_text in stream:
+            page_offsets.append(length)
+            parts.append(page_text)
+            length += len(page_text)
+            if on_page:
+                on_page(len(page_offsets))
+    except Exception as e:
+        print("Error extracting text:", e)
+        if raise_errors:
+            raise
+
+    return ExtractionResult(
+        text="".join(parts),
+        page_offsets=page_offsets,
+        pages=len(page_offsets),
+        total_pages=stream.total_pages,
+        truncated=stream.truncated,
+        reason=stream.reason,
+    )
+
+
+def extract_text_from_file(fpath, on_page=None, raise_errors=False):
+    """
+    Extract text from PDF, DOCX, or TXT files.
+    Background jobs pass `raise_errors=True` so a failed extraction can be retried.
+    """
+    return extract_document(fpath, on_page=on_page, raise_errors=raise_errors).text
@@ -0,0 +1,257 @@
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import IngestionJob
+from . import dedup
+from . import embeddings as doc_embeddings
+from .chunking import get_chunker
+from .pipeline import ingest_document
+from . import text_store
+
+# -----------------------
+# WORKER POOL SETTINGS
+# -----------------------
+WORKER_COUNT = getattr(settings, "INGESTION_WORKERS", 2)
+AUTOSTART = getattr(settings, "INGESTION_AUTOSTART", True)
+MAX_ATTEMPTS = getattr(settings, "INGESTION_MAX_ATTEMPTS", 3)
+LEASE_SECONDS = getattr(settings, "INGESTION_LEASE_SECONDS", 600)
+POLL_SECONDS = getattr(settings, "INGESTION_POLL_SECONDS", 5)
+RETRY_BASE_SECONDS = 10
+
+EXTRACT_MAX_CHARS = getattr(settings, "EXTRACT_MAX_CHARS", None)
+EXTRACT_TIMEOUT_SECONDS = getattr(settings, "EXTRACT_TIMEOUT_SECONDS", None)
+EXTRACT_WORKERS = getattr(settings, "EXTRACT_WORKERS", None)
+EXTRACT_PAGES_PER_TASK = getattr(settings, "EXTRACT_PAGES_PER_TASK", 16)
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+# -----------------------
+# ENQUEUE
+# -----------------------
+def enqueue_content(content, document=None):
+    """Queue stored `content` for extraction + embedding and wake the local workers."""
+    job = IngestionJob.objects.create(content=content, document=document, max_attempts=MAX_ATTEMPTS)
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def enqueue_document(document):
+    return enqueue_content(document.content, document=document)
+
+
+def needs_ingestion(content):
+    """A freshly stored file, or a duplicate of one whose last job failed."""
+    job = content.jobs.order_by("-created_at").first()
+    return job is None or job.status == IngestionJob.STATUS_FAILED
+
+
+def wake_workers():
+    if AUTOSTART:
+        start_workers()
+    _wakeup.set()
+
+
+def start_workers(count=None):
+    """Start the in-process worker threads once per process."""
+    with _workers_lock:
+        alive = [t for t in _workers if t.is_alive()]
+        missing = (count or WORKER_COUNT) - len(alive)
+        for _ in range(max(missing, 0)):
+            t = threading.Thread(target=worker_loop, name="ingestion-worker", daemon=True)
+            t.start()
+            alive.append(t)
+        _workers[:] = alive
+
+
+# -----------------------
+# JOB CLAIMING
+# -----------------------
+def _claimable(now):
+    ready = Q(status=IngestionJob.STATUS_QUEUED) & (Q(run_after__isnull=True) | Q(run_after__lte=now))
+    # A running job whose worker stopped heart-beating (crash / restart) is taken over.
+    stale = Q(status=IngestionJob.STATUS_RUNNING, heartbeat_at__lt=now - timedelta(seconds=LEASE_SECONDS))
+    return ready | stale
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest runnable job to `running`.
+    The conditional UPDATE makes this safe across threads and processes.
+    """
+    now = timezone.now()
+    candidates = list(
+        IngestionJob.objects.filter(_claimable(now))
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:5]
+    )
+    for pk in candidates:
+        claimed = IngestionJob.objects.filter(_claimable(now), pk=pk).update(
+            status=IngestionJob.STATUS_RUNNING,
+            attempts=F("attempts") + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return IngestionJob.objects.select_related("content").get(pk=pk)
+    return None
+
+
+class JobGone(Exception):
+    """The job row was deleted mid-run (its content was released, e.g. replaced)."""
+
+
+def _update_job(job, **fields):
+    fields["heartbeat_at"] = timezone.now()
+    if not IngestionJob.objects.filter(pk=job.pk).update(**fields):
+        # Progress callbacks run per batch: stop writing chunks nobody will read
+        raise JobGone(f"Ingestion job {job.pk} no longer exists")
+
+
+# -----------------------
+# JOB PROCESSING
+# -----------------------
+def process_job(job):
+    content = job.content
+    print(f"⚙️ Ingestion job {job.pk} started for content {content.id} (attempt {job.attempts})")
+
+    try:
+        if content.text_length:
+            # A retry after a failed embedding does not need to extract again
+            chunks_total = sum(1 for _ in get_chunker().chunk_pages(text_store.iter_pages(content)))
+            _update_job(job, chunks_total=chunks_total)
+            doc_embeddings.upsert_document_embeddings(
+                content,
+                on_progress=lambda n: _update_job(job, chunks_embedded=n),
+            )
+        else:
+            ingest_document(
+                content,
+                on_progress=lambda **progress: _update_job(job, **progress),
+                max_chars=EXTRACT_MAX_CHARS,
+                timeout=EXTRACT_TIMEOUT_SECONDS,
+                workers=EXTRACT_WORKERS,
+                pages_per_task=EXTRACT_PAGES_PER_TASK,
+            )
+
+        _update_job(
+            job,
+            status=IngestionJob.STATUS_DONE,
+            error="",
+            finished_at=timezone.now(),
+        )
+        print(f"✅ Ingestion job {job.pk} done")
+
+    except JobGone as e:
+        print(f"🛑 {e}; stopped")
+
+    except Exception as e:
+        if not IngestionJob.objects.filter(pk=job.pk).exists():
+            # Released mid-run (e.g. its content was written to after deletion); nothing to retry
+            print(f"🛑 Ingestion job {job.pk} no longer exists; stopped ({e})")
+            return
+        traceback.print_exc()
+        if job.attempts < job.max_attempts:
+            delay = RETRY_BASE_SECONDS * (2 ** (job.attempts - 1)) * random.uniform(0.8, 1.2)
+            _update_job(
+                job,
+                status=IngestionJob.STATUS_QUEUED,
+                error=str(e),
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+            print(f"🔁 Ingestion job {job.pk} failed, retrying in {delay:.0f}s:", e)
+        else:
+            _update_job(
+                job,
+                status=IngestionJob.STATUS_FAILED,
+                error=str(e),
+                finished_at=timezone.now(),
+            )
+            print(f"❌ Ingestion job {job.pk} failed permanently:", e)
+
+
+def run_pending_jobs(limit=None):
+    """Process runnable jobs in the current thread. Returns how many ran."""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        process_job(job)
+        processed += 1
+    return processed
+
+
+def worker_loop():
+    while True:
+        close_old_connections()
+        try:
+            ran = run_pending_jobs(limit=1)
+        except Exception as e:
+            print("⚠️ Ingestion worker error:", e)
+            ran = 0
+        if not ran:
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+
+
+# -----------------------
+# STATUS
+# -----------------------
+def latest_job(document):
+    # Duplicate uploads share the jobs of their stored content
+    return (
+        IngestionJob.objects.filter(content_id=document.content_id)
+        .select_related("document")
+        .order_by("-created_at")
+        .first()
+    )
+
+
+def is_indexed(document):
+    """Documents uploaded before background ingestion have no job and were indexed inline."""
+    job = latest_job(document)
+    return job is None or job.status == IngestionJob.STATUS_DONE
+
+
+def job_status(document):
+    job = latest_job(document)
+    if job is None:
+        return {"document_id": document.id, "status": IngestionJob.STATUS_DONE, "indexed": True}
+
+    payload = {
+        "document_id": document.id,
+        "status": job.status,
+        "indexed": job.status == IngestionJob.STATUS_DONE,
+        # Only the user's own duplicates: a job queued by another user's upload must not show through
+        "deduplicated": dedup.has_other_document(document.user_id, document.content_id, document),
+        "progress": {
+            "pages_extracted": job.pages_extracted,
+            "chunks_total": job.chunks_total,
+            "chunks_embedded": job.chunks_embedded,
+        },
+    }
+    if job.document is None or job.document.user_id != document.user_id:
+        # Someone else's upload queued it: no timings, attempts or errors
+        return payload
+
+    return {
+        **payload,
+        "job_id": job.id,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "error": job.error or None,
+        "retry_at": job.run_after if job.status == IngestionJob.STATUS_QUEUED and job.attempts else None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from django.conf import settings
+
+from core import metrics
+
+# -----------------------
+# LEXICAL INDEX (SQLite FTS5 / BM25)
+# -----------------------
+# Chunk text next to the vectors, in its own SQLite file whatever the main
+# database is: written by embeddings.index_chunks alongside every Chroma
+# upsert/delete, searched with BM25 for exact terms (codes, names, section
+# numbers) and as the no-network fallback when query embeddings are slow.
+# Chunks are keyed like Chroma: (scope = logical collection, chunk id). The
+# scope is also an FTS column, so a search's MATCH is restricted to the chat's
+# documents instead of scoring every matching chunk in the index.
+ENABLED = getattr(settings, "LEXICAL_INDEX_ENABLED", True)
+PATH = getattr(settings, "LEXICAL_INDEX_PATH", os.path.join(settings.BASE_DIR, "lexical_index.sqlite3"))
+# Longest query (in terms) sent to FTS5
+MAX_QUERY_TERMS = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk (
+    id INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    UNIQUE (scope, chunk_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_search USING fts5(
+    text, scope_key, content='', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunk_search_ai AFTER INSERT ON chunk BEGIN
+    INSERT INTO chunk_search(rowid, text, scope_key) VALUES (new.id, new.text, 's' || hex(new.scope));
+END;
+CREATE TRIGGER IF NOT EXISTS chunk_search_ad AFTER DELETE ON chunk BEGIN
+    INSERT INTO chunk_search(chunk_search, rowid, text, scope_key)
+    VALUES ('delete', old.id, old.text, 's' || hex(old.scope));
+END;
+CREATE TRIGGER IF NOT EXISTS chunk_search_au AFTER UPDATE OF text ON chunk BEGIN
+    INSERT INTO chunk_search(chunk_search, rowid, text, scope_key)
+    VALUES ('delete', old.id, old.text, 's' || hex(old.scope));
+    INSERT INTO chunk_search(rowid, text, scope_key) VALUES (new.id, new.text, 's' || hex(new.scope));
+END;
+"""
+
+# Index files written before the scope column: text-only FTS table and its triggers
+_OLD_SCHEMA = ("chunk_ai", "chunk_ad", "chunk_au")
+
+# Words too common to help ranking; each one would pull in most of the chunks
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its itself just me more most my no nor not now of off on once
+only or other our ours out over own same she should so some such than that the their theirs them then
+there these they this those through to too under until up very was we were what when where which while
+who whom why will with would you your yours
+""".split())
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect():
+    """Per-thread connection; SQLite connections can't be shared between threads."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == PATH:
+        return conn
+    conn = sqlite3.connect(PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _schema_lock:
+        if PATH not in _schema_ready:
+            _create_schema(conn)
+            _schema_ready.add(PATH)
+    _local.conn, _local.path = conn, PATH
+    return conn
+
+
+def _create_schema(conn):
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    # Upgrade: drop the text-only index and index the chunks stored so far with their scope
+    upgrade = "".join(f"DROP TRIGGER IF EXISTS {trigger};\n" for trigger in _OLD_SCHEMA)
+    upgrade += "DROP TABLE IF EXISTS chunk_fts;\n"
+    backfill = "" if "chunk_search" in existing else (
+        "INSERT INTO chunk_search(rowid, text, scope_key) SELECT id, text, 's' || hex(scope) FROM chunk;\n"
+    )
+    try:
+        conn.executescript(f"BEGIN IMMEDIATE;\n{upgrade}{_SCHEMA}{backfill}COMMIT;")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def scope_key(scope):
+    """The FTS token for `scope`, as the triggers write it ('s' || hex(scope))."""
+    return "s" + scope.encode("utf-8").hex().upper()
+
+
+# -----------------------
+# WRITES
+# -----------------------
+def add(scope, items):
+    """Insert or replace chunks of `scope`; `items` are (chunk_id, text, metadata)."""
+    if not ENABLED or not items:
+        return
+    conn = _connect()
+    rows = [(scope, cid, text or "", json.dumps(meta or {})) for cid, text, meta in items]
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT INTO chunk (scope, chunk_id, text, metadata) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (scope, chunk_id) DO UPDATE SET "
+            "text = excluded.text, metadata = excluded.metadata",
+            rows,
+        )
+
+
+def update_metadata(scope, items):
+    """`items` are (chunk_id, metadata); the text (and its index entry) is left alone."""
+    if not ENABLED or not items:
+        return
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE chunk SET metadata = ? WHERE scope = ? AND chunk_id = ?",
+            [(json.dumps(meta or {}), scope, cid) for cid, meta in items],
+        )
+
+
+def delete(scope, chunk_ids):
+    if not ENABLED or not chunk_ids:
+        return
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "DELETE FROM chunk WHERE scope = ? AND chunk_id = ?", [(scope, cid) for cid in chunk_ids]
+        )
+
+
+def drop_scope(scope):
+    if not ENABLED:
+        return
+    conn = _connect()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM chunk WHERE scope = ?", (scope,))
+
+
+def chunk_ids(scope):
+    if not ENABLED:
+        return set()
+    return {r[0] for r in _connect().execute("SELECT chunk_id FROM chunk WHERE scope = ?", (scope,))}
+
+
+# -----------------------
+# SEARCH
+# -----------------------
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def match_query(text, scopes=()):
+    """
+    FTS5 query for free text: every term quoted (so punctuation and FTS
+    operators in the question are inert) and OR-ed, leaving BM25 to weigh
+    rare terms such as codes and names above common words. Stopwords are
+    dropped unless the question has nothing else. With `scopes`, the match
+    is limited to their chunks.
+    """
+    terms = list(dict.fromkeys(t.lower() for t in _TERM.findall(text)))
+    terms = ([t for t in terms if t not in STOPWORDS] or terms)[:MAX_QUERY_TERMS]
+    if not terms:
+        return ""
+    query = "text : (" + " OR ".join(f'"{t}"' for t in terms) + ")"
+    if scopes:
+        query = "scope_key : (" + " OR ".join(scope_key(scope) for scope in scopes) + ") AND " + query
+    return query
+
+
+def search(scopes, text, limit):
+    """
+    BM25-ranked chunks of `scopes` matching `text`, best first, as hits shaped
+    like vector_store.query_scopes (scope, id, text, metadata) with `bm25`
+    (lower is better) instead of a distance.
+    """
+    scopes = list(dict.fromkeys(scopes))
+    if not ENABLED or not scopes:
+        return []
+    query = match_query(text, scopes)
+    if not query:
+        return []
+
+    try:
+        # The scope terms are in the MATCH: only the chat's chunks are scored
+        rows = _connect().execute(
+            """
+            SELECT c.scope, c.chunk_id, c.text, c.metadata, bm25(chunk_search, 1.0, 0.0) AS score
+            FROM chunk_search JOIN chunk c ON c.id = chunk_search.rowid
+            WHERE chunk_search MATCH ?
+            ORDER BY score
+            LIMIT ?
+            """,
+            [query, limit],
+        ).fetchall()
+    except sqlite3.Error as e:
+        print("⚠️ Lexical search failed:", e)
+        return []
+
+    metrics.incr("lexical.searches")
+    return [
+        {"scope": scope, "id": cid, "text": chunk_text, "metadata": json.loads(meta), "bm25": score}
+        for scope, cid, chunk_text, meta, score in rows
+    ]
+
+
+def stats():
+    if not ENABLED:
+        return {"enabled": False}
+    conn = _connect()
+    return {
+        "enabled": True,
+        "path": PATH,
+        "chunks": conn.execute("SELECT count(*) FROM chunk").fetchone()[0],
+        "scopes": conn.execute("SELECT count(DISTINCT scope) FROM chunk").fetchone()[0],
+        "searches": metrics.get("lexical.searches"),
+    }
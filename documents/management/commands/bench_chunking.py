@@ -0,0 +1,143 @@
+import math
+import random
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.chunking import STRATEGIES, estimate_tokens, get_chunker
+from documents.extraction import extract_document
+from documents.models import Document
+from documents import text_store
+
+_WORD = re.compile(r"\w+")
+_SENTENCE = re.compile(r"[^.!?\n]{40,300}[.!?]")
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+# -----------------------
+# OFFLINE RETRIEVAL (TF-IDF)
+# -----------------------
+class TfidfIndex:
+    """Stand-in for the vector search so strategies can be compared without API calls."""
+
+    def __init__(self, texts):
+        self.tfs = [Counter(_words(t)) for t in texts]
+        df = Counter()
+        for tf in self.tfs:
+            df.update(tf.keys())
+        n = len(texts)
+        self.idf = {w: math.log((n + 1) / (c + 1)) + 1 for w, c in df.items()}
+        self.vecs = [self._vec(tf) for tf in self.tfs]
+
+    def _vec(self, tf):
+        vec = {w: c * self.idf.get(w, 0.0) for w, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {w: v / norm for w, v in vec.items()}
+
+    def search(self, query, k):
+        q = self._vec(Counter(_words(query)))
+        scores = [sum(q[w] * vec.get(w, 0.0) for w in q) for vec in self.vecs]
+        return sorted(range(len(scores)), key=lambda i: -scores[i])[:k]
+
+
+class EmbeddingIndex:
+    """Ranks chunks with the configured embedding engine (costs API calls unless cached)."""
+
+    def __init__(self, texts):
+        from documents.embeddings import get_embedding_engine
+        self.engine = get_embedding_engine()
+        self.vecs = [self._norm(v) for v in self.engine.embed(texts, task_type="retrieval_document")]
+
+    @staticmethod
+    def _norm(vec):
+        n = math.sqrt(sum(x * x for x in vec)) or 1.0
+        return [x / n for x in vec]
+
+    def search(self, query, k):
+        q = self._norm(self.engine.embed([query], task_type="retrieval_query")[0])
+        scores = [sum(a * b for a, b in zip(q, vec)) for vec in self.vecs]
+        return sorted(range(len(scores)), key=lambda i: -scores[i])[:k]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare chunking strategies on real documents: chunk count, embedding cost "
+        "and retrieval hit rate for sentences sampled from the text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", action="append", default=[], help="Path to a PDF/DOCX/TXT file")
+        parser.add_argument("--document", action="append", type=int, default=[], help="Document id")
+        parser.add_argument("--strategy", action="append", choices=sorted(STRATEGIES), help="Default: all")
+        parser.add_argument("--probes", type=int, default=50, help="Sampled questions per document")
+        parser.add_argument("--top-k", type=int, default=4)
+        parser.add_argument("--seed", type=int, default=13)
+        parser.add_argument("--embed", action="store_true", help="Rank with real embeddings instead of TF-IDF")
+
+    def _texts(self, opts):
+        for path in opts["file"]:
+            result = extract_document(path)
+            yield path, result.text, result.page_offsets
+        for doc in Document.objects.filter(pk__in=opts["document"]).select_related("content"):
+            yield doc.title, text_store.read_text(doc.content), doc.content.page_offsets
+
+    def handle(self, *args, **opts):
+        if not opts["file"] and not opts["document"]:
+            raise CommandError("Pass at least one --file or --document")
+
+        strategies = opts["strategy"] or sorted(STRATEGIES)
+        batch = getattr(settings, "EMBED_BATCH_SIZE", 100)
+        totals = {s: Counter() for s in strategies}
+
+        for name, text, page_offsets in self._texts(opts):
+            if not text.strip():
+                self.stdout.write(f"{name}: no text, skipped")
+                continue
+
+            rng = random.Random(opts["seed"])
+            sentences = [m.group().strip() for m in _SENTENCE.finditer(text)]
+            probes = rng.sample(sentences, min(opts["probes"], len(sentences)))
+            # Questions reuse ~60% of the sentence's words, in order
+            queries = [" ".join(w for w in s.split() if rng.random() < 0.6) or s for s in probes]
+
+            self.stdout.write(f"\n{name}: {len(text)} chars, {len(page_offsets)} pages, {len(probes)} probes")
+            self.stdout.write(f"  {'strategy':<10}{'chunks':>8}{'avg chars':>11}{'overlap':>9}{'tokens':>10}{'requests':>10}{'hit@k':>8}")
+
+            for strategy in strategies:
+                chunks = list(get_chunker(strategy).chunk_text(text, page_offsets))
+                texts = [c.text for c in chunks]
+                embedded = sum(len(t) for t in texts)
+                index = (EmbeddingIndex if opts["embed"] else TfidfIndex)(texts)
+
+                hits = 0
+                for probe, query in zip(probes, queries):
+                    if any(probe in texts[i] for i in index.search(query, opts["top_k"])):
+                        hits += 1
+
+                tokens = sum(estimate_tokens(t) for t in texts)
+                requests = -(-len(chunks) // batch)
+                row = totals[strategy]
+                row["chunks"] += len(chunks)
+                row["tokens"] += tokens
+                row["requests"] += requests
+                row["hits"] += hits
+                row["probes"] += len(probes)
+
+                self.stdout.write(
+                    f"  {strategy:<10}{len(chunks):>8}{embedded / max(1, len(chunks)):>11.0f}"
+                    f"{max(0.0, embedded / len(text) - 1):>9.0%}{tokens:>10}{requests:>10}"
+                    f"{hits / max(1, len(probes)):>8.0%}"
+                )
+
+        self.stdout.write("\nTotal")
+        for strategy, row in totals.items():
+            rate = row["hits"] / row["probes"] if row["probes"] else 0
+            self.stdout.write(
+                f"  {strategy:<10} chunks={row['chunks']} tokens={row['tokens']} "
+                f"requests={row['requests']} hit@{opts['top_k']}={rate:.0%}"
+            )
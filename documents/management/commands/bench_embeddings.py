@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from documents.embedding_engine import EmbeddingEngine, RateLimiter
+
+
+# -----------------------
+# FAKE EMBEDDING ENDPOINT
+# -----------------------
+def make_fake_server(latency_ms, per_text_ms, dim, server_rps):
+    """
+    Local stand-in for batchEmbedContents: fixed round-trip latency plus a
+    small per-text cost, and 429s once more than `server_rps` requests arrive
+    within one second.
+    """
+    state = {"lock": threading.Lock(), "window": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = body["texts"]
+
+            if server_rps:
+                with state["lock"]:
+                    now = time.monotonic()
+                    state["window"] = [t for t in state["window"] if now - t < 1.0]
+                    limited = len(state["window"]) >= server_rps
+                    if not limited:
+                        state["window"].append(now)
+                if limited:
+                    self.send_response(429)
+                    self.end_headers()
+                    return
+
+            time.sleep((latency_ms + per_text_ms * len(texts)) / 1000.0)
+            payload = json.dumps({
+                "embeddings": [[(len(t) % 97) / 97.0] * dim for t in texts]
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def http_embed_fn(url):
+    def embed(texts, task_type):
+        req = urllib.request.Request(
+            url,
+            data=json.dumps({"texts": texts, "task_type": task_type}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return json.loads(resp.read())["embeddings"]
+    return embed
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-chunk serial embedding against the batched concurrent engine on a local fake endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunks", type=int, default=300)
+        parser.add_argument("--latency-ms", type=float, default=120.0, help="Fake round-trip latency")
+        parser.add_argument("--per-text-ms", type=float, default=2.0, help="Fake server cost per text")
+        parser.add_argument("--dim", type=int, default=768)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--rpm", type=int, default=0, help="Client requests-per-minute budget")
+        parser.add_argument("--tpm", type=int, default=0, help="Client tokens-per-minute budget")
+        parser.add_argument("--server-rps", type=int, default=0, help="Make the fake server answer 429 above this many requests per second")
+
+    def handle(self, *args, **opts):
+        server = make_fake_server(opts["latency_ms"], opts["per_text_ms"], opts["dim"], opts["server_rps"])
+        url = f"http://127.0.0.1:{server.server_address[1]}/embed"
+        embed_fn = http_embed_fn(url)
+        texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 36 for i in range(opts["chunks"])]
+
+        try:
+            # Before: one request per chunk, in series (old embed_texts).
+            # It has no backoff, so it is skipped when the server rate-limits.
+            serial = None
+            if not opts["server_rps"]:
+                start = time.perf_counter()
+                for t in texts:
+                    embed_fn([t], "retrieval_document")
+                serial = time.perf_counter() - start
+
+            # After: batched + concurrent engine
+            engine = EmbeddingEngine(
+                embed_fn=embed_fn,
+                batch_size=opts["batch_size"],
+                max_workers=opts["workers"],
+                limiter=RateLimiter(rpm=opts["rpm"], tpm=opts["tpm"]),
+                backoff_base=0.2,
+            )
+            start = time.perf_counter()
+            done = 0
+            for payloads, vectors in engine.embed_batches(((t, None) for t in texts)):
+                done += len(vectors)
+            batched = time.perf_counter() - start
+        finally:
+            server.shutdown()
+
+        n = len(texts)
+        self.stdout.write(f"chunks: {n}, latency: {opts['latency_ms']} ms, batch: {opts['batch_size']}, workers: {opts['workers']}")
+        if serial is not None:
+            self.stdout.write(f"serial per-chunk : {serial:8.2f}s  {n / serial:10.1f} chunks/sec")
+        self.stdout.write(f"batched engine   : {batched:8.2f}s  {done / batched:10.1f} chunks/sec")
+        if serial is not None:
+            self.stdout.write(self.style.SUCCESS(f"speedup: {serial / batched:.1f}x"))
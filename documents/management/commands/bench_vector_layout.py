@@ -0,0 +1,173 @@
+import gc
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import numpy_store, vector_store
+
+
+def _disk_usage(path):
+    files = size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def _open_files():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare vector layouts (Chroma per-document/shared/sharded, NumPy brute force) on "
+        "synthetic vectors: build time, query latency (p50/p99), disk use, files on disk, open "
+        "file descriptors, RSS and recall@k against an exact search. --chunks takes several "
+        "sizes to find where brute force stops paying off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=300)
+        parser.add_argument("--chunks", type=int, nargs="+", default=[40], help="Chunks per document (one run each)")
+        parser.add_argument("--dims", type=int, default=768)
+        parser.add_argument("--queries", type=int, default=300)
+        parser.add_argument("--top-k", type=int, default=5)
+        parser.add_argument("--shards", type=int, default=16)
+        parser.add_argument("--layout", action="append", choices=vector_store.LAYOUTS, help="Default: all")
+        parser.add_argument("--numpy-max-chunks", type=int, default=None,
+                            help="VECTOR_NUMPY_MAX_CHUNKS for the numpy layout")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--keep", action="store_true", help="Keep the temporary Chroma directories")
+
+    def handle(self, *args, **opts):
+        try:
+            import chromadb
+        except ImportError:
+            raise CommandError("chromadb is not installed")
+
+        for chunks in opts["chunks"]:
+            self._run(chromadb, chunks, opts)
+
+    def _run(self, chromadb, chunks, opts):
+        rng = random.Random(opts["seed"])
+        nprng = np.random.default_rng(opts["seed"])
+        dims = opts["dims"]
+        top_k = opts["top_k"]
+
+        # The same corpus and queries for every layout
+        corpus = [nprng.uniform(-1, 1, (chunks, dims)).astype(np.float32) for _ in range(opts["documents"])]
+        queries = []
+        for _ in range(opts["queries"]):
+            doc = rng.randrange(opts["documents"])
+            base = corpus[doc][rng.randrange(chunks)]
+            query = base + nprng.normal(0, 0.05, dims).astype(np.float32)
+            # Exact top-k of the query's document, for recall
+            distances = ((corpus[doc] - query) ** 2).sum(axis=1)
+            truth = {f"{doc}_{i}" for i in np.argsort(distances)[:top_k]}
+            queries.append((doc, query.tolist(), truth))
+
+        rows = []
+        for layout in opts["layout"] or list(vector_store.LAYOUTS):
+            path = tempfile.mkdtemp(prefix=f"bench_{layout}_")
+            numpy_root, numpy_max = numpy_store.ROOT, numpy_store.MAX_CHUNKS
+            numpy_store.ROOT = os.path.join(path, "vector_index")
+            if opts["numpy_max_chunks"]:
+                numpy_store.MAX_CHUNKS = opts["numpy_max_chunks"]
+            fds_start, rss_start = _open_files(), _rss_mb()
+            client = chromadb.PersistentClient(path=path)
+
+            started = time.perf_counter()
+            for doc, vectors in enumerate(corpus):
+                scope = vector_store.open_scope(client, f"document_{doc}", layout=layout, shards=opts["shards"])
+                # Batches the size ingestion writes, below Chroma's max batch size
+                for start in range(0, len(vectors), 1000):
+                    span = range(start, min(start + 1000, len(vectors)))
+                    scope.upsert(
+                        ids=[f"{doc}_{i}" for i in span],
+                        embeddings=vectors[span.start:span.stop].tolist(),
+                        metadatas=[{"document_id": doc, "chunk_index": i} for i in span],
+                        documents=[f"chunk {i} of document {doc}" for i in span],
+                    )
+            build = time.perf_counter() - started
+
+            latencies, found, recalled = [], 0, 0
+            for doc, q, truth in queries:
+                t0 = time.perf_counter()
+                scope = vector_store.open_scope(
+                    client, f"document_{doc}", create=False, layout=layout, shards=opts["shards"]
+                )
+                result = scope.query(query_embeddings=[q], n_results=top_k, include=["metadatas", "distances"])
+                latencies.append((time.perf_counter() - t0) * 1000)
+                metas = result["metadatas"][0]
+                found += bool(metas) and all(m["document_id"] == doc for m in metas)
+                recalled += len(truth & set(result["ids"][0]))
+
+            files, size = _disk_usage(path)
+            rows.append({
+                "layout": layout,
+                "collections": len(client.list_collections()),
+                "build_s": build,
+                "p50": statistics.median(latencies),
+                "p99": _percentile(latencies, 99),
+                "disk_mb": size / 1024 / 1024,
+                "files": files,
+                "open_fds": _open_files() - fds_start,
+                "rss_mb": _rss_mb() - rss_start,
+                "correct": found / max(1, len(queries)),
+                "recall": recalled / max(1, len(queries) * min(top_k, chunks)),
+            })
+
+            del client, scope
+            try:
+                chromadb.api.client.SharedSystemClient.clear_system_cache()
+            except Exception:
+                pass
+            vector_store._handles.clear()
+            numpy_store._loaded.clear()
+            numpy_store.ROOT, numpy_store.MAX_CHUNKS = numpy_root, numpy_max
+            gc.collect()
+            if not opts["keep"]:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                self.stdout.write(f"{layout}: kept {path}")
+
+        self.stdout.write(
+            f"\n{opts['documents']} documents x {chunks} chunks, {dims} dims, "
+            f"{len(queries)} queries, top-{top_k}"
+        )
+        self.stdout.write(
+            f"  {'layout':<14}{'colls':>7}{'build s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+            f"{'disk MB':>9}{'files':>7}{'fds':>6}{'+rss MB':>9}{'scoped':>8}{'recall':>8}"
+        )
+        for r in rows:
+            self.stdout.write(
+                f"  {r['layout']:<14}{r['collections']:>7}{r['build_s']:>9.1f}{r['p50']:>9.2f}{r['p99']:>9.2f}"
+                f"{r['disk_mb']:>9.1f}{r['files']:>7}{r['open_fds']:>6}{r['rss_mb']:>9.0f}{r['correct']:>8.0%}"
+                f"{r['recall']:>8.1%}"
+            )
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import embedding_backends, lexical_index, retrieval_cache, vector_store
+from documents.embeddings import get_chroma_client
+from documents.models import DocumentContent
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the BM25 lexical index from the chunks already stored in Chroma, for documents "
+        "indexed before it existed. New ingestions keep it up to date by themselves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--rebuild", action="store_true", help="Re-index collections already present")
+
+    def handle(self, *args, **opts):
+        if not lexical_index.ENABLED:
+            raise CommandError("LEXICAL_INDEX_ENABLED is off")
+        client = get_chroma_client()
+        if client is None:
+            raise CommandError("chromadb is not installed")
+
+        scopes = (
+            DocumentContent.objects.exclude(collection_name="")
+            .order_by("collection_name")
+            .values_list("collection_name", "embedding_backend", "embedding_dims")
+            .distinct()
+        )
+        indexed_scopes = indexed_chunks = 0
+        batch = opts["batch_size"]
+
+        for scope, backend, dims in scopes.iterator():
+            collection = vector_store.open_scope(
+                client, scope, create=False, space=embedding_backends.vector_space(backend, dims)
+            )
+            if collection is None:
+                continue
+            have = set() if opts["rebuild"] else lexical_index.chunk_ids(scope)
+            if opts["rebuild"]:
+                lexical_index.drop_scope(scope)
+
+            added = offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=batch, offset=offset)
+                ids = page.get("ids") or []
+                items = [
+                    (cid, text, meta)
+                    for cid, text, meta in zip(ids, page["documents"], page["metadatas"])
+                    if cid not in have
+                ]
+                lexical_index.add(scope, items)
+                added += len(items)
+                if len(ids) < batch:
+                    break
+                offset += batch
+
+            if added:
+                # Cached hybrid rankings were computed without these chunks
+                retrieval_cache.invalidate(scope)
+                indexed_scopes += 1
+                indexed_chunks += added
+                self.stdout.write(f"✅ {scope}: {added} chunks")
+
+        stats = lexical_index.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed_chunks} chunks in {indexed_scopes} collections "
+            f"({stats['chunks']} chunks in {stats['scopes']} collections in {stats['path']})"
+        ))
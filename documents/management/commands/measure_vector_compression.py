@@ -0,0 +1,174 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import embedding_backends, numpy_store
+from documents.embedding_cache import _unpack
+from documents.embeddings import get_collection
+from documents.models import DocumentContent, EmbeddingCacheEntry
+
+
+def _stored_vectors(content, page_size=1000):
+    """float32 matrix of every chunk vector stored for `content`."""
+    collection = get_collection(
+        content.collection_name, content.embedding_backend, create=False, dims=content.embedding_dims
+    )
+    if collection is None:
+        return None
+    pages, offset = [], 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if len(page["ids"]):
+            pages.append(np.asarray(page["embeddings"], dtype=np.float32))
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    return np.concatenate(pages) if pages else None
+
+
+def _past_questions(backend, dims, limit):
+    """Retrieval-query embeddings of real questions, from the persistent embedding cache."""
+    rows = (
+        EmbeddingCacheEntry.objects
+        .filter(model_name=embedding_backends.get_backend(backend).model_name, task_type="retrieval_query")
+        .order_by("-last_used_at")
+        .values_list("vector", flat=True)[:limit]
+    )
+    vectors = [_unpack(v) for v in rows]
+    vectors = [v for v in vectors if len(v) >= dims]
+    if not vectors:
+        return None
+    return np.asarray(embedding_backends.reduce([v[:len(vectors[0])] for v in vectors], dims), dtype=np.float32)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure compact vector storage on the stored documents: for each width (EMBEDDING_DIMS), "
+        "NumPy store dtype (VECTOR_NUMPY_DTYPE) and rescoring setting (VECTOR_NUMPY_RESCORE), the "
+        "disk and RAM used against recall@k of an exact full-precision search. Queries are real "
+        "past questions from the embedding cache, or the documents' own chunks when there are none."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=20, help="Largest N documents to measure")
+        parser.add_argument("--queries", type=int, default=50, help="Queries per document")
+        parser.add_argument("--top-k", type=int, default=5)
+        parser.add_argument("--dims", type=int, nargs="+", default=[0, 512, 256, 128],
+                            help="Widths to try (0 = as stored)")
+        parser.add_argument("--dtypes", nargs="+", choices=list(numpy_store.DTYPES),
+                            default=list(numpy_store.DTYPES))
+        parser.add_argument("--rescore", type=int, nargs="+", default=[0, 4],
+                            help="VECTOR_NUMPY_RESCORE values to try (0 = off)")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **opts):
+        contents = [
+            c for c in DocumentContent.objects.exclude(collection_name="").order_by("-size")[:opts["documents"] * 3]
+        ]
+        rng = np.random.default_rng(opts["seed"])
+        corpus = []
+        for content in contents:
+            vectors = _stored_vectors(content)
+            if vectors is not None and len(vectors) > opts["top_k"]:
+                corpus.append((content, vectors))
+            if len(corpus) >= opts["documents"]:
+                break
+        if not corpus:
+            raise CommandError("No indexed documents with stored vectors")
+
+        top_k = opts["top_k"]
+        full_dims = min(v.shape[1] for _, v in corpus)
+        source = "chunks"
+        workload = []
+        for content, vectors in corpus:
+            questions = _past_questions(content.embedding_backend, vectors.shape[1], opts["queries"])
+            if questions is not None and questions.shape[1] == vectors.shape[1]:
+                queries, source = questions, "past questions"
+            else:
+                # A chunk's own vector, slightly perturbed, standing in for a question about it
+                picks = rng.integers(0, len(vectors), min(opts["queries"], len(vectors)))
+                queries = vectors[picks] + rng.normal(0, 0.01, (len(picks), vectors.shape[1])).astype(np.float32)
+            # Exact full-precision answers
+            truth = [
+                set(np.argsort(((vectors - q) ** 2).sum(axis=1), kind="stable")[:top_k].tolist())
+                for q in queries
+            ]
+            workload.append((content, vectors, queries, truth))
+
+        settings_grid = [
+            (dims, dtype, rescore)
+            for dims in dict.fromkeys(d if 0 < d < full_dims else 0 for d in opts["dims"])
+            for dtype in opts["dtypes"]
+            for rescore in (opts["rescore"] if dtype != "float32" else [0])
+        ]
+        saved = numpy_store.ROOT, numpy_store.DTYPE, numpy_store.RESCORE, numpy_store.MAX_CHUNKS
+        root = tempfile.mkdtemp(prefix="measure_vectors_")
+        rows = []
+        try:
+            numpy_store.ROOT, numpy_store.MAX_CHUNKS = root, 10 ** 9
+            for dims, dtype, rescore in settings_grid:
+                numpy_store.DTYPE, numpy_store.RESCORE = dtype, rescore
+                disk = ram = chroma = 0
+                recalled = total = 0
+                latencies = []
+                for content, vectors, queries, truth in workload:
+                    scope = numpy_store.NumpyScope(f"m{content.pk}_{dims}_{dtype}_{rescore}", "", lambda create: None)
+                    stored = np.asarray(embedding_backends.reduce(vectors, dims), dtype=np.float32)
+                    for start in range(0, len(stored), 1000):
+                        scope.upsert(
+                            ids=[str(i) for i in range(start, min(start + 1000, len(stored)))],
+                            embeddings=stored[start:start + 1000],
+                            metadatas=[{}] * len(stored[start:start + 1000]),
+                            documents=[""] * len(stored[start:start + 1000]),
+                        )
+                    disk += os.path.getsize(scope.path)
+                    width = stored.shape[1]
+                    # What queries scan: the stored matrix and its scales, not the float32 copy
+                    ram += len(stored) * width * np.dtype(numpy_store.DTYPES[dtype]).itemsize
+                    ram += len(stored) * 4 if dtype == "int8" else 0
+                    chroma += len(stored) * width * 4
+                    reduced = np.asarray(embedding_backends.reduce(queries, dims), dtype=np.float32)
+                    for q, expected in zip(reduced, truth):
+                        t0 = time.perf_counter()
+                        ids = scope.query(query_embeddings=[q], n_results=top_k, include=[])["ids"][0]
+                        latencies.append((time.perf_counter() - t0) * 1000)
+                        recalled += len(expected & {int(i) for i in ids})
+                        total += len(expected)
+                rows.append({
+                    "dims": dims or full_dims, "dtype": dtype, "rescore": rescore,
+                    "disk": disk, "ram": ram, "chroma": chroma,
+                    "recall": recalled / max(1, total), "p50": statistics.median(latencies),
+                })
+        finally:
+            numpy_store.ROOT, numpy_store.DTYPE, numpy_store.RESCORE, numpy_store.MAX_CHUNKS = saved
+            numpy_store._loaded.clear()
+            shutil.rmtree(root, ignore_errors=True)
+
+        chunks = sum(len(v) for _, v, _, _ in workload)
+        queries = sum(len(q) for _, _, q, _ in workload)
+        base = next((r for r in rows if r["dims"] == full_dims and r["dtype"] == "float32"), rows[0])
+        self.stdout.write(
+            f"\n{len(workload)} documents, {chunks} chunks, {full_dims} dims stored, "
+            f"{queries} queries ({source}), recall@{top_k} against exact full-precision search"
+        )
+        self.stdout.write(
+            f"  {'dims':>5} {'dtype':<8}{'rescore':>8}{'disk MB':>9}{'saved':>7}{'RAM MB':>8}{'saved':>7}"
+            f"{'chroma MB':>10}{'recall':>8}{'p50 ms':>8}"
+        )
+        mb = 1024 * 1024
+        for r in rows:
+            self.stdout.write(
+                f"  {r['dims']:>5} {r['dtype']:<8}{r['rescore'] or '-':>8}{r['disk'] / mb:>9.2f}"
+                f"{1 - r['disk'] / base['disk']:>7.0%}{r['ram'] / mb:>8.2f}{1 - r['ram'] / base['ram']:>7.0%}"
+                f"{r['chroma'] / mb:>10.2f}{r['recall']:>8.1%}{r['p50']:>8.2f}"
+            )
+        self.stdout.write(
+            "disk: NumPy store files (vectors, scales, float32 copy when rescoring, chunk ids); "
+            "RAM: bytes a query scans; chroma: raw float32 vector bytes at that width in Chroma layouts, "
+            "which store float32 only."
+        )
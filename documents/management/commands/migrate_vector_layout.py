@@ -0,0 +1,103 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import embedding_backends, vector_store
+from documents.embeddings import get_chroma_client
+from documents.models import DocumentContent
+
+
+class Command(BaseCommand):
+    help = (
+        "Move stored chunks between Chroma collection layouts (per_document, shared, sharded). "
+        "Vectors are copied, not re-embedded. Set VECTOR_LAYOUT to the new layout afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", required=True, choices=vector_store.LAYOUTS, dest="target")
+        parser.add_argument("--from", choices=vector_store.LAYOUTS, dest="source",
+                            help="Default: the current VECTOR_LAYOUT")
+        parser.add_argument("--shards", type=int, default=None, help="Shard count for --to sharded")
+        parser.add_argument("--from-shards", type=int, default=None, help="Shard count for --from sharded")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--keep-source", action="store_true", help="Do not delete the copied chunks")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        client = get_chroma_client()
+        if client is None:
+            raise CommandError("chromadb is not installed")
+
+        source = opts["source"] or vector_store.current_layout()
+        target = opts["target"]
+        if source == target and (target != vector_store.LAYOUT_SHARDED or opts["shards"] == opts["from_shards"]):
+            raise CommandError(f"Chunks are already in the {target!r} layout")
+
+        scopes = (
+            DocumentContent.objects.exclude(collection_name="")
+            .order_by("collection_name")
+            .values_list("collection_name", "embedding_backend", "embedding_dims")
+            .distinct()
+        )
+        moved_scopes = moved_chunks = 0
+        batch = opts["batch_size"]
+
+        for scope, backend, dims in scopes.iterator():
+            # Each backend's vectors stay in their own space (see vector_store)
+            space = embedding_backends.vector_space(backend, dims)
+            same_place = (
+                vector_store.physical_name(scope, source, opts["from_shards"], space)
+                == vector_store.physical_name(scope, target, opts["shards"], space)
+            )
+            src = vector_store.open_scope(
+                client, scope, create=False, layout=source, shards=opts["from_shards"], space=space
+            )
+            if src is None or same_place:
+                continue
+            total = src.count()
+            if not total:
+                continue
+            if opts["dry_run"]:
+                self.stdout.write(f"{scope}: {total} chunks would move to "
+                                  f"{vector_store.physical_name(scope, target, opts['shards'], space)}")
+                moved_scopes += 1
+                moved_chunks += total
+                continue
+
+            dst = vector_store.open_scope(
+                client, scope, create=True, layout=target, shards=opts["shards"], space=space
+            )
+            for offset in range(0, total, batch):
+                page = src.get(include=["embeddings", "documents", "metadatas"], limit=batch, offset=offset)
+                if not page["ids"]:
+                    break
+                dst.upsert(
+                    ids=page["ids"],
+                    embeddings=page["embeddings"],
+                    metadatas=page["metadatas"],
+                    documents=page["documents"],
+                )
+
+            copied = dst.count()
+            if copied < total:
+                raise CommandError(f"{scope}: copied {copied} of {total} chunks; source left in place")
+            if not opts["keep_source"]:
+                vector_store.drop_scope(client, scope, layout=source, shards=opts["from_shards"], space=space)
+
+            moved_scopes += 1
+            moved_chunks += total
+            self.stdout.write(f"✅ {scope}: {total} chunks")
+
+        if not opts["dry_run"] and not opts["keep_source"] and source != vector_store.LAYOUT_PER_DOCUMENT:
+            # Shared/sharded source collections that are now empty
+            for collection in client.list_collections():
+                if collection.name.startswith(vector_store.SHARED_COLLECTION) and not collection.count():
+                    vector_store.forget_handle(client, collection.name)
+                    client.delete_collection(name=collection.name)
+
+        verb = "Would move" if opts["dry_run"] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved_chunks} chunks in {moved_scopes} collections from {source} to {target}"
+        ))
+        if not opts["dry_run"]:
+            self.stdout.write(f"Now set VECTOR_LAYOUT={target}" + (
+                f" and VECTOR_SHARDS={opts['shards']}" if target == vector_store.LAYOUT_SHARDED and opts["shards"] else ""
+            ))
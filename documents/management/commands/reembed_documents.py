@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from documents import embedding_backends, ingestion
+from documents.models import DocumentContent, IngestionJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue ingestion jobs that re-index the documents stored with another embedding backend than "
+        "EMBEDDING_BACKEND, or at another width than EMBEDDING_DIMS (served from the embedding cache). "
+        "Until its job runs, a document is still searched in its old vector space."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Queue at most this many documents")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        try:
+            target = embedding_backends.backend_name()
+        except ValueError as e:
+            raise CommandError(str(e))
+        dims = embedding_backends.embedding_dims()
+        current = f"{target}/{dims or 'full'}"
+
+        # "" was recorded before backends existed and means the default one
+        recorded = [target, ""] if target == embedding_backends.DEFAULT_BACKEND else [target]
+        contents = (
+            DocumentContent.objects.exclude(collection_name="")
+            .filter(~Q(embedding_backend__in=recorded) | ~Q(embedding_dims=dims))
+            .order_by("pk")
+        )
+        if opts["limit"]:
+            contents = contents[:opts["limit"]]
+
+        queued = skipped = 0
+        for content in contents.iterator():
+            previous = embedding_backends.backend_name(content.embedding_backend)
+            previous = f"{previous}/{content.embedding_dims or 'full'}"
+            if opts["dry_run"]:
+                self.stdout.write(f"{content.collection_name}: {previous} -> {current}")
+                queued += 1
+                continue
+            # A job already waiting will pick up the current settings by itself
+            job = content.jobs.order_by("-created_at").first()
+            if job is not None and job.status in (IngestionJob.STATUS_QUEUED, IngestionJob.STATUS_RUNNING):
+                skipped += 1
+                continue
+            with transaction.atomic():
+                ingestion.enqueue_content(content)
+            queued += 1
+            self.stdout.write(f"🔁 {content.collection_name}: {previous} -> {current}")
+
+        verb = "Would queue" if opts["dry_run"] else "Queued"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {queued} document(s) for re-indexing with {current}"
+            + (f" ({skipped} already queued)" if skipped else "")
+        ))
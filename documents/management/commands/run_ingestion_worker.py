@@ -0,0 +1,26 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from documents import ingestion
+
+
+class Command(BaseCommand):
+    help = "Run document ingestion workers in a dedicated process (or drain the queue once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
+        parser.add_argument("--once", action="store_true", help="Process queued jobs and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            processed = ingestion.run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)"))
+            return
+
+        ingestion.start_workers(options["workers"])
+        self.stdout.write(self.style.SUCCESS("Ingestion workers running. Ctrl+C to stop."))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
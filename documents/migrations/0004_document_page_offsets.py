@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_embeddingcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='page_offsets',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,121 @@
+import hashlib
+
+import django.db.models.deletion
+import documents.models
+from django.db import migrations, models
+
+
+def _file_sha256(field_file):
+    h = hashlib.sha256()
+    try:
+        with field_file.open("rb") as fh:
+            for block in iter(lambda: fh.read(1024 * 1024), b""):
+                h.update(block)
+    except Exception:
+        return None
+    return h.hexdigest()
+
+
+def _file_size(field_file):
+    try:
+        return field_file.size
+    except Exception:
+        return 0
+
+
+def move_text_to_content(apps, schema_editor):
+    Document = apps.get_model("documents", "Document")
+    DocumentContent = apps.get_model("documents", "DocumentContent")
+    IngestionJob = apps.get_model("documents", "IngestionJob")
+
+    for doc in Document.objects.order_by("pk").iterator():
+        digest = _file_sha256(doc.file)
+        # Existing duplicates keep their own collections; only the first claims the real hash
+        if not digest or DocumentContent.objects.filter(sha256=digest).exists():
+            digest = hashlib.sha256(f"legacy-document-{doc.pk}".encode()).hexdigest()
+
+        content = DocumentContent.objects.create(
+            sha256=digest,
+            file=doc.file.name,
+            size=_file_size(doc.file),
+            original_name=doc.title,
+            extracted_text=doc.extracted_text,
+            page_offsets=doc.page_offsets,
+            source_document_id=doc.pk,
+            ref_count=1,
+        )
+        doc.content = content
+        doc.save(update_fields=["content"])
+        IngestionJob.objects.filter(document=doc).update(content=content)
+
+
+def move_text_to_document(apps, schema_editor):
+    Document = apps.get_model("documents", "Document")
+    for doc in Document.objects.select_related("content").iterator():
+        doc.extracted_text = doc.content.extracted_text
+        doc.page_offsets = doc.content.page_offsets
+        doc.save(update_fields=["extracted_text", "page_offsets"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_document_page_offsets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.BigIntegerField(default=0)),
+                ('original_name', models.CharField(blank=True, max_length=255)),
+                ('extracted_text', models.TextField(blank=True)),
+                ('page_offsets', models.JSONField(blank=True, default=list)),
+                ('source_document_id', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=documents.models.document_upload_path),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='content',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documents', to='documents.documentcontent'),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='content',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='documents.documentcontent'),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='document',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='documents.document'),
+        ),
+        migrations.RunPython(move_text_to_content, move_text_to_document),
+        migrations.AlterField(
+            model_name='document',
+            name='content',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='documents', to='documents.documentcontent'),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='content',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='documents.documentcontent'),
+        ),
+        migrations.RemoveField(
+            model_name='document',
+            name='extracted_text',
+        ),
+        migrations.RemoveField(
+            model_name='document',
+            name='page_offsets',
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def name_collections(apps, schema_editor):
+    DocumentContent = apps.get_model("documents", "DocumentContent")
+    for content in DocumentContent.objects.iterator():
+        content.collection_name = f"document_{content.source_document_id}"
+        content.save(update_fields=["collection_name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_documentcontent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcontent',
+            name='collection_name',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.RunPython(name_collections, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_documentcontent_collection_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcontent',
+            name='embedding_backend',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
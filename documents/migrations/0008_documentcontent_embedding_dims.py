@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_documentcontent_embedding_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcontent',
+            name='embedding_dims',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_documentcontent_embedding_dims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'uploaded_at'], name='documents_user_uploaded'),
+        ),
+    ]
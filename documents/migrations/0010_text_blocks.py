@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-18 00:10
+
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Same block size and level as documents/text_store.py defaults
+BLOCK_CHARS = 64 * 1024
+COMPRESSION_LEVEL = 6
+
+
+def move_text_to_blocks(apps, schema_editor):
+    DocumentContent = apps.get_model("documents", "DocumentContent")
+    DocumentTextBlock = apps.get_model("documents", "DocumentTextBlock")
+
+    for pk in DocumentContent.objects.exclude(extracted_text="").order_by("pk").values_list("pk", flat=True):
+        text = DocumentContent.objects.filter(pk=pk).values_list("extracted_text", flat=True).get()
+        DocumentTextBlock.objects.bulk_create([
+            DocumentTextBlock(
+                content_id=pk,
+                index=i,
+                start=start,
+                end=start + len(text[start:start + BLOCK_CHARS]),
+                data=zlib.compress(text[start:start + BLOCK_CHARS].encode("utf-8", "surrogatepass"), COMPRESSION_LEVEL),
+            )
+            for i, start in enumerate(range(0, len(text), BLOCK_CHARS))
+        ], batch_size=16)
+        DocumentContent.objects.filter(pk=pk).update(
+            text_length=len(text),
+            text_snippet=" ".join(text[:600].split())[:300],
+        )
+
+
+def move_blocks_to_text(apps, schema_editor):
+    DocumentContent = apps.get_model("documents", "DocumentContent")
+    DocumentTextBlock = apps.get_model("documents", "DocumentTextBlock")
+
+    for pk in DocumentContent.objects.filter(text_length__gt=0).values_list("pk", flat=True):
+        blocks = DocumentTextBlock.objects.filter(content_id=pk).order_by("index").values_list("data", flat=True)
+        text = "".join(zlib.decompress(bytes(data)).decode("utf-8", "surrogatepass") for data in blocks)
+        DocumentContent.objects.filter(pk=pk).update(extracted_text=text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcontent',
+            name='text_length',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='documentcontent',
+            name='text_snippet',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.CreateModel(
+            name='DocumentTextBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('start', models.PositiveBigIntegerField()),
+                ('end', models.PositiveBigIntegerField()),
+                ('data', models.BinaryField()),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_blocks', to='documents.documentcontent')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content', 'start'], name='documents_text_block_start')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='documenttextblock',
+            constraint=models.UniqueConstraint(fields=('content', 'index'), name='documents_text_block_unique'),
+        ),
+        migrations.RunPython(move_text_to_blocks, move_blocks_to_text),
+        migrations.RemoveField(
+            model_name='documentcontent',
+            name='extracted_text',
+        ),
+    ]
@@ -6,12 +6,65 @@ def document_upload_path(instance, filename):
     return f"documents/user_{instance.user.id}/{filename}"
 
 
+class DocumentContent(models.Model):
+    """
+    One stored file with its extracted text and vectors, shared by every
+    Document uploaded with the same bytes (see documents/dedup.py). The text
+    itself lives in compressed DocumentTextBlock rows (documents/text_store.py).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    original_name = models.CharField(max_length=255, blank=True)
+    # Characters of extracted text (0 until extraction has finished) and its start
+    text_length = models.PositiveBigIntegerField(default=0)
+    text_snippet = models.CharField(max_length=500, blank=True)
+    # Character offset in the extracted text where each page starts
+    page_offsets = models.JSONField(default=list, blank=True)
+    # Id of the first Document with this content; prefixes its chunk ids
+    source_document_id = models.BigIntegerField()
+    # Chroma collection with the vectors; a replaced document hands its collection on
+    collection_name = models.CharField(max_length=128, blank=True)
+    # Embedding backend of those vectors (documents/embedding_backends.py); "" = the default
+    embedding_backend = models.CharField(max_length=32, blank=True)
+    # Dimensions kept per vector (EMBEDDING_DIMS when indexed); 0 = the model's full width
+    embedding_dims = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.original_name or self.file.name} ({self.sha256[:12]}, refs={self.ref_count})"
+
+
+class DocumentTextBlock(models.Model):
+    """Characters [start, end) of a content's extracted text, zlib-compressed UTF-8."""
+    content = models.ForeignKey(DocumentContent, on_delete=models.CASCADE, related_name="text_blocks")
+    index = models.PositiveIntegerField()
+    start = models.PositiveBigIntegerField()
+    end = models.PositiveBigIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["content", "index"], name="documents_text_block_unique"),
+        ]
+        indexes = [models.Index(fields=["content", "start"], name="documents_text_block_start")]
+
+    def __str__(self):
+        return f"Text of content {self.content_id} [{self.start}, {self.end})"
+
+
 class Document(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="documents")
-    file = models.FileField(upload_to=document_upload_path)
+    file = models.FileField(upload_to=document_upload_path, max_length=255)
     title = models.CharField(max_length=255, blank=True)
-    extracted_text = models.TextField(blank=True)
+    content = models.ForeignKey(DocumentContent, on_delete=models.PROTECT, related_name="documents")
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by every save (replace, rename); with the count and newest id it versions the listing
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "uploaded_at"], name="documents_user_uploaded")]
 
     def __str__(self):
         return self.title or self.file.name
@@ -26,3 +79,55 @@ class DocumentChatMapping(models.Model):
 
     def __str__(self):
         return f"Chat {self.chat_id} -> Doc {self.document.id}"
+
+
+class IngestionJob(models.Model):
+    """DB-backed queue entry for extracting, chunking and embedding one stored file."""
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    content = models.ForeignKey(DocumentContent, on_delete=models.CASCADE, related_name="jobs")
+    # Upload that queued the job (informational; the job survives its deletion)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name="jobs")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    pages_extracted = models.PositiveIntegerField(default=0)
+    chunks_total = models.PositiveIntegerField(default=0)
+    chunks_embedded = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"Job {self.pk} for content {self.content_id} ({self.status})"
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Embedding vector keyed by sha256(model, task_type, chunk text); see documents/embedding_cache.py."""
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=128)
+    task_type = models.CharField(max_length=32)
+    dims = models.PositiveIntegerField()
+    vector = models.BinaryField()  # packed float32
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model_name}/{self.task_type} {self.key[:12]}"
@@ -0,0 +1,386 @@
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from core import metrics
+from core.lru import LRUCache
+
+# -----------------------
+# NUMPY VECTOR STORE (VECTOR_LAYOUT=numpy)
+# -----------------------
+# One file per logical collection: a small header, the chunk ids, texts and
+# metadata as JSON, then the vectors as a float32 matrix that queries
+# memory-map. A query is one matrix-vector product and an argpartition over
+# the scores: exact, no index to build, and for the few thousand chunks of a
+# typical document faster than going through Chroma's SQLite + HNSW.
+# Scopes that grow past VECTOR_NUMPY_MAX_CHUNKS are moved into their own Chroma
+# collection (HNSW, approximate) and searched there from then on.
+#
+# VECTOR_NUMPY_DTYPE stores the matrix as float16 (half the bytes) or int8
+# with a float32 scale per vector (a quarter). Scores are computed on the
+# dequantized values; with VECTOR_NUMPY_RESCORE = n > 0 the file also keeps
+# the float32 vectors, only read for the n * k best candidates of a query,
+# which are re-ranked exactly. Files record their own format, so changing
+# these settings only affects files written afterwards.
+ROOT = getattr(settings, "VECTOR_NUMPY_DIR", os.path.join(settings.BASE_DIR, "vector_index"))
+MAX_CHUNKS = getattr(settings, "VECTOR_NUMPY_MAX_CHUNKS", 10000)
+DTYPE = getattr(settings, "VECTOR_NUMPY_DTYPE", "float32")
+RESCORE = getattr(settings, "VECTOR_NUMPY_RESCORE", 0)
+ANN_PREFIX = "ann__"
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_MAGIC_V1 = b"QVEC1\n"
+_HEADER_V1 = struct.Struct("<6sQQQ")  # magic, rows, dims, JSON bytes
+_MAGIC = b"QVEC2\n"
+_HEADER = struct.Struct("<6sQQQ8sB")  # magic, rows, dims, JSON bytes, dtype, has float32 copy
+_ALIGN = 64
+# Rows dequantized at a time when scoring, to bound the float32 scratch memory
+_BLOCK_ROWS = 4096
+
+# Parsed files by path, revalidated against the file's stat on every open
+_loaded = LRUCache(getattr(settings, "VECTOR_HANDLE_POOL_SIZE", 256))
+_write_locks = LRUCache(4096)
+_write_locks_guard = threading.Lock()
+
+
+def _dir(space):
+    return os.path.join(ROOT, space or "default")
+
+
+def _path(scope, space):
+    return os.path.join(_dir(space), f"{scope}.vec")
+
+
+def _marker(scope, space):
+    return os.path.join(_dir(space), f"{scope}.ann")
+
+
+def ann_name(scope, space=""):
+    """Chroma collection of a scope that outgrew the NumPy store."""
+    return f"{ANN_PREFIX}{space}__{scope}" if space else f"{ANN_PREFIX}{scope}"
+
+
+def is_promoted(scope, space=""):
+    return os.path.exists(_marker(scope, space))
+
+
+def exists(scope, space=""):
+    return os.path.exists(_path(scope, space)) or is_promoted(scope, space)
+
+
+def _write_lock(path):
+    with _write_locks_guard:
+        lock = _write_locks.get(path)
+        if lock is None:
+            lock = threading.Lock()
+            _write_locks.set(path, lock)
+        return lock
+
+
+def quantize(vectors, dtype):
+    """float32 `vectors` -> (stored matrix, per-vector scales or None) for `dtype`."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        return np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8), scales
+    return vectors.astype(DTYPES[dtype]), None
+
+
+def dequantize(stored, scales=None):
+    """float32 copy of stored vectors."""
+    matrix = np.array(stored, dtype=np.float32)
+    return matrix * scales[:, None] if scales is not None else matrix
+
+
+def _pad(offset):
+    return offset + (-offset % _ALIGN)
+
+
+class _Matrix:
+    """
+    A parsed store file: chunk data in memory; the stored (possibly
+    quantized) vectors, their scales and the optional float32 copy memory-mapped.
+    """
+
+    def __init__(self, path=None, stamp=None):
+        self.stamp = stamp
+        self.dtype = "float32"
+        self.scales = self.full = None
+        rows = dims = meta_len = has_full = header = 0
+        meta = {"ids": [], "documents": [], "metadatas": []}
+        if path is not None:
+            with open(path, "rb") as fh:
+                head = fh.read(_HEADER.size)
+                if head.startswith(_MAGIC):
+                    _, rows, dims, meta_len, dtype, has_full = _HEADER.unpack(head)
+                    self.dtype, header = dtype.rstrip(b"\0").decode(), _HEADER.size
+                elif head.startswith(_MAGIC_V1):
+                    # float32 only, written before quantization existed
+                    _, rows, dims, meta_len = _HEADER_V1.unpack(head[:_HEADER_V1.size])
+                    header = _HEADER_V1.size
+                else:
+                    raise ValueError(f"{path} is not a vector store file")
+                fh.seek(header)
+                meta = json.loads(fh.read(meta_len))
+        self.ids = meta["ids"]
+        self.documents = meta["documents"]
+        self.metadatas = meta["metadatas"]
+        self.position = {cid: i for i, cid in enumerate(self.ids)}
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        if not rows:
+            return
+
+        offset = _pad(header + meta_len)
+        stored = np.dtype(DTYPES[self.dtype])
+        self.vectors = np.memmap(path, dtype=stored, mode="r", offset=offset, shape=(rows, dims))
+        offset = _pad(offset + rows * dims * stored.itemsize)
+        if self.dtype == "int8":
+            self.scales = np.array(np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(rows,)))
+            offset = _pad(offset + rows * 4)
+        if has_full:
+            self.full = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(rows, dims))
+        # Squared norms for L2 distances, same metric as Chroma's default
+        self.norms = np.concatenate([
+            np.einsum("ij,ij->i", block, block) for block in self._blocks()
+        ])
+
+    def _blocks(self):
+        """The stored vectors as float32, _BLOCK_ROWS rows at a time."""
+        for start in range(0, len(self.ids), _BLOCK_ROWS):
+            end = start + _BLOCK_ROWS
+            yield dequantize(self.vectors[start:end], None if self.scales is None else self.scales[start:end])
+
+    def dense(self, rows=None):
+        """float32 vectors (exact if the file has a float32 copy), all or `rows`."""
+        rows = slice(None) if rows is None else rows
+        if self.full is not None:
+            return np.array(self.full[rows])
+        return dequantize(self.vectors[rows], None if self.scales is None else self.scales[rows])
+
+    def scores(self, query):
+        """Dot product of every stored vector with `query`."""
+        if self.dtype == "float32":
+            return self.vectors @ query
+        return np.concatenate([block @ query for block in self._blocks()])
+
+
+_EMPTY = _Matrix()
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _load(path):
+    stamp = _stamp(path)
+    if stamp is None:
+        return _EMPTY
+    matrix = _loaded.get(path)
+    if matrix is not None and matrix.stamp == stamp:
+        metrics.incr("vector_numpy.cache_hits")
+        return matrix
+    metrics.incr("vector_numpy.loads")
+    matrix = _Matrix(path, stamp)
+    _loaded.set(path, matrix)
+    return matrix
+
+
+def _save(path, ids, documents, metadatas, vectors):
+    """
+    Write the whole file (float32 `vectors` stored as DTYPE) next to the old
+    one and swap it in atomically.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = json.dumps({"ids": ids, "documents": documents, "metadatas": metadatas}).encode()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rows, dims = vectors.shape if len(ids) else (0, 0)
+    stored, scales = quantize(vectors, DTYPE)
+    keep_full = bool(RESCORE) and DTYPE != "float32"
+    sections = [stored] + ([scales] if scales is not None else []) + ([vectors] if keep_full else [])
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(_MAGIC, rows, dims, len(meta), DTYPE.encode(), keep_full))
+        fh.write(meta)
+        if rows:
+            for section in sections:
+                fh.write(b"\0" * (-fh.tell() % _ALIGN))
+                fh.write(np.ascontiguousarray(section).tobytes())
+    os.replace(tmp, path)
+    _loaded.pop(path)
+
+
+def remove(scope, space=""):
+    path = _path(scope, space)
+    for p in (path, _marker(scope, space)):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+    _loaded.pop(path)
+
+
+# -----------------------
+# SCOPE (same API as vector_store.ScopedCollection)
+# -----------------------
+class NumpyScope:
+    """
+    The chunks of one logical collection in a NumPy store file. Supports the
+    ScopedCollection calls the app makes; once the scope has been promoted to
+    Chroma (see MAX_CHUNKS) every call goes to `ann` instead.
+    """
+
+    def __init__(self, scope, space, ann_opener):
+        self.scope = scope
+        self.space = space
+        self.path = _path(scope, space)
+        # ann_opener(create) -> ScopedCollection of the scope's Chroma collection, or None
+        self._ann_opener = ann_opener
+
+    def _ann(self):
+        return self._ann_opener(False) if is_promoted(self.scope, self.space) else None
+
+    def get(self, include=None, limit=None, offset=None):
+        ann = self._ann()
+        if ann is not None:
+            return ann.get(include=include, limit=limit, offset=offset)
+        m = _load(self.path)
+        start = offset or 0
+        end = len(m.ids) if limit is None else start + limit
+        include = include or []
+        result = {"ids": m.ids[start:end]}
+        result["documents"] = m.documents[start:end] if "documents" in include else None
+        result["metadatas"] = m.metadatas[start:end] if "metadatas" in include else None
+        result["embeddings"] = m.dense(slice(start, end)) if "embeddings" in include else None
+        return result
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        ann = self._ann()
+        if ann is not None:
+            return ann.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        with _write_lock(self.path):
+            m = _load(self.path)
+            new = np.asarray(embeddings, dtype=np.float32)
+            all_ids, docs, metas = list(m.ids), list(m.documents), list(m.metadatas)
+            vectors = m.dense() if len(m.ids) else np.zeros((0, new.shape[1]), dtype=np.float32)
+            appended = []
+            for i, cid in enumerate(ids):
+                pos = m.position.get(cid)
+                if pos is None:
+                    all_ids.append(cid)
+                    docs.append(documents[i])
+                    metas.append(metadatas[i])
+                    appended.append(i)
+                else:
+                    docs[pos], metas[pos] = documents[i], metadatas[i]
+                    vectors[pos] = new[i]
+            vectors = np.concatenate([vectors, new[appended]]) if appended else vectors
+            if len(all_ids) > MAX_CHUNKS:
+                self._promote(all_ids, docs, metas, vectors)
+                return
+            _save(self.path, all_ids, docs, metas, vectors)
+
+    def update(self, ids, metadatas):
+        ann = self._ann()
+        if ann is not None:
+            return ann.update(ids=ids, metadatas=metadatas)
+        with _write_lock(self.path):
+            m = _load(self.path)
+            metas = list(m.metadatas)
+            for cid, meta in zip(ids, metadatas):
+                if cid in m.position:
+                    metas[m.position[cid]] = meta
+            _save(self.path, m.ids, m.documents, metas, m.dense())
+
+    def delete(self, ids):
+        ann = self._ann()
+        if ann is not None:
+            return ann.delete(ids=ids)
+        with _write_lock(self.path):
+            m = _load(self.path)
+            drop = {m.position[cid] for cid in ids if cid in m.position}
+            if not drop:
+                return
+            keep = [i for i in range(len(m.ids)) if i not in drop]
+            _save(
+                self.path,
+                [m.ids[i] for i in keep],
+                [m.documents[i] for i in keep],
+                [m.metadatas[i] for i in keep],
+                m.dense(keep),
+            )
+
+    def query(self, query_embeddings, n_results, include):
+        ann = self._ann()
+        if ann is not None:
+            return ann.query(query_embeddings=query_embeddings, n_results=n_results, include=include)
+        m = _load(self.path)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in query_embeddings:
+            idx, dist = _top_k(m, np.asarray(q, dtype=np.float32), n_results)
+            result["ids"].append([m.ids[i] for i in idx])
+            result["documents"].append([m.documents[i] for i in idx])
+            result["metadatas"].append([m.metadatas[i] for i in idx])
+            result["distances"].append(dist.tolist())
+        return result
+
+    def count(self):
+        ann = self._ann()
+        if ann is not None:
+            return ann.count()
+        return len(_load(self.path).ids)
+
+    def _promote(self, ids, documents, metadatas, vectors, batch=1000):
+        """Move the scope into its own Chroma collection; the marker file switches readers over."""
+        ann = self._ann_opener(True)
+        for start in range(0, len(ids), batch):
+            ann.upsert(
+                ids=ids[start:start + batch],
+                embeddings=vectors[start:start + batch],
+                metadatas=metadatas[start:start + batch],
+                documents=documents[start:start + batch],
+            )
+        with open(_marker(self.scope, self.space), "w") as fh:
+            fh.write(ann_name(self.scope, self.space))
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        _loaded.pop(self.path)
+        metrics.incr("vector_numpy.promotions")
+        print(f"📈 {self.scope}: {len(ids)} chunks, moved to Chroma collection {ann_name(self.scope, self.space)}")
+
+
+def _top_k(m, query, k):
+    """
+    Indices and squared L2 distances of the `k` nearest rows, nearest first.
+    Quantized files with a float32 copy re-rank RESCORE * k candidates exactly.
+    """
+    n = len(m.ids)
+    k = min(k, n)
+    if k <= 0:
+        return [], np.zeros(0, dtype=np.float32)
+    rescore = m.full is not None and RESCORE > 0
+    candidates = min(n, k * RESCORE) if rescore else k
+    # |x - q|^2 = |x|^2 - 2 x.q + |q|^2, one matrix-vector product for all rows
+    distances = m.norms - 2.0 * m.scores(query) + float(query @ query)
+    idx = np.argpartition(distances, candidates - 1)[:candidates] if candidates < n else np.arange(n)
+    if rescore:
+        # Only these rows of the float32 copy are read from disk
+        idx = np.sort(idx)
+        exact = m.dense(idx) - query
+        distances = np.full(n, np.inf, dtype=np.float32)
+        distances[idx] = np.einsum("ij,ij->i", exact, exact)
+        idx = idx[np.argpartition(distances[idx], k - 1)[:k]] if k < len(idx) else idx
+    idx = idx[np.argsort(distances[idx], kind="stable")]
+    return idx.tolist(), np.maximum(distances[idx], 0.0)
@@ -0,0 +1,115 @@
+import queue
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .chunking import get_chunker
+from .extraction import PageStream
+from . import embeddings as doc_embeddings
+from . import text_store
+
+# Pages buffered between extraction and chunking; extraction blocks when full
+PAGE_QUEUE_SIZE = getattr(settings, "PIPELINE_PAGE_QUEUE_SIZE", 8)
+# Extracted text above this size is spooled to a temp file instead of RAM
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+_DONE = object()
+
+
+# -----------------------
+# STREAMING INGESTION PIPELINE
+# -----------------------
+def ingest_document(content, on_progress=None, **extract_options):
+    """
+    extract → chunk → embed → upsert, as overlapping stages:
+
+    - an extractor thread pushes pages into a bounded queue,
+    - the chunker turns queued pages into chunks as they arrive,
+    - the embedding engine pulls chunks lazily (a few batches in flight)
+      and each finished batch is upserted to Chroma right away.
+
+    Every hand-off is bounded, so a slow stage holds back the ones before it
+    and memory depends on batch/queue sizes, not on the document size.
+    The extracted text is spooled to a temp file and written to the
+    compressed text store at the end. `on_progress(pages_extracted=, chunks_total=, chunks_embedded=)`
+    reports the counts so far.
+    """
+    pages_q = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+    stream = PageStream(content.file.path, **extract_options)
+
+    def put(item):
+        # Blocks while the queue is full (backpressure) unless the consumer gave up
+        while not stop.is_set():
+            try:
+                pages_q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def extract():
+        try:
+            for page_text in stream:
+                if not put(page_text):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            put(_DONE)
+
+    progress = {"pages_extracted": 0, "chunks_total": 0, "chunks_embedded": 0}
+    page_offsets = []
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+", encoding="utf-8")
+    length = 0
+
+    def pages():
+        nonlocal length
+        while True:
+            page_text = pages_q.get()
+            if page_text is _DONE:
+                return
+            page_offsets.append(length)
+            spool.write(page_text)
+            length += len(page_text)
+            progress["pages_extracted"] += 1
+            yield page_text
+
+    def chunks():
+        for chunk in get_chunker().chunk_pages(pages()):
+            progress["chunks_total"] += 1
+            yield chunk
+
+    def report(chunks_embedded):
+        progress["chunks_embedded"] = chunks_embedded
+        if on_progress:
+            on_progress(**progress)
+
+    extractor = threading.Thread(target=extract, name=f"extract-content-{content.id}", daemon=True)
+    extractor.start()
+
+    try:
+        print("🔥 PIPELINE STARTED FOR CONTENT:", content.id)
+        chunk_stream = chunks()
+        doc_embeddings.index_chunks(content, chunk_stream, on_progress=report)
+        # Without a vector store nothing was consumed; still extract the text
+        for _ in chunk_stream:
+            pass
+
+        extractor.join()
+        if errors:
+            raise errors[0]
+
+        spool.seek(0)
+        text_store.save(content, spool, page_offsets)
+
+        if on_progress:
+            on_progress(**progress)
+        print(f"✅ Pipeline finished for content {content.id}: {progress}")
+        return progress
+
+    finally:
+        stop.set()
+        spool.close()
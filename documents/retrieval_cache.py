@@ -0,0 +1,244 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from core import metrics
+from core.lru import LRUCache
+
+# -----------------------
+# RETRIEVAL HOT-PATH CACHE
+# -----------------------
+# Two in-process LRUs in front of query_documents:
+#   query embeddings  keyed by normalized question text
+#   top-k results     keyed by (collections, their generations, question hash, k)
+# Generations always live in Django's default cache (see CACHES in settings),
+# so an upsert or delete in any process or ingestion worker invalidates every
+# process's cached results. With RETRIEVAL_CACHE_SHARED the entries go through
+# it too, shared by every process.
+ENABLED = getattr(settings, "RETRIEVAL_CACHE_ENABLED", True)
+SHARED = getattr(settings, "RETRIEVAL_CACHE_SHARED", False)
+QUERY_CACHE_SIZE = getattr(settings, "RETRIEVAL_QUERY_CACHE_SIZE", 2048)
+QUERY_CACHE_TTL = 24 * 3600
+RESULT_CACHE_SIZE = getattr(settings, "RETRIEVAL_RESULT_CACHE_SIZE", 2048)
+# Also bounds how stale results can get when another process re-indexes
+RESULT_CACHE_TTL = getattr(settings, "RETRIEVAL_RESULT_CACHE_TTL", 300)
+
+_query_embeddings = LRUCache(QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+_results = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+_generations = {}
+_generations_lock = threading.Lock()
+# Moving average of what a miss costs, credited as saved latency on a hit
+_miss_ms = {}
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def query_hash(text: str) -> str:
+    return hashlib.sha256(normalize_query(text).encode("utf-8", errors="ignore")).hexdigest()[:32]
+
+
+def _shared_cache():
+    if not SHARED:
+        return None
+    from django.core.cache import cache
+    return cache
+
+
+def _record_hit(name):
+    metrics.incr(f"retrieval_cache.{name}.hits")
+    metrics.incr(f"retrieval_cache.{name}.saved_ms", int(_miss_ms.get(name, 0)))
+
+
+def _record_miss(name, elapsed_ms):
+    metrics.incr(f"retrieval_cache.{name}.misses")
+    previous = _miss_ms.get(name)
+    _miss_ms[name] = elapsed_ms if previous is None else previous * 0.9 + elapsed_ms * 0.1
+
+
+def _cached(name, local, key, compute, ttl, keep=None):
+    value = local.get(key)
+    if value is not None:
+        _record_hit(name)
+        return value
+
+    shared = _shared_cache()
+    shared_key = f"retrieval:{name}:{key}" if shared else None
+    if shared:
+        value = shared.get(shared_key)
+        if value is not None:
+            local.set(key, value)
+            _record_hit(name)
+            return value
+
+    started = time.perf_counter()
+    value = compute()
+    _record_miss(name, (time.perf_counter() - started) * 1000)
+    if keep is not None and not keep(value):
+        return value
+    local.set(key, value)
+    if shared:
+        shared.set(shared_key, value, ttl)
+    return value
+
+
+async def _acached(name, local, key, acompute, ttl, keep=None):
+    """`_cached` for the async views: `acompute` is awaited, shared-cache calls don't block."""
+    value = local.get(key)
+    if value is not None:
+        _record_hit(name)
+        return value
+
+    shared = _shared_cache()
+    shared_key = f"retrieval:{name}:{key}" if shared else None
+    if shared:
+        value = await shared.aget(shared_key)
+        if value is not None:
+            local.set(key, value)
+            _record_hit(name)
+            return value
+
+    started = time.perf_counter()
+    value = await acompute()
+    _record_miss(name, (time.perf_counter() - started) * 1000)
+    if keep is not None and not keep(value):
+        return value
+    local.set(key, value)
+    if shared:
+        await shared.aset(shared_key, value, ttl)
+    return value
+
+
+# -----------------------
+# GENERATIONS / INVALIDATION
+# -----------------------
+# A scope's generation is a random token, replaced on every invalidation. A
+# token that was evicted from the cache comes back as a new one: a miss, never
+# a stale hit. The process-local counter is part of the key too, so local
+# invalidations still work while the cache is unreachable.
+def _generation_cache():
+    from django.core.cache import cache
+    return cache
+
+
+def _gen_key(scope):
+    return f"retrieval:gen:{scope}"
+
+
+def _local_generations(scopes):
+    with _generations_lock:
+        return {s: _generations.get(s, 0) for s in scopes}
+
+
+def _generation_map(scopes):
+    local = _local_generations(scopes)
+    cache = _generation_cache()
+    try:
+        found = cache.get_many([_gen_key(s) for s in scopes])
+        for s in scopes:
+            if _gen_key(s) not in found:
+                cache.add(_gen_key(s), uuid.uuid4().hex, None)
+                found[_gen_key(s)] = cache.get(_gen_key(s))
+    except Exception as e:
+        metrics.incr("retrieval_cache.generation_errors")
+        print("⚠️ Retrieval cache generations unavailable:", e)
+        return local
+    return {s: f"{local[s]}.{found[_gen_key(s)]}" for s in scopes}
+
+
+async def _ageneration_map(scopes):
+    local = _local_generations(scopes)
+    cache = _generation_cache()
+    try:
+        found = await cache.aget_many([_gen_key(s) for s in scopes])
+        for s in scopes:
+            if _gen_key(s) not in found:
+                await cache.aadd(_gen_key(s), uuid.uuid4().hex, None)
+                found[_gen_key(s)] = await cache.aget(_gen_key(s))
+    except Exception as e:
+        metrics.incr("retrieval_cache.generation_errors")
+        print("⚠️ Retrieval cache generations unavailable:", e)
+        return local
+    return {s: f"{local[s]}.{found[_gen_key(s)]}" for s in scopes}
+
+
+def _results_key(scopes, generations, text, k, variant=""):
+    return hashlib.sha256(
+        "|".join(f"{s}@{generations[s]}" for s in scopes).encode()
+    ).hexdigest()[:32] + f":{query_hash(text)}:{k}" + (f":{variant}" if variant else "")
+
+
+def invalidate(scope: str):
+    """Called whenever the chunks of `scope` change; cached top-k results for it stop matching."""
+    with _generations_lock:
+        _generations[scope] = _generations.get(scope, 0) + 1
+    try:
+        _generation_cache().set(_gen_key(scope), uuid.uuid4().hex, None)
+    except Exception as e:
+        metrics.incr("retrieval_cache.generation_errors")
+        print("⚠️ Retrieval cache invalidation not shared:", e)
+    metrics.incr("retrieval_cache.invalidations")
+
+
+# -----------------------
+# PUBLIC API
+# -----------------------
+def query_embedding(text: str, model_name: str, compute):
+    """`compute()` on a miss; keyed by model and normalized text."""
+    if not ENABLED:
+        return compute()
+    return _cached("query_embeddings", _query_embeddings, f"{model_name}:{query_hash(text)}", compute, QUERY_CACHE_TTL)
+
+
+def top_k(scopes, text: str, k: int, compute, variant="", keep=bool):
+    """
+    Ranked hits for `scopes`; `compute()` on a miss or after any of them was
+    invalidated. `variant` separates rankings of the same question (e.g. the
+    retrieval mode). Results failing `keep` are not cached; by default empty
+    ones (the document may still be indexing).
+    """
+    if not ENABLED:
+        return compute()
+    scopes = sorted(set(scopes))
+    key = _results_key(scopes, _generation_map(scopes), text, k, variant)
+    return _cached("results", _results, key, compute, RESULT_CACHE_TTL, keep=keep)
+
+
+async def aquery_embedding(text: str, model_name: str, acompute):
+    """Async `query_embedding`: `await acompute()` on a miss."""
+    if not ENABLED:
+        return await acompute()
+    return await _acached(
+        "query_embeddings", _query_embeddings, f"{model_name}:{query_hash(text)}", acompute, QUERY_CACHE_TTL
+    )
+
+
+async def atop_k(scopes, text: str, k: int, acompute, variant="", keep=bool):
+    """Async `top_k`: `await acompute()` on a miss."""
+    if not ENABLED:
+        return await acompute()
+    scopes = sorted(set(scopes))
+    key = _results_key(scopes, await _ageneration_map(scopes), text, k, variant)
+    return await _acached("results", _results, key, acompute, RESULT_CACHE_TTL, keep=keep)
+
+
+def stats():
+    out = {"enabled": ENABLED, "shared": SHARED, "invalidations": metrics.get("retrieval_cache.invalidations")}
+    for name in ("query_embeddings", "results", "handles"):
+        out[name] = {
+            "hits": metrics.get(f"retrieval_cache.{name}.hits"),
+            "misses": metrics.get(f"retrieval_cache.{name}.misses"),
+            "hit_rate": metrics.hit_rate(f"retrieval_cache.{name}"),
+        }
+        if name != "handles":
+            out[name]["saved_ms"] = metrics.get(f"retrieval_cache.{name}.saved_ms")
+    return out
+
+
+def clear():
+    _query_embeddings.clear()
+    _results.clear()
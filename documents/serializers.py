@@ -3,7 +3,12 @@ from .models import Document
 
 
 class DocumentSerializer(serializers.ModelSerializer):
+    # The text itself is read in spans from /api/documents/{id}/text/. No `file`:
+    # deduplicated content lives under the path of whoever uploaded it first.
+    text_length = serializers.IntegerField(source="content.text_length", read_only=True)
+    text_snippet = serializers.CharField(source="content.text_snippet", read_only=True)
+
     class Meta:
         model = Document
-        fields = ["id", "title", "file", "extracted_text", "uploaded_at"]
-        read_only_fields = ["extracted_text", "uploaded_at"]
+        fields = ["id", "title", "text_length", "text_snippet", "uploaded_at"]
+        read_only_fields = ["text_length", "text_snippet", "uploaded_at"]
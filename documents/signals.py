@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import Signal, receiver
+
+from .models import Document
+
+# Sent with `collection_name` whenever the stored chunks of a collection change
+# (indexed, re-indexed or deleted), so caches derived from them can be dropped.
+chunks_changed = Signal()
+
+
+# -----------------------
+# SHARED CONTENT REFERENCES
+# -----------------------
+@receiver(post_delete, sender=Document)
+def release_document_content(sender, instance, **kwargs):
+    """Covers direct deletes and cascades (e.g. deleting a user)."""
+    from .dedup import release_content
+
+    content_id = instance.content_id
+    transaction.on_commit(lambda: release_content(content_id))
@@ -0,0 +1,142 @@
+import shutil
+import tempfile
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from chat.models import Chat
+from core.pagination import encode_cursor
+from .models import Document, DocumentChatMapping, DocumentContent
+
+# Queries per request, whatever the number of documents:
+# the ETag / Last-Modified aggregate, then the page itself
+PAGE_QUERIES = 2
+NOT_MODIFIED_QUERIES = 1
+
+
+class DocumentListQueriesTests(TestCase):
+    """GET /api/documents/ costs the same number of queries at 1, 10 and 100 documents."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="lister", email="lister@example.invalid")
+        self.chat = Chat.objects.create(user=self.user, title="list queries")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _add_documents(self, count):
+        contents = DocumentContent.objects.bulk_create([
+            DocumentContent(
+                sha256=uuid.uuid4().hex + uuid.uuid4().hex,
+                file=f"documents/content/list-queries-{i}.txt",
+                original_name=f"doc-{i}.txt",
+                text_length=16 * 1024,
+                text_snippet="lorem ipsum",
+                source_document_id=0,
+                ref_count=1,
+            )
+            for i in range(count)
+        ])
+        documents = Document.objects.bulk_create([
+            Document(user=self.user, file=content.file.name, title=content.original_name, content=content)
+            for content in contents
+        ])
+        DocumentChatMapping.objects.bulk_create([
+            DocumentChatMapping(chat_id=self.chat.id, document=d) for d in documents
+        ])
+
+    def _assert_constant_queries(self, count):
+        self._add_documents(count)
+
+        with self.assertNumQueries(PAGE_QUERIES):
+            first = self.client.get("/api/documents/?limit=50")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.data["results"]), min(count, 50))
+        self.assertEqual(first.data["results"][0]["linked_chat_id"], self.chat.id)
+
+        # The page after the newest document: the remaining ones
+        newest = Document.objects.filter(user=self.user).order_by("-uploaded_at", "-id").first()
+        cursor = encode_cursor([newest.uploaded_at, newest.id])
+        with self.assertNumQueries(PAGE_QUERIES):
+            following = self.client.get(f"/api/documents/?limit=50&cursor={cursor}")
+        self.assertEqual(following.status_code, 200)
+        self.assertEqual(len(following.data["results"]), min(count - 1, 50))
+
+        with self.assertNumQueries(NOT_MODIFIED_QUERIES):
+            revalidated = self.client.get("/api/documents/?limit=50", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_one_document(self):
+        self._assert_constant_queries(1)
+
+    def test_ten_documents(self):
+        self._assert_constant_queries(10)
+
+    def test_hundred_documents(self):
+        self._assert_constant_queries(100)
+
+    def test_next_cursor_pages_through_everything(self):
+        self._add_documents(100)
+        seen, query = [], "?limit=30"
+        while True:
+            with self.assertNumQueries(PAGE_QUERIES):
+                page = self.client.get(f"/api/documents/{query}")
+            seen += [d["id"] for d in page.data["results"]]
+            if not page.data["next_cursor"]:
+                break
+            query = f"?limit=30&cursor={page.data['next_cursor']}"
+        self.assertEqual(sorted(seen), sorted(Document.objects.filter(user=self.user).values_list("id", flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class UploadDeduplicationTests(TestCase):
+    """Identical bytes are stored once, without showing one user's upload to another."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _upload(self, user, name):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.post("/api/documents/upload/", {"file": SimpleUploadedFile(name, b"quarterly budget " * 64)})
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def test_other_users_upload_is_not_revealed(self):
+        alice = get_user_model().objects.create(username="alice", email="alice@example.invalid")
+        bob = get_user_model().objects.create(username="bob", email="bob@example.invalid")
+        self._upload(alice, "alice-budget.txt")
+
+        data = self._upload(bob, "budget.txt")
+        self.assertFalse(data["deduplicated"])
+        self.assertNotIn("file", data["document"])
+        self.assertEqual(data["document"]["title"], "budget.txt")
+        # Still stored once
+        self.assertEqual(DocumentContent.objects.count(), 1)
+
+        # Alice's job indexes Bob's document too: only its coarse state is shown to him
+        client = APIClient()
+        client.force_authenticate(user=bob)
+        job = client.get(data["status_url"]).data
+        self.assertFalse(job["deduplicated"])
+        self.assertEqual(job["status"], "queued")
+        for field in ("job_id", "attempts", "error", "created_at", "started_at", "finished_at"):
+            self.assertNotIn(field, job)
+
+    def test_own_duplicate_is_reported(self):
+        alice = get_user_model().objects.create(username="alice", email="alice@example.invalid")
+        self.assertFalse(self._upload(alice, "budget.txt")["deduplicated"])
+        data = self._upload(alice, "budget-copy.txt")
+        self.assertTrue(data["deduplicated"])
+
+        client = APIClient()
+        client.force_authenticate(user=alice)
+        job = client.get(data["status_url"]).data
+        self.assertTrue(job["deduplicated"])
+        self.assertIn("job_id", job)
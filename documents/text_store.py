@@ -0,0 +1,186 @@
+import io
+import time
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from core import metrics
+from core.lru import LRUCache
+from .models import DocumentTextBlock
+
+# -----------------------
+# TEXT STORE SETTINGS
+# -----------------------
+# Extracted text is kept as zlib-compressed blocks of BLOCK_CHARS characters in
+# DocumentTextBlock rows, each with its [start, end) character range. A span is
+# read by decompressing only the blocks it overlaps, so nothing that serves a
+# document (listing, upload response, context assembly) loads its whole text.
+BLOCK_CHARS = getattr(settings, "DOCUMENT_TEXT_BLOCK_CHARS", 64 * 1024)
+COMPRESSION_LEVEL = getattr(settings, "DOCUMENT_TEXT_COMPRESSION_LEVEL", 6)
+MAX_SPAN_CHARS = getattr(settings, "DOCUMENT_TEXT_MAX_SPAN_CHARS", 64 * 1024)
+SNIPPET_CHARS = 300
+# Blocks inserted per statement
+WRITE_BATCH = 16
+
+# Decompressed blocks by (content id, start, end); stored text never changes in place
+_blocks = LRUCache(max_entries=getattr(settings, "DOCUMENT_TEXT_CACHE_BLOCKS", 64))
+
+
+def _compress(text):
+    return zlib.compress(text.encode("utf-8", "surrogatepass"), COMPRESSION_LEVEL)
+
+
+def _decompress(data):
+    return zlib.decompress(bytes(data)).decode("utf-8", "surrogatepass")
+
+
+def snippet(text):
+    return " ".join(text[:SNIPPET_CHARS * 2].split())[:SNIPPET_CHARS]
+
+
+# -----------------------
+# WRITE
+# -----------------------
+def save(content, text, page_offsets):
+    """
+    Replace the stored text of a DocumentContent. `text` is a string or an
+    open text file, read BLOCK_CHARS characters at a time so a large spooled
+    extraction never sits in memory whole. Also saves the length, snippet and
+    page offsets on the content.
+    """
+    source = io.StringIO(text) if isinstance(text, str) else text
+    started = time.perf_counter()
+    length = raw = packed = 0
+    first = ""
+    with transaction.atomic():
+        DocumentTextBlock.objects.filter(content=content).delete()
+        batch, index = [], 0
+        while True:
+            block = source.read(BLOCK_CHARS)
+            if not block:
+                break
+            first = first or block
+            data = _compress(block)
+            raw += len(block.encode("utf-8", "surrogatepass"))
+            packed += len(data)
+            batch.append(DocumentTextBlock(
+                content=content, index=index, start=length, end=length + len(block), data=data,
+            ))
+            index += 1
+            length += len(block)
+            if len(batch) >= WRITE_BATCH:
+                DocumentTextBlock.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            DocumentTextBlock.objects.bulk_create(batch)
+
+        content.text_length = length
+        content.text_snippet = snippet(first)
+        content.page_offsets = page_offsets
+        content.save(update_fields=["text_length", "text_snippet", "page_offsets"])
+
+    _blocks.discard_where(lambda key: key[0] == content.pk)
+    metrics.incr("text_store.bytes_raw", raw)
+    metrics.incr("text_store.bytes_stored", packed)
+    metrics.observe("text_store.write_ms", round((time.perf_counter() - started) * 1000, 2))
+    print(f"🗜️ Stored text of content {content.pk}: {length} chars, "
+          f"{raw} -> {packed} bytes in {index} blocks")
+    return length
+
+
+# -----------------------
+# READ
+# -----------------------
+def _load(content_id, rows):
+    """(pk, start, end) block rows -> [(start, end, text)], decompressing only uncached blocks."""
+    texts, missing = {}, []
+    for pk, start, end in rows:
+        text = _blocks.get((content_id, start, end))
+        if text is None:
+            missing.append(pk)
+        else:
+            texts[pk] = text
+    if missing:
+        for pk, start, end, data in (
+            DocumentTextBlock.objects.filter(pk__in=missing).values_list("pk", "start", "end", "data")
+        ):
+            texts[pk] = _decompress(data)
+            _blocks.set((content_id, start, end), texts[pk])
+    metrics.incr("text_store.blocks_read", len(missing))
+    metrics.incr("text_store.block_cache_hits", len(rows) - len(missing))
+    return [(start, end, texts[pk]) for pk, start, end in rows]
+
+
+def read_spans(content_id, ranges):
+    """Text of each (start, end) character range of a content, clipped to the stored text."""
+    ranges = [(max(0, start), max(0, end)) for start, end in ranges]
+    wanted = Q()
+    for start, end in ranges:
+        if start < end:
+            wanted |= Q(start__lt=end, end__gt=start)
+    if not wanted:
+        return ["" for _ in ranges]
+
+    rows = list(
+        DocumentTextBlock.objects.filter(wanted, content_id=content_id)
+        .order_by("start")
+        .values_list("pk", "start", "end")
+    )
+    blocks = _load(content_id, rows)
+    return [
+        "".join(text[max(0, start - b_start):end - b_start] for b_start, b_end, text in blocks
+                if b_start < end and b_end > start)
+        for start, end in ranges
+    ]
+
+
+def read_span(content_id, start, end):
+    return read_spans(content_id, [(start, end)])[0]
+
+
+def iter_blocks(content_id):
+    """The whole stored text, one decompressed block at a time (bypasses the block cache)."""
+    rows = (
+        DocumentTextBlock.objects.filter(content_id=content_id)
+        .order_by("index")
+        .values_list("data", flat=True)
+        .iterator(chunk_size=WRITE_BATCH)
+    )
+    for data in rows:
+        yield _decompress(data)
+
+
+def iter_pages(content):
+    """The stored text split at `content.page_offsets`, holding about one page in memory."""
+    bounds = list(content.page_offsets or [0])[1:] + [content.text_length]
+    blocks = iter_blocks(content.pk)
+    buf, buf_start = "", 0
+    for end in bounds:
+        parts = [buf]
+        filled = buf_start + len(buf)
+        while filled < end:
+            block = next(blocks, None)
+            if block is None:
+                break
+            parts.append(block)
+            filled += len(block)
+        buf = "".join(parts)
+        cut = end - buf_start
+        yield buf[:cut]
+        buf, buf_start = buf[cut:], end
+
+
+def read_text(content):
+    """The whole text in one string; for tools, not request paths."""
+    return "".join(iter_blocks(content.pk))
+
+
+def page_range(page_offsets, length, page):
+    """(start, end) characters of 1-based `page` in a text of `length`, or None if there is no such page."""
+    offsets = page_offsets or ([0] if length else [])
+    if not 1 <= page <= len(offsets):
+        return None
+    end = offsets[page] if page < len(offsets) else length
+    return offsets[page - 1], end
@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+test_document_query = (
+    views.test_document_query_async if getattr(settings, "ASYNC_VIEWS", False) else views.test_document_query
+)
+
 urlpatterns = [
     path("upload/", views.UploadDocumentView.as_view(), name="documents-upload"),
     path("", views.ListDocumentsView.as_view(), name="documents-list"),
     path("<int:pk>/", views.DeleteDocumentView.as_view(), name="documents-detail"),
+    path("<int:pk>/status/", views.DocumentStatusView.as_view(), name="documents-status"),
+    path("<int:pk>/text/", views.DocumentTextView.as_view(), name="documents-text"),
+    path("<int:pk>/replace/", views.ReplaceDocumentView.as_view(), name="documents-replace"),
     
-    path("test-query/", views.test_document_query),
+    path("test-query/", test_document_query),
     
 ]
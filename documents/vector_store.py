@@ -0,0 +1,278 @@
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from core import metrics
+from core.lru import LRUCache
+
+from . import numpy_store
+
+# -----------------------
+# COLLECTION LAYOUTS
+# -----------------------
+# per_document: one Chroma collection per DocumentContent (`document_{id}`)
+# shared:       every chunk in one collection, filtered by `scope` metadata
+# sharded:      `VECTOR_SHARDS` collections, a content's chunks in one of them
+# numpy:        no Chroma for small collections: a memory-mapped matrix per
+#               DocumentContent searched by brute force (see numpy_store.py),
+#               its own Chroma collection once it outgrows VECTOR_NUMPY_MAX_CHUNKS
+#
+# A `space` keeps vectors of different embedding backends apart in the shared
+# and sharded layouts (`chunks__onnx-minilm`, ...); "" is the default backend
+# and keeps the original names. Per-document collections hold one backend each.
+LAYOUT_PER_DOCUMENT = "per_document"
+LAYOUT_SHARED = "shared"
+LAYOUT_SHARDED = "sharded"
+LAYOUT_NUMPY = "numpy"
+LAYOUTS = (LAYOUT_PER_DOCUMENT, LAYOUT_SHARED, LAYOUT_SHARDED, LAYOUT_NUMPY)
+
+SHARED_COLLECTION = "chunks"
+SCOPE_KEY = "scope"
+
+# Open collection handles, so hot queries skip the client's name lookup
+_handles = LRUCache(getattr(settings, "VECTOR_HANDLE_POOL_SIZE", 256))
+
+
+def current_layout():
+    layout = getattr(settings, "VECTOR_LAYOUT", LAYOUT_PER_DOCUMENT)
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown VECTOR_LAYOUT {layout!r}; expected one of {list(LAYOUTS)}")
+    return layout
+
+
+def physical_name(scope, layout=None, shards=None, space=""):
+    """Chroma collection (NumPy store file for the numpy layout) holding the chunks of `scope`."""
+    layout = layout or current_layout()
+    if layout == LAYOUT_PER_DOCUMENT:
+        return scope
+    if layout == LAYOUT_NUMPY:
+        return numpy_store.ann_name(scope, space) if numpy_store.is_promoted(scope, space) else (
+            f"{space or 'default'}/{scope}.vec"
+        )
+    base = f"{SHARED_COLLECTION}__{space}" if space else SHARED_COLLECTION
+    if layout == LAYOUT_SHARED:
+        return base
+    shards = shards or getattr(settings, "VECTOR_SHARDS", 16)
+    # crc32 is stable across processes, unlike hash()
+    return f"{base}_{zlib.crc32(scope.encode()) % shards:03d}"
+
+
+class ScopedCollection:
+    """
+    The chunks of one logical collection (a DocumentContent's `collection_name`).
+
+    Exposes the subset of the Chroma collection API the app uses. In the
+    per-document layout calls go straight to the collection; in the shared and
+    sharded layouts every call is restricted to chunks whose `scope` metadata
+    matches, and chunk ids are prefixed with the scope so they stay unique.
+    Ids and metadata are returned exactly as they were passed in.
+    """
+
+    def __init__(self, collection, scope, shared):
+        self.collection = collection
+        self.scope = scope
+        self.shared = shared
+
+    def _ids(self, ids):
+        return [f"{self.scope}/{i}" for i in ids] if self.shared else list(ids)
+
+    def _strip_id(self, cid):
+        return cid[len(self.scope) + 1:] if self.shared else cid
+
+    def _metas(self, metadatas):
+        if not self.shared:
+            return metadatas
+        return [{**(m or {}), SCOPE_KEY: self.scope} for m in metadatas]
+
+    def _strip_meta(self, meta):
+        if not self.shared or not meta:
+            return meta
+        return {k: v for k, v in meta.items() if k != SCOPE_KEY}
+
+    def _where(self):
+        return {SCOPE_KEY: self.scope} if self.shared else None
+
+    def get(self, include=None, limit=None, offset=None):
+        result = self.collection.get(
+            where=self._where(), include=include or [], limit=limit, offset=offset
+        )
+        result["ids"] = [self._strip_id(i) for i in result.get("ids") or []]
+        if result.get("metadatas") is not None:
+            result["metadatas"] = [self._strip_meta(m) for m in result["metadatas"]]
+        return result
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.collection.upsert(
+            ids=self._ids(ids),
+            embeddings=embeddings,
+            metadatas=self._metas(metadatas),
+            documents=documents,
+        )
+
+    def update(self, ids, metadatas):
+        self.collection.update(ids=self._ids(ids), metadatas=self._metas(metadatas))
+
+    def delete(self, ids):
+        self.collection.delete(ids=self._ids(ids))
+
+    def query(self, query_embeddings, n_results, include):
+        result = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=self._where(),
+            include=include,
+        )
+        result["ids"] = [[self._strip_id(i) for i in row] for row in result.get("ids") or []]
+        if result.get("metadatas") is not None:
+            result["metadatas"] = [[self._strip_meta(m) for m in row] for row in result["metadatas"]]
+        return result
+
+    def count(self):
+        if not self.shared:
+            return self.collection.count()
+        return len(self.collection.get(where=self._where(), include=[])["ids"])
+
+
+# -----------------------
+# HANDLE POOL
+# -----------------------
+def get_handle(client, name, create=False):
+    """Pooled Chroma collection `name`; None if missing and not `create`."""
+    key = (id(client), name)
+    collection = _handles.get(key)
+    if collection is not None:
+        metrics.incr("retrieval_cache.handles.hits")
+        return collection
+
+    metrics.incr("retrieval_cache.handles.misses")
+    if create:
+        collection = client.get_or_create_collection(name=name)
+    else:
+        try:
+            collection = client.get_collection(name=name)
+        except Exception:
+            return None
+    _handles.set(key, collection)
+    return collection
+
+
+def forget_handle(client, name):
+    _handles.pop((id(client), name))
+
+
+def open_scope(client, scope, create=True, layout=None, shards=None, space=""):
+    """ScopedCollection for `scope`, or None if it does not exist and `create` is False."""
+    layout = layout or current_layout()
+    if layout == LAYOUT_NUMPY:
+        if not create and not numpy_store.exists(scope, space):
+            return None
+
+        def open_ann(create_ann):
+            ann = get_handle(client, numpy_store.ann_name(scope, space), create=create_ann)
+            return ScopedCollection(ann, scope, shared=False) if ann is not None else None
+
+        return numpy_store.NumpyScope(scope, space, open_ann)
+    collection = get_handle(client, physical_name(scope, layout, shards, space), create=create)
+    if collection is None:
+        return None
+    return ScopedCollection(collection, scope, shared=layout != LAYOUT_PER_DOCUMENT)
+
+
+def drop_scope(client, scope, layout=None, shards=None, space=""):
+    """Delete every chunk of `scope` (the whole collection in the per-document layout)."""
+    layout = layout or current_layout()
+    if layout == LAYOUT_NUMPY:
+        if numpy_store.is_promoted(scope, space):
+            name = numpy_store.ann_name(scope, space)
+            forget_handle(client, name)
+            client.delete_collection(name=name)
+        numpy_store.remove(scope, space)
+        return
+    if layout == LAYOUT_PER_DOCUMENT:
+        forget_handle(client, scope)
+        client.delete_collection(name=scope)
+        return
+    collection = get_handle(client, physical_name(scope, layout, shards, space))
+    if collection is not None:
+        collection.delete(where={SCOPE_KEY: scope})
+
+
+# -----------------------
+# MULTI-SCOPE QUERY
+# -----------------------
+def query_scopes(client, scopes, query_embedding, n_results, layout=None, max_workers=8, space=""):
+    """
+    Nearest chunks to `query_embedding` across several logical collections,
+    all embedded in the same `space` as the query.
+
+    Scopes that live in the same physical collection (shared/sharded layouts)
+    are searched with one filtered query; separate collections are queried in
+    parallel. Returns up to `n_results` hits per physical collection as dicts
+    with scope, id, text, metadata and distance (not merged or sorted).
+    """
+    layout = layout or current_layout()
+    groups = defaultdict(list)
+    for scope in dict.fromkeys(scopes):
+        groups[physical_name(scope, layout, space=space)].append(scope)
+
+    def search(item):
+        name, members = item
+        if layout == LAYOUT_NUMPY:
+            # Exact in-process search, or the scope's own Chroma collection past the threshold
+            collection = open_scope(client, members[0], create=False, layout=layout, space=space)
+            if collection is None:
+                return []
+            result = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=["documents", "metadatas", "distances"],
+            )
+            return [
+                {"scope": members[0], "id": cid, "text": text, "metadata": dict(meta or {}), "distance": dist}
+                for cid, text, meta, dist in zip(
+                    result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+                )
+            ]
+        collection = get_handle(client, name)
+        if collection is None:
+            return []
+        if layout == LAYOUT_PER_DOCUMENT:
+            where = None
+        elif len(members) == 1:
+            where = {SCOPE_KEY: members[0]}
+        else:
+            where = {SCOPE_KEY: {"$in": members}}
+
+        try:
+            result = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include=["documents", "metadatas", "distances"],
+            )
+        except Exception as e:
+            # The collection may have been deleted by another process
+            forget_handle(client, name)
+            print(f"Query error in {name}:", e)
+            return []
+        hits = []
+        for cid, text, meta, dist in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+        ):
+            meta = dict(meta or {})
+            scope = meta.pop(SCOPE_KEY, members[0])
+            if layout != LAYOUT_PER_DOCUMENT:
+                cid = cid[len(scope) + 1:]
+            hits.append({"scope": scope, "id": cid, "text": text, "metadata": meta, "distance": dist})
+        return hits
+
+    items = list(groups.items())
+    # Brute-force searches take microseconds: a thread pool would only add overhead
+    in_process = layout == LAYOUT_NUMPY and not any(n.startswith(numpy_store.ANN_PREFIX) for n in groups)
+    if len(items) <= 1 or in_process:
+        return [hit for item in items for hit in search(item)]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="vector-query") as pool:
+        return [hit for hits in pool.map(search, items) for hit in hits]
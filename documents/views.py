@@ -1,10 +1,17 @@
+import hashlib
+import json
 import os
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
-from django.core.files.storage import default_storage
 
 from rest_framework.decorators import api_view, permission_classes
 
@@ -12,57 +19,29 @@ from .models import Document, DocumentChatMapping
 from .serializers import DocumentSerializer
 
 from chat.models import Chat
+from core.authentication import CachedJWTAuthentication
+from core.pagination import keyset_page
 from . import embeddings as doc_embeddings
 
-# -------------------------
-# TEXT EXTRACTION IMPORTS
-# -------------------------
-try:
-    import pdfplumber
-except Exception:
-    pdfplumber = None
+# Kept importable from here for existing callers
+from .extraction import extract_text_from_file  # noqa: F401
+from . import dedup, ingestion, text_store
 
-try:
-    import docx
-except Exception:
-    docx = None
 
+def _validate_upload(file_obj):
+    if not file_obj:
+        return Response({"detail": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-# -------------------------
-# FIXED TEXT EXTRACTION
-# -------------------------
-def extract_text_from_file(fpath):
-    """
-    Extract text from PDF, DOCX, or TXT files.
-    SAFE: only fixes PDF extraction
-    """
-    ext = os.path.splitext(fpath)[1].lower()
-    text = ""
+    if file_obj.size > 100 * 1024 * 1024:
+        return Response({"detail": "File too large (max 100 MB)"}, status=status.HTTP_400_BAD_REQUEST)
 
-    try:
-        # PDF
-        if ext == ".pdf" and pdfplumber:
-            with pdfplumber.open(fpath) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-
-        # DOCX
-        elif ext == ".docx" and docx:
-            doc = docx.Document(fpath)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-
-        # TXT / fallback
-        else:
-            with open(fpath, "r", encoding="utf-8", errors="ignore") as fh:
-                text = fh.read()
+    allowed = [".pdf", ".txt", ".docx"]
+    ext = os.path.splitext(file_obj.name)[1].lower()
 
-    except Exception as e:
-        print("Error extracting text:", e)
+    if ext not in allowed:
+        return Response({"detail": "Unsupported file type"}, status=status.HTTP_400_BAD_REQUEST)
 
-    return text
+    return None
 
 
 # -------------------------
@@ -73,78 +52,230 @@ class UploadDocumentView(APIView):
 
     def post(self, request, format=None):
         file_obj = request.FILES.get("file")
-        if not file_obj:
-            return Response({"detail": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if file_obj.size > 100 * 1024 * 1024:
-            return Response({"detail": "File too large (max 100 MB)"}, status=status.HTTP_400_BAD_REQUEST)
+        error = _validate_upload(file_obj)
+        if error:
+            return error
 
         filename = file_obj.name
-        allowed = [".pdf", ".txt", ".docx"]
-        ext = os.path.splitext(filename)[1].lower()
 
-        if ext not in allowed:
-            return Response({"detail": "Unsupported file type"}, status=status.HTTP_400_BAD_REQUEST)
+        # Optional: add the document to an existing chat instead of starting one
+        chat = None
+        chat_id = request.data.get("chat_id")
+        if chat_id:
+            chat = Chat.objects.filter(pk=chat_id, user=request.user).first()
+            if chat is None:
+                return Response({"detail": "Chat not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Save file
-        save_path = default_storage.save(
-            f"documents/user_{request.user.id}/{filename}", file_obj
-        )
-        full_path = os.path.join(settings.MEDIA_ROOT, save_path)
-
-        # Extract text
-        extracted = extract_text_from_file(full_path)
-
-        doc = Document.objects.create(
-            user=request.user,
-            file=save_path,
-            title=filename,
-            extracted_text=extracted
-        )
+        # Save file (identical bytes reuse the stored file, text and vectors)
+        doc, content, created = dedup.store_upload(request.user, file_obj, filename)
 
         # Create chat
-        chat = Chat.objects.create(user=request.user, title=filename)
+        if chat is None:
+            chat = Chat.objects.create(user=request.user, title=filename)
 
         # Map chat ↔ document
         DocumentChatMapping.objects.create(chat_id=chat.id, document=doc)
 
-        # Generate embeddings (SAFE CALL)
-        # Generate embeddings
+        # Extraction + embeddings run in the background worker pool
+        if created or ingestion.needs_ingestion(content):
+            job = ingestion.enqueue_content(content, document=doc)
+        else:
+            job = ingestion.latest_job(doc)
+
+        serializer = DocumentSerializer(doc, context={"request": request})
+        return Response(
+            {
+                "document": serializer.data,
+                "chat_id": chat.id,
+                "job_id": job.id if job else None,
+                # Only about the user's own uploads: another user's file must not show through
+                "deduplicated": not created and dedup.has_other_document(request.user, content, doc),
+                "status_url": f"/api/documents/{doc.id}/status/",
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+# -------------------------
+# REPLACE DOCUMENT (NEW REVISION)
+# -------------------------
+class ReplaceDocumentView(APIView):
+    """
+    Upload a revised file for an existing document. The document id and its
+    chat mapping stay the same; re-indexing only embeds chunks that changed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
         try:
-            doc_embeddings.upsert_document_embeddings(doc)
-        except Exception as e:
-            print("Embedding upsert failed:", e)
-            import traceback
-            traceback.print_exc()
+            doc = Document.objects.select_related("user").get(pk=pk, user=request.user)
+        except Document.DoesNotExist:
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        file_obj = request.FILES.get("file")
+        error = _validate_upload(file_obj)
+        if error:
+            return error
+
+        previous_content_id = doc.content_id
+        content, created = dedup.replace_upload(doc, file_obj, file_obj.name)
+
+        if created or ingestion.needs_ingestion(content):
+            job = ingestion.enqueue_content(content, document=doc)
+        else:
+            job = ingestion.latest_job(doc)
 
         serializer = DocumentSerializer(doc, context={"request": request})
         return Response(
-            {"document": serializer.data, "chat_id": chat.id},
-            status=status.HTTP_201_CREATED
+            {
+                "document": serializer.data,
+                "job_id": job.id if job else None,
+                "unchanged": content.pk == previous_content_id,
+                "status_url": f"/api/documents/{doc.id}/status/",
+            },
+            status=status.HTTP_202_ACCEPTED
         )
 
 
+# -------------------------
+# INGESTION STATUS
+# -------------------------
+class DocumentStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            doc = Document.objects.only("id", "content").get(pk=pk, user=request.user)
+        except Document.DoesNotExist:
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(ingestion.job_status(doc))
+
+
+# -------------------------
+# DOCUMENT TEXT (SPANS)
+# -------------------------
+class DocumentTextView(APIView):
+    """
+    GET /api/documents/{id}/text/?start=0&end=4096  or  ?page=3
+
+    A span of the extracted text, decompressed from the stored blocks it
+    overlaps. At most DOCUMENT_TEXT_MAX_SPAN_CHARS characters per request;
+    continue from the returned `end` for more.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        fields = ["content_id", "content__text_length"]
+        if "page" in request.query_params:
+            fields.append("content__page_offsets")
+        row = Document.objects.filter(pk=pk, user=request.user).values(*fields).first()
+        if row is None:
+            return Response({"detail": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+        length = row["content__text_length"]
+
+        try:
+            if "page" in request.query_params:
+                page = int(request.query_params["page"])
+                span = text_store.page_range(row["content__page_offsets"], length, page)
+                if span is None:
+                    return Response({"detail": "No such page"}, status=status.HTTP_404_NOT_FOUND)
+                start, end = span
+            else:
+                page = None
+                start = int(request.query_params.get("start", 0))
+                end = int(request.query_params.get("end", start + text_store.MAX_SPAN_CHARS))
+        except ValueError:
+            return Response({"detail": "Invalid start, end or page"}, status=status.HTTP_400_BAD_REQUEST)
+        if start < 0 or end < start:
+            return Response({"detail": "Invalid start, end or page"}, status=status.HTTP_400_BAD_REQUEST)
+
+        start = min(start, length)
+        end = min(end, length, start + text_store.MAX_SPAN_CHARS)
+        return Response({
+            "document_id": pk,
+            "start": start,
+            "end": end,
+            "length": length,
+            "page": page,
+            "text": text_store.read_span(row["content_id"], start, end) if end > start else "",
+        })
+
+
 # -------------------------
 # LIST DOCUMENTS
 # -------------------------
+LIST_PAGE_SIZE = 50
+LIST_MAX_PAGE_SIZE = 200
+
+
+def _listing_version(request):
+    """
+    (count, newest id, last change) of the user's documents, one aggregate
+    query per request: any upload, delete or replace changes it.
+    """
+    if not hasattr(request, "_documents_version"):
+        request._documents_version = Document.objects.filter(user=request.user).aggregate(
+            count=Count("id"), newest=Max("id"), changed=Max("updated_at")
+        )
+    return request._documents_version
+
+
+def _listing_etag(request, *args, **kwargs):
+    version = _listing_version(request)
+    raw = f"{request.user.pk}:{version['count']}:{version['newest']}:{version['changed']}:{request.GET.urlencode()}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _listing_last_modified(request, *args, **kwargs):
+    return _listing_version(request)["changed"]
+
+
 class ListDocumentsView(APIView):
+    """
+    GET /api/documents/?limit=50&cursor=<next_cursor>
+
+    The user's documents, newest first, in keyset-paginated pages. One query
+    per page whatever the number of documents: the text is never loaded and
+    the linked chat comes from a subquery. Responses carry an ETag and
+    Last-Modified, so a refresh with If-None-Match / If-Modified-Since gets
+    an empty 304 while nothing changed.
+    """
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(condition(etag_func=_listing_etag, last_modified_func=_listing_last_modified))
     def get(self, request):
-        docs = Document.objects.filter(user=request.user).order_by("-uploaded_at")
-        data = []
+        try:
+            limit = min(max(int(request.query_params.get("limit", LIST_PAGE_SIZE)), 1), LIST_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({"detail": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
 
-        for d in docs:
-            mapping = DocumentChatMapping.objects.filter(document=d).first()
-            data.append({
+        linked_chat = (
+            DocumentChatMapping.objects.filter(document=OuterRef("pk")).order_by("pk").values("chat_id")[:1]
+        )
+        docs = (
+            Document.objects.filter(user=request.user)
+            .only("id", "title", "uploaded_at")
+            .annotate(linked_chat_id=Subquery(linked_chat))
+        )
+        try:
+            page, next_cursor = keyset_page(docs, ("uploaded_at", "id"), request.query_params.get("cursor"), limit)
+        except ValueError:
+            return Response({"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [
+            {
                 "id": d.id,
                 "title": d.title,
-                "file": d.file.url if d.file else None,
                 "uploaded_at": d.uploaded_at,
-                "linked_chat_id": mapping.chat_id if mapping else None,
-            })
-
-        return Response(data)
+                "linked_chat_id": d.linked_chat_id,
+            }
+            for d in page
+        ]
+        response = Response({"results": results, "next_cursor": next_cursor})
+        # Cacheable by the browser, but revalidated on every use
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
 
 # -------------------------
@@ -161,21 +292,8 @@ class DeleteDocumentView(APIView):
 
         DocumentChatMapping.objects.filter(document=doc).delete()
 
-        try:
-            doc.file.delete(save=False)
-        except Exception:
-            pass
-
-        # Remove Chroma collection (SAFE)
-        try:
-            import chromadb
-            client = chromadb.PersistentClient(
-                path=os.path.join(settings.BASE_DIR, "chroma_db")
-            )
-            client.delete_collection(name=f"document_{doc.id}")
-        except Exception as e:
-            print("Chroma delete failed:", e)
-
+        # The stored file and Chroma collection are shared by identical uploads;
+        # documents.signals releases them once the last document is gone.
         doc.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -187,18 +305,26 @@ class DeleteDocumentView(APIView):
 @permission_classes([IsAuthenticated])
 def test_document_query(request):
     document_id = request.data.get("document_id")
+    document_ids = request.data.get("document_ids") or ([document_id] if document_id else [])
     question = request.data.get("question")
+    mode = request.data.get("mode") or None
 
-    if not document_id or not question:
+    if not document_ids or not question:
         return Response(
-            {"error": "document_id and question required"},
+            {"error": "document_id (or document_ids) and question required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if mode and mode not in doc_embeddings.RETRIEVAL_MODES:
+        return Response(
+            {"error": f"mode must be one of {list(doc_embeddings.RETRIEVAL_MODES)}"},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    results = doc_embeddings.query_document(
-        document_id=int(document_id),
+    results = doc_embeddings.query_documents(
+        [int(i) for i in document_ids],
         query=question,
-        top_k=5
+        top_k=5,
+        mode=mode,
     )
 
     return Response({
@@ -206,3 +332,54 @@ def test_document_query(request):
         "question": question,
         "matches": results
     })
+
+
+async def test_document_query_async(request):
+    """
+    `test_document_query` for the ASGI deployment (DRF views are sync-only):
+    same JWT auth, request and response, with the query embedding awaited.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    authenticator = CachedJWTAuthentication()
+    try:
+        auth = await sync_to_async(authenticator.authenticate)(request)
+        detail = None if auth else {"detail": "Authentication credentials were not provided."}
+    except AuthenticationFailed as e:
+        detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+    if detail:
+        response = JsonResponse(detail, status=401)
+        response["WWW-Authenticate"] = authenticator.authenticate_header(request)
+        return response
+
+    if request.content_type == "application/json":
+        data = json.loads(request.body or "{}")
+    else:
+        data = request.POST
+    document_id = data.get("document_id")
+    document_ids = data.get("document_ids") or ([document_id] if document_id else [])
+    question = data.get("question")
+    mode = data.get("mode") or None
+
+    if not document_ids or not question:
+        return JsonResponse({"error": "document_id (or document_ids) and question required"}, status=400)
+    if mode and mode not in doc_embeddings.RETRIEVAL_MODES:
+        return JsonResponse({"error": f"mode must be one of {list(doc_embeddings.RETRIEVAL_MODES)}"}, status=400)
+
+    results = await doc_embeddings.aquery_documents(
+        [int(i) for i in document_ids],
+        query=question,
+        top_k=5,
+        mode=mode,
+    )
+
+    return JsonResponse({
+        "document_id": document_id,
+        "question": question,
+        "matches": results
+    })
+
+
+# Django 4.2's csrf_exempt wraps views in a sync function; DRF's api_view exempts the sync twin
+test_document_query_async.csrf_exempt = True
@@ -3,6 +3,7 @@ document.addEventListener("DOMContentLoaded", () => {
     console.log("✅ chat.js loaded");
 
     const GEMINI_URL = "/api/chat/gemini/"; // ✅ Using Gemini API only
+    const GEMINI_STREAM_URL = "/api/chat/gemini/stream/"; // Server-sent events, token by token
 
     const DOC_UPLOAD_URL = "/api/documents/upload/";
 
@@ -73,11 +74,14 @@ document.addEventListener("DOMContentLoaded", () => {
                     });
                     if (!response.ok) throw new Error("Upload failed");
                     const data = await response.json();
-                    addMessage(`📄 Document \"${file.name}\" uploaded successfully!`, "bot");
+                    addMessage(`📄 Document \"${file.name}\" uploaded successfully! Processing...`, "bot");
                     if (data.chat_id) {
                         currentChatId = data.chat_id;
                         sessionStorage.setItem("currentChatId", currentChatId);
                     }
+                    if (data.status_url) {
+                        pollIndexing(data.status_url, file.name, accessToken);
+                    }
                 } catch (err) {
                     addMessage("❌ Document upload failed.", "bot");
                 }
@@ -87,6 +91,54 @@ document.addEventListener("DOMContentLoaded", () => {
         });
     }
 
+    // ---------------- SERVER HISTORY ----------------
+    // The chat's stored messages replace the per-tab copy when the server has them
+    async function loadServerHistory() {
+        const chatId = sessionStorage.getItem("currentChatId");
+        const accessToken = localStorage.getItem("access");
+        if (!chatId || !accessToken) return;
+
+        try {
+            const response = await fetch(`/api/chat/${chatId}/messages/?limit=100`, {
+                headers: { "Authorization": `Bearer ${accessToken}` }
+            });
+            if (!response.ok) return;
+            const data = await response.json();
+            if (!data.messages.length) return;
+
+            chatHistory = data.messages.map(m => ({ sender: m.role === "user" ? "user" : "bot", text: m.content }));
+            saveHistory();
+            renderHistory();
+        } catch (err) {
+            console.warn("⚠️ Could not load chat history:", err);
+        }
+    }
+    loadServerHistory();
+
+    // ---------------- INGESTION STATUS ----------------
+    async function pollIndexing(statusUrl, fileName, accessToken) {
+        for (;;) {
+            await new Promise(resolve => setTimeout(resolve, 3000));
+            try {
+                const response = await fetch(statusUrl, {
+                    headers: accessToken ? { "Authorization": `Bearer ${accessToken}` } : undefined
+                });
+                if (!response.ok) return;
+                const job = await response.json();
+                if (job.status === "done") {
+                    addMessage(`✅ \"${fileName}\" is ready for questions.`, "bot");
+                    return;
+                }
+                if (job.status === "failed") {
+                    addMessage(`❌ Processing \"${fileName}\" failed.`, "bot");
+                    return;
+                }
+            } catch (err) {
+                return;
+            }
+        }
+    }
+
     // ---------------- FORM SUBMIT ----------------
     form.addEventListener("submit", async (e) => {
         e.preventDefault();
@@ -108,23 +160,18 @@ document.addEventListener("DOMContentLoaded", () => {
         const storedChatId = sessionStorage.getItem("currentChatId");
         if (storedChatId) chatIdToSend = storedChatId;
 
-        try {
-            const response = await fetch(GEMINI_URL, {  // ✅ Changed from OPENAI_URL to GEMINI_URL
-                method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                    "X-CSRFToken": getCSRFToken(),
-                },
-                body: JSON.stringify({ message: userText, chat_id: chatIdToSend }),
-            });
-
-            if (!response.ok) throw new Error("Server error");
-
-            const data = await response.json();
-            removeTyping();
+        const body = JSON.stringify({ message: userText, chat_id: chatIdToSend });
+        let botReply;
 
-            const botReply = data.reply || "No response from AI";
-            addMessage(botReply, "bot");
+        try {
+            try {
+                botReply = await streamReply(body);
+            } catch (streamError) {
+                // Nothing rendered yet: fall back to the one-shot endpoint
+                if (streamError.partial) throw streamError;
+                console.warn("⚠️ Streaming unavailable, falling back:", streamError);
+                botReply = await fetchReply(body);
+            }
 
             chatHistory.push({ sender: "bot", text: botReply });
             saveHistory();
@@ -141,6 +188,99 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    // ---------------- CHAT REQUESTS ----------------
+    // The JWT lets the server send this chat's history with the prompt
+    function chatHeaders() {
+        const accessToken = localStorage.getItem("access");
+        const headers = {
+            "Content-Type": "application/json",
+            "X-CSRFToken": getCSRFToken(),
+        };
+        if (accessToken) headers["Authorization"] = `Bearer ${accessToken}`;
+        return headers;
+    }
+
+    async function fetchReply(body) {
+        const response = await fetch(GEMINI_URL, {
+            method: "POST",
+            headers: chatHeaders(),
+            body: body,
+        });
+
+        if (!response.ok) throw new Error("Server error");
+
+        const data = await response.json();
+        removeTyping();
+
+        const botReply = data.reply || "No response from AI";
+        addMessage(botReply, "bot");
+        return botReply;
+    }
+
+    async function streamReply(body) {
+        const response = await fetch(GEMINI_STREAM_URL, {
+            method: "POST",
+            headers: chatHeaders(),
+            body: body,
+        });
+
+        if (!response.ok || !response.body) throw new Error("Server error");
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let msg = null;
+        let text = "";
+
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const event = parseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                if (!event) continue;
+
+                if (event.name === "sources") {
+                    console.log("📄 Sources:", event.data);
+                } else if (event.name === "token") {
+                    if (!msg) {
+                        // First token: swap the typing indicator for the reply
+                        removeTyping();
+                        msg = addMessage("", "bot");
+                    }
+                    text += event.data.text;
+                    msg.innerText = text;
+                    messages.scrollTop = messages.scrollHeight;
+                } else if (event.name === "done") {
+                    return event.data.reply || text;
+                } else if (event.name === "error") {
+                    const error = new Error(event.data.error || "Server error");
+                    error.partial = Boolean(msg);
+                    if (msg) msg.remove();
+                    throw error;
+                }
+            }
+        }
+
+        if (!msg) throw new Error("Stream ended early");
+        return text;
+    }
+
+    function parseEvent(raw) {
+        let name = "message";
+        const data = [];
+        raw.split("\n").forEach(line => {
+            if (line.startsWith("event:")) name = line.slice(6).trim();
+            else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+        });
+        if (!data.length) return null;
+        return { name: name, data: JSON.parse(data.join("\n")) };
+    }
+
     // ---------------- UI HELPERS ----------------
     function addMessage(text, sender) {
         const msg = document.createElement("div");
@@ -148,6 +288,7 @@ document.addEventListener("DOMContentLoaded", () => {
         msg.innerText = text;
         messages.appendChild(msg);
         messages.scrollTop = messages.scrollHeight;
+        return msg;
     }
 
     function addTyping() {